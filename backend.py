@@ -1,18 +1,58 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException
-from fastapi.responses import JSONResponse, FileResponse, HTMLResponse
+from fastapi import FastAPI, File, Form, UploadFile, HTTPException, BackgroundTasks, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import Response, JSONResponse, HTMLResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 from pydantic import BaseModel
 from dotenv import load_dotenv
-import google.generativeai as genai
-from gtts import gTTS
-import speech_recognition as sr
 import os
 import json
+import math
+import asyncio
+import functools
+import gzip
+import hashlib
+import io
 import tempfile
-import subprocess
+import time
+import uuid
+import random
+import re
+import importlib
+from html import escape as html_escape
+import queue
+import sqlite3
+import sys
+import threading
+from array import array
+from datetime import timedelta
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager, contextmanager, nullcontext
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-import firebase_admin
-from firebase_admin import credentials, firestore
+from enum import Enum
+
+# ==================== LAZY IMPORTS ====================
+class LazyModule:
+    """Imports the named module on first attribute access"""
+    def __init__(self, name: str):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+# The SDKs below take over a second to import together. They are loaded by the
+# warm-up task started from the app lifespan (or on first use), so the server
+# can bind its port and answer /ping straight away.
+genai = LazyModule("google.generativeai")
+google_exceptions = LazyModule("google.api_core.exceptions")
+gtts = LazyModule("gtts")
+sr = LazyModule("speech_recognition")
+firebase_admin = LazyModule("firebase_admin")
+credentials = LazyModule("firebase_admin.credentials")
+firestore_async = LazyModule("firebase_admin.firestore_async")
 
 # Load environment variables
 load_dotenv()
@@ -20,29 +60,924 @@ load_dotenv()
 # ==================== ENVIRONMENT VALIDATION ====================
 def validate_environment():
     """Validate required environment variables"""
-    required_vars = ["GEMINI_API_KEY", "FIREBASE_CREDENTIALS"]
+    required_vars = ["GEMINI_API_KEY"]
+    if STORAGE_BACKEND == "firestore":
+        required_vars.append("FIREBASE_CREDENTIALS")
     missing = [var for var in required_vars if not os.getenv(var)]
     if missing:
         raise ValueError(f"Missing required environment variables: {', '.join(missing)}")
 
-validate_environment()
-
 # ==================== INITIALIZE SERVICES ====================
-# Initialize Gemini client (NO HARDCODED KEY)
-genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+# Clients are created per worker process by the warm-up task (see APP LIFESPAN),
+# not at import time: gRPC channels and threads do not survive a fork, and
+# importing backend.py (scripts, benchmarks, gunicorn's master) should not
+# open connections.
+# GEMINI_API_ENDPOINT points the SDK at another server, e.g. a local fake for
+# benchmarks; the SDK's async methods only support gRPC, so such endpoints use
+# the REST transport and GeminiClient runs the calls on a worker thread.
+GEMINI_API_ENDPOINT = os.getenv("GEMINI_API_ENDPOINT")
+GEMINI_TRANSPORT = os.getenv("GEMINI_TRANSPORT", "rest" if GEMINI_API_ENDPOINT else "grpc")
+
+db = None
+recognizer = None
+
+def init_gemini():
+    """Configure the Gemini SDK (NO HARDCODED KEY)"""
+    genai.configure(
+        api_key=os.getenv("GEMINI_API_KEY"),
+        transport=GEMINI_TRANSPORT,
+        client_options={"api_endpoint": GEMINI_API_ENDPOINT} if GEMINI_API_ENDPOINT else None,
+    )
+
+def init_firestore():
+    """Initialize Firebase and the Firestore client"""
+    global db
+    if not firebase_admin._apps:
+        cred_dict = json.loads(os.getenv("FIREBASE_CREDENTIALS"))
+        firebase_admin.initialize_app(credentials.Certificate(cred_dict))
+    db = firestore_async.client()
+
+def init_speech():
+    """Create the speech recognizer used to read audio files"""
+    global recognizer
+    recognizer = sr.Recognizer()
+
+# ==================== ASYNC EXECUTION LAYER ====================
+# Libraries without an async API (gTTS, SpeechRecognition) run on a bounded
+# thread pool. Every external dependency also gets its own concurrency limit so
+# one slow upstream cannot starve the others.
+BLOCKING_POOL_SIZE = int(os.getenv("BLOCKING_POOL_SIZE", "32"))
+blocking_pool = ThreadPoolExecutor(max_workers=BLOCKING_POOL_SIZE, thread_name_prefix="healbot-blocking")
+
+# Local speech recognition is CPU-bound, so it gets its own pool sized to the machine
+STT_WORKERS = int(os.getenv("STT_WORKERS", str(os.cpu_count() or 2)))
+stt_pool = ThreadPoolExecutor(max_workers=STT_WORKERS, thread_name_prefix="healbot-stt")
+
+DEPENDENCY_LIMITS = {
+    "gemini": int(os.getenv("GEMINI_CONCURRENCY", "16")),
+    "firestore": int(os.getenv("FIRESTORE_CONCURRENCY", "64")),
+    "tts": int(os.getenv("TTS_CONCURRENCY", "8")),
+    "ffmpeg": int(os.getenv("FFMPEG_CONCURRENCY", str(os.cpu_count() or 2))),
+    "stt": int(os.getenv("STT_CONCURRENCY", str(STT_WORKERS))),
+    "disk": int(os.getenv("DISK_IO_CONCURRENCY", "8")),
+    "sqlite": int(os.getenv("SQLITE_POOL_SIZE", "8")),
+}
+dependency_semaphores = {name: asyncio.Semaphore(limit) for name, limit in DEPENDENCY_LIMITS.items()}
+dependency_pools = {"stt": stt_pool}
+
+async def run_blocking(dependency: str, func, *args, **kwargs):
+    """Run a blocking call on the dependency's thread pool under its concurrency limit"""
+    async with dependency_semaphores[dependency]:
+        return await run_blocking_unlimited(func, *args, _pool=dependency_pools.get(dependency), **kwargs)
+
+async def run_blocking_unlimited(func, *args, _pool=None, **kwargs):
+    """Run a blocking call on a thread pool; for callers that already hold the dependency's limit"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_pool or blocking_pool, functools.partial(func, *args, **kwargs))
+
+async def iterate_in_thread(make_iterable):
+    """Consume a blocking iterator on the thread pool, yielding its items on the event loop"""
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    done = object()
+
+    def pump():
+        try:
+            for item in make_iterable():
+                loop.call_soon_threadsafe(queue.put_nowait, item)
+            loop.call_soon_threadsafe(queue.put_nowait, done)
+        except BaseException as e:
+            loop.call_soon_threadsafe(queue.put_nowait, e)
+
+    loop.run_in_executor(blocking_pool, pump)
+    while True:
+        item = await queue.get()
+        if item is done:
+            return
+        if isinstance(item, BaseException):
+            raise item
+        yield item
+
+# ==================== METRICS ====================
+# Prometheus metrics for capacity planning, served on /metrics:
+# - latency of every HTTP handler, and of each stage of the hot paths (stage())
+# - Gemini prompt/response token counts and prompt sizes
+# - cache hits/misses and storage documents read/written (Firestore billing units)
+# - errors by the place they were handled (log_error())
+# With several gunicorn workers PROMETHEUS_MULTIPROC_DIR must be set (done by
+# gunicorn.conf.py) so /metrics aggregates every worker.
+# OTEL_TRACES=1 also records each stage as an OpenTelemetry span; this needs
+# opentelemetry-api plus a configured SDK/exporter (e.g. opentelemetry-instrument).
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest, multiprocess
+)
+
+PROMETHEUS_MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+OTEL_TRACES = os.getenv("OTEL_TRACES", "0") == "1"
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+REQUESTS = Counter("healbot_requests_total", "HTTP requests by handler and status", ["handler", "status"])
+REQUEST_SECONDS = Histogram(
+    "healbot_request_seconds", "HTTP request latency by handler (whole body for streams)",
+    ["handler"], buckets=LATENCY_BUCKETS
+)
+STAGE_SECONDS = Histogram("healbot_stage_seconds", "Latency of request stages", ["stage"], buckets=LATENCY_BUCKETS)
+GEMINI_CALLS = Counter("healbot_gemini_calls_total", "Gemini calls by purpose and outcome", ["purpose", "outcome"])
+GEMINI_TOKENS = Counter(
+    "healbot_gemini_tokens_total", "Gemini tokens by purpose and kind (prompt, response, cached)", ["purpose", "kind"]
+)
+GEMINI_PROMPT_BYTES = Histogram(
+    "healbot_gemini_prompt_bytes", "UTF-8 size of the per-call prompt (system instruction excluded)", ["purpose"],
+    buckets=(512, 1024, 2048, 4096, 8192, 16384, 32768, 65536, 131072)
+)
+CACHE_REQUESTS = Counter("healbot_cache_requests_total", "In-process cache lookups", ["cache", "result"])
+STORAGE_DOCUMENTS = Counter(
+    "healbot_storage_documents_total", "Storage documents/rows read, written or deleted", ["backend", "op"]
+)
+ERRORS = Counter("healbot_errors_total", "Errors by where they were handled", ["where"])
+
+tracer = None
+
+def init_tracing():
+    """Enable OpenTelemetry spans for stage() when OTEL_TRACES=1"""
+    global tracer
+    if not OTEL_TRACES:
+        return
+    try:
+        from opentelemetry import trace
+    except ImportError:
+        raise RuntimeError("OTEL_TRACES=1 requires the opentelemetry-api package")
+    tracer = trace.get_tracer("healbot")
+
+@contextmanager
+def stage(name: str):
+    """Time one stage of a request (and trace it as a span when tracing is on)"""
+    start = time.perf_counter()
+    span = tracer.start_as_current_span(name) if tracer else nullcontext()
+    try:
+        with span:
+            yield
+    finally:
+        STAGE_SECONDS.labels(name).observe(time.perf_counter() - start)
+
+async def timed(name: str, awaitable):
+    """Await inside a stage; for stages that run concurrently under asyncio.gather"""
+    with stage(name):
+        return await awaitable
+
+def log_error(where: str, error: Exception):
+    print(f"Error in {where}: {str(error)}")
+    ERRORS.labels(where).inc()
+
+class MetricsMiddleware:
+    """ASGI middleware: request count and latency per handler function"""
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        status = 500
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+        
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # The router stores the matched endpoint in the shared scope
+            endpoint = scope.get("endpoint")
+            handler = endpoint.__name__ if endpoint else "unmatched"
+            REQUESTS.labels(handler, str(status)).inc()
+            REQUEST_SECONDS.labels(handler).observe(time.perf_counter() - start)
+
+def metrics_registry():
+    if not PROMETHEUS_MULTIPROC_DIR:
+        return REGISTRY
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+# ==================== STORAGE ====================
+# Patient profiles and chat history live behind a small storage interface,
+# selected with STORAGE_BACKEND:
+# - firestore (default): Firebase Firestore
+# - sqlite: a local SQLite file (SQLITE_PATH), for single-node deployments and
+#   for running the service and its benchmarks without network access
+#
+# Chat history layout (both backends): per-user metadata holds counters and the
+# running summary; every message is its own record keyed by a sequence number,
+# so a turn appends two small records instead of rewriting the conversation.
+# Message records are {"seq", "role", "content", "created_at"}.
+#
+# Symptom reports are a capped log kept apart from the patient profile, so
+# recording one is a single small write and never rewrites the profile. The
+# log has SYMPTOM_LOG_SIZE slots indexed by the chat turn of the reporting
+# message: every report from the last SYMPTOM_LOG_SIZE turns is kept, older
+# ones until their slot is reused. Records are {"seq", "message", "keywords",
+# "reported_at"}.
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "firestore")
+SQLITE_PATH = os.getenv("SQLITE_PATH", "data/healbot.sqlite3")
+SQLITE_POOL_SIZE = DEPENDENCY_LIMITS["sqlite"]
+FIRESTORE_BATCH_LIMIT = 500
+SYMPTOM_LOG_SIZE = int(os.getenv("SYMPTOM_LOG_SIZE", "50"))
+
+def chat_message_record(seq: int, msg: dict) -> dict:
+    return {
+        "seq": seq,
+        "role": msg["role"],
+        "content": msg["content"],
+        "created_at": msg.get("created_at") or datetime.now().isoformat()
+    }
+
+def chat_message_from_record(record: dict) -> dict:
+    return {"role": record["role"], "content": record["content"]}
+
+def symptom_log_slot(seq: int) -> int:
+    # A turn is two messages; the patient's message has the even seq
+    return (seq // 2) % SYMPTOM_LOG_SIZE
+
+def symptom_event_record(seq: int, message: str, keywords: list) -> dict:
+    return {
+        "seq": seq,
+        "message": message,
+        "keywords": keywords,
+        "reported_at": datetime.now().isoformat()
+    }
+
+def count_documents(backend: str, op: str, n: int = 1):
+    STORAGE_DOCUMENTS.labels(backend, op).inc(n)
+
+class FirestoreStorage:
+    """
+    patients/{user_id} holds the profile; chat_history/{user_id} holds the chat
+    metadata and its `messages` subcollection one document per message;
+    symptom_log/{user_id} holds the symptom log as an `events` map of slots.
+    """
+    name = "firestore"
+
+    def init(self):
+        init_firestore()
+        self.db = db
+
+    def chat_history_ref(self, user_id: str):
+        return self.db.collection("chat_history").document(user_id)
+
+    @staticmethod
+    def chat_message_doc_id(seq: int) -> str:
+        return f"{seq:010d}"
+
+    async def load_patient(self, user_id: str):
+        async with dependency_semaphores["firestore"]:
+            doc = await self.db.collection("patients").document(user_id).get()
+        count_documents(self.name, "read")
+        return doc.to_dict() if doc.exists else None
+
+    async def save_patient(self, user_id: str, data: dict):
+        async with dependency_semaphores["firestore"]:
+            await self.db.collection("patients").document(user_id).set(data)
+        count_documents(self.name, "write")
+
+    async def find_patients_by_lab(self, token: str, limit: int) -> list:
+        """Patients whose abnormal_index contains token (Firestore indexes array fields automatically)"""
+        query = (
+            self.db.collection("patients")
+            .where(filter=firestore_async.FieldFilter("abnormal_index", "array_contains", token))
+            .select(["name"])
+            .limit(limit)
+        )
+        async with dependency_semaphores["firestore"]:
+            patients = [{"user_id": doc.id, "name": (doc.to_dict() or {}).get("name")} async for doc in query.stream()]
+        count_documents(self.name, "read", max(1, len(patients)))
+        return patients
+
+    async def iter_patients(self):
+        """Yield (user_id, data) for every patient document (maintenance scripts)"""
+        async for doc in self.db.collection("patients").stream():
+            count_documents(self.name, "read")
+            yield doc.id, doc.to_dict() or {}
+
+    async def append_symptom_event(self, user_id: str, event: dict):
+        """Write one slot of the log with a merge, without reading the document"""
+        async with dependency_semaphores["firestore"]:
+            await self.db.collection("symptom_log").document(user_id).set({
+                "events": {str(symptom_log_slot(event["seq"])): event},
+                "last_updated": event["reported_at"]
+            }, merge=True)
+        count_documents(self.name, "write")
+
+    async def load_symptom_events(self, user_id: str) -> list:
+        async with dependency_semaphores["firestore"]:
+            doc = await self.db.collection("symptom_log").document(user_id).get()
+        count_documents(self.name, "read")
+        events = (doc.to_dict() or {}).get("events", {}) if doc.exists else {}
+        return sorted(events.values(), key=lambda event: event["reported_at"])
+
+    async def migrate_legacy_chat_history(self, user_id: str, data: dict) -> dict:
+        """
+        Move a pre-subcollection `messages` array into per-message documents and
+        drop the array from the parent document. Returns the updated parent data.
+        """
+        ref = self.chat_history_ref(user_id)
+        messages = data.get("messages", [])
+        for start in range(0, len(messages), FIRESTORE_BATCH_LIMIT):
+            batch = self.db.batch()
+            for seq, msg in enumerate(messages[start:start + FIRESTORE_BATCH_LIMIT], start=start):
+                batch.set(ref.collection("messages").document(self.chat_message_doc_id(seq)), chat_message_record(seq, msg))
+            async with dependency_semaphores["firestore"]:
+                await batch.commit()
+            count_documents(self.name, "write", len(messages[start:start + FIRESTORE_BATCH_LIMIT]))
+        
+        async with dependency_semaphores["firestore"]:
+            await ref.set({
+                "messages": firestore_async.DELETE_FIELD,
+                "message_count": len(messages),
+                "last_updated": data.get("last_updated") or datetime.now().isoformat()
+            }, merge=True)
+        
+        count_documents(self.name, "write")
+        data = {k: v for k, v in data.items() if k != "messages"}
+        data["message_count"] = len(messages)
+        return data
+
+    async def load_chat_meta(self, user_id: str) -> dict:
+        """Load the parent chat_history document, migrating the legacy layout on first access"""
+        async with dependency_semaphores["firestore"]:
+            doc = await self.chat_history_ref(user_id).get()
+        count_documents(self.name, "read")
+        data = doc.to_dict() if doc.exists else {}
+        if "messages" in data:
+            data = await self.migrate_legacy_chat_history(user_id, data)
+        return data
+
+    async def load_chat_messages(self, user_id: str, start_seq: int = 0, limit: int = None) -> list:
+        query = self.chat_history_ref(user_id).collection("messages").order_by("seq").start_at({"seq": start_seq})
+        if limit:
+            query = query.limit(limit)
+        async with dependency_semaphores["firestore"]:
+            records = [doc.to_dict() async for doc in query.stream()]
+        # A query is billed at least one read even when it returns nothing
+        count_documents(self.name, "read", max(1, len(records)))
+        return records
+
+    async def append_chat_messages(self, user_id: str, messages: list) -> int:
+        """
+        Append messages after the last stored one; returns the seq of the first.
+        The counter is read and the message documents created in one transaction
+        (retried on contention), so concurrent turns get distinct seqs. create()
+        fails rather than overwrite a message, and the counter only moves when
+        the messages are written.
+        """
+        ref = self.chat_history_ref(user_id)
+        
+        @firestore_async.async_transactional
+        async def append(transaction):
+            snapshot = await ref.get(transaction=transaction)
+            start_seq = (snapshot.to_dict() or {}).get("message_count", 0) if snapshot.exists else 0
+            for seq, msg in enumerate(messages, start=start_seq):
+                transaction.create(ref.collection("messages").document(self.chat_message_doc_id(seq)), chat_message_record(seq, msg))
+            transaction.set(ref, {
+                "message_count": start_seq + len(messages),
+                "last_updated": datetime.now().isoformat()
+            }, merge=True)
+            return start_seq
+        
+        async with dependency_semaphores["firestore"]:
+            start_seq = await append(self.db.transaction())
+        count_documents(self.name, "read")
+        count_documents(self.name, "write", len(messages) + 1)
+        return start_seq
+
+    async def save_history_summary(self, user_id: str, summary: str, summarized_count: int):
+        async with dependency_semaphores["firestore"]:
+            await self.chat_history_ref(user_id).set({
+                "summary": summary,
+                "summarized_count": summarized_count,
+                "summary_updated": datetime.now().isoformat()
+            }, merge=True)
+        count_documents(self.name, "write")
+
+    async def delete_chat_history(self, user_id: str):
+        """Delete every message document in batches, then the parent document"""
+        ref = self.chat_history_ref(user_id)
+        messages = ref.collection("messages")
+        while True:
+            async with dependency_semaphores["firestore"]:
+                docs = [doc async for doc in messages.limit(FIRESTORE_BATCH_LIMIT).stream()]
+            count_documents(self.name, "read", max(1, len(docs)))
+            if not docs:
+                break
+            batch = self.db.batch()
+            for doc in docs:
+                batch.delete(doc.reference)
+            async with dependency_semaphores["firestore"]:
+                await batch.commit()
+            count_documents(self.name, "delete", len(docs))
+        
+        async with dependency_semaphores["firestore"]:
+            await ref.delete()
+        count_documents(self.name, "delete")
+
+class SQLiteStorage:
+    """
+    Local SQLite file in WAL mode, so reads never wait for the writer (also
+    across gunicorn workers sharing the file). A fixed pool of connections is
+    used from the thread pool; the "sqlite" concurrency limit equals the pool
+    size, so a connection is always free when a call gets to run.
+    """
+    name = "sqlite"
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS patients (
+            user_id TEXT PRIMARY KEY,
+            data TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS chat_meta (
+            user_id TEXT PRIMARY KEY,
+            message_count INTEGER NOT NULL DEFAULT 0,
+            last_updated TEXT,
+            summary TEXT,
+            summarized_count INTEGER,
+            summary_updated TEXT
+        );
+        CREATE TABLE IF NOT EXISTS chat_messages (
+            user_id TEXT NOT NULL,
+            seq INTEGER NOT NULL,
+            role TEXT NOT NULL,
+            content TEXT NOT NULL,
+            created_at TEXT NOT NULL,
+            PRIMARY KEY (user_id, seq)
+        ) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS symptom_events (
+            user_id TEXT NOT NULL,
+            slot INTEGER NOT NULL,
+            seq INTEGER NOT NULL,
+            message TEXT NOT NULL,
+            keywords TEXT NOT NULL,
+            reported_at TEXT NOT NULL,
+            PRIMARY KEY (user_id, slot)
+        ) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS lab_index (
+            user_id TEXT NOT NULL,
+            token TEXT NOT NULL,
+            PRIMARY KEY (user_id, token)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS lab_index_token ON lab_index (token, user_id);
+    """
+
+    def __init__(self, path: str, pool_size: int):
+        self.path = path
+        self.pool_size = pool_size
+        self.connections = queue.Queue()
+
+    def init(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        for _ in range(self.pool_size):
+            # Autocommit mode; multi-statement writes use explicit transactions
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.connections.put(conn)
+        self._execute(lambda conn: conn.executescript(self.SCHEMA))
+
+    def _execute(self, func, *args):
+        """Blocking: run func(conn, *args) on a pooled connection"""
+        conn = self.connections.get()
+        try:
+            return func(conn, *args)
+        finally:
+            self.connections.put(conn)
+
+    async def _run(self, func, *args):
+        return await run_blocking("sqlite", self._execute, func, *args)
+
+    def _count(self, op: str, n: int = 1):
+        count_documents(self.name, op, n)
+
+    @staticmethod
+    @contextmanager
+    def _transaction(conn):
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    async def load_patient(self, user_id: str):
+        def load(conn):
+            row = conn.execute("SELECT data FROM patients WHERE user_id = ?", (user_id,)).fetchone()
+            return json.loads(row["data"]) if row else None
+        data = await self._run(load)
+        self._count("read")
+        return data
+
+    async def save_patient(self, user_id: str, data: dict):
+        """Write the document and replace its rows in lab_index (the abnormal_index tokens)"""
+        tokens = data.get("abnormal_index", [])
+        def save(conn, payload):
+            with self._transaction(conn):
+                conn.execute(
+                    "INSERT INTO patients (user_id, data) VALUES (?, ?) "
+                    "ON CONFLICT(user_id) DO UPDATE SET data = excluded.data",
+                    (user_id, payload)
+                )
+                conn.execute("DELETE FROM lab_index WHERE user_id = ?", (user_id,))
+                conn.executemany(
+                    "INSERT INTO lab_index (user_id, token) VALUES (?, ?)",
+                    [(user_id, token) for token in tokens]
+                )
+        await self._run(save, json.dumps(data))
+        self._count("write", 1 + len(tokens))
+
+    async def find_patients_by_lab(self, token: str, limit: int) -> list:
+        def find(conn):
+            rows = conn.execute(
+                "SELECT l.user_id, json_extract(p.data, '$.name') AS name FROM lab_index l "
+                "JOIN patients p ON p.user_id = l.user_id WHERE l.token = ? ORDER BY l.user_id LIMIT ?",
+                (token, limit)
+            ).fetchall()
+            return [dict(row) for row in rows]
+        patients = await self._run(find)
+        self._count("read", len(patients))
+        return patients
+
+    async def iter_patients(self):
+        """Yield (user_id, data) for every patient document (maintenance scripts)"""
+        def load(conn):
+            return conn.execute("SELECT user_id, data FROM patients ORDER BY user_id").fetchall()
+        for row in await self._run(load):
+            self._count("read")
+            yield row["user_id"], json.loads(row["data"])
+
+    async def append_symptom_event(self, user_id: str, event: dict):
+        def append(conn):
+            conn.execute(
+                "INSERT OR REPLACE INTO symptom_events (user_id, slot, seq, message, keywords, reported_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (user_id, symptom_log_slot(event["seq"]), event["seq"], event["message"],
+                 json.dumps(event["keywords"]), event["reported_at"])
+            )
+        await self._run(append)
+        self._count("write")
+
+    async def load_symptom_events(self, user_id: str) -> list:
+        def load(conn):
+            rows = conn.execute(
+                "SELECT seq, message, keywords, reported_at FROM symptom_events "
+                "WHERE user_id = ? ORDER BY reported_at",
+                (user_id,)
+            ).fetchall()
+            return [dict(row, keywords=json.loads(row["keywords"])) for row in rows]
+        events = await self._run(load)
+        self._count("read", len(events))
+        return events
+
+    async def load_chat_meta(self, user_id: str) -> dict:
+        def load(conn):
+            row = conn.execute("SELECT * FROM chat_meta WHERE user_id = ?", (user_id,)).fetchone()
+            if row is None:
+                return {}
+            return {k: row[k] for k in row.keys() if k != "user_id" and row[k] is not None}
+        meta = await self._run(load)
+        self._count("read")
+        return meta
+
+    async def load_chat_messages(self, user_id: str, start_seq: int = 0, limit: int = None) -> list:
+        def load(conn):
+            rows = conn.execute(
+                "SELECT seq, role, content, created_at FROM chat_messages "
+                "WHERE user_id = ? AND seq >= ? ORDER BY seq LIMIT ?",
+                (user_id, start_seq, limit or -1)
+            ).fetchall()
+            return [dict(row) for row in rows]
+        records = await self._run(load)
+        self._count("read", len(records))
+        return records
+
+    async def append_chat_messages(self, user_id: str, messages: list) -> int:
+        """
+        Append messages after the last stored one; returns the seq of the first.
+        BEGIN IMMEDIATE takes the write lock before the counter is read, so
+        concurrent turns (also from other workers) get distinct seqs. A plain
+        INSERT fails rather than overwrite a message, rolling back the counter.
+        """
+        def append(conn):
+            with self._transaction(conn):
+                row = conn.execute("SELECT message_count FROM chat_meta WHERE user_id = ?", (user_id,)).fetchone()
+                start_seq = row["message_count"] if row else 0
+                conn.executemany(
+                    "INSERT INTO chat_messages (user_id, seq, role, content, created_at) "
+                    "VALUES (:user_id, :seq, :role, :content, :created_at)",
+                    [dict(chat_message_record(seq, msg), user_id=user_id) for seq, msg in enumerate(messages, start=start_seq)]
+                )
+                conn.execute(
+                    "INSERT INTO chat_meta (user_id, message_count, last_updated) VALUES (?, ?, ?) "
+                    "ON CONFLICT(user_id) DO UPDATE SET "
+                    "message_count = excluded.message_count, last_updated = excluded.last_updated",
+                    (user_id, start_seq + len(messages), datetime.now().isoformat())
+                )
+                return start_seq
+        start_seq = await self._run(append)
+        self._count("write", len(messages) + 1)
+        return start_seq
+
+    async def save_history_summary(self, user_id: str, summary: str, summarized_count: int):
+        def save(conn):
+            conn.execute(
+                "INSERT INTO chat_meta (user_id, summary, summarized_count, summary_updated) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(user_id) DO UPDATE SET summary = excluded.summary, "
+                "summarized_count = excluded.summarized_count, summary_updated = excluded.summary_updated",
+                (user_id, summary, summarized_count, datetime.now().isoformat())
+            )
+        await self._run(save)
+        self._count("write")
+
+    async def delete_chat_history(self, user_id: str):
+        def delete(conn):
+            with self._transaction(conn):
+                deleted = conn.execute("DELETE FROM chat_messages WHERE user_id = ?", (user_id,)).rowcount
+                conn.execute("DELETE FROM chat_meta WHERE user_id = ?", (user_id,))
+                return deleted
+        self._count("delete", await self._run(delete))
+
+STORAGE_BACKENDS = {
+    "firestore": FirestoreStorage,
+    "sqlite": lambda: SQLiteStorage(SQLITE_PATH, SQLITE_POOL_SIZE),
+}
+
+if STORAGE_BACKEND not in STORAGE_BACKENDS:
+    raise ValueError(f"Unknown STORAGE_BACKEND '{STORAGE_BACKEND}', expected one of: {', '.join(STORAGE_BACKENDS)}")
+storage = STORAGE_BACKENDS[STORAGE_BACKEND]()
+
+# ==================== IN-PROCESS CACHES ====================
+class LRUCache:
+    """
+    Small LRU cache with a per-entry TTL and hit/miss counters.
+    Values are shared between callers and must be treated as read-only.
+    on_evict(key, value) is called for entries dropped by size or expiry.
+    """
+    def __init__(self, name: str, maxsize: int, ttl: float, on_evict=None):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.on_evict = on_evict
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._hit_metric = CACHE_REQUESTS.labels(name, "hit")
+        self._miss_metric = CACHE_REQUESTS.labels(name, "miss")
+
+    def get(self, key, default=None):
+        entry = self._entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                del self._entries[key]
+                if self.on_evict:
+                    self.on_evict(key, entry[1])
+            self.misses += 1
+            self._miss_metric.inc()
+            return default
+        self._entries.move_to_end(key)
+        self.hits += 1
+        self._hit_metric.inc()
+        return entry[1]
+
+    def set(self, key, value):
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            evicted_key, (_, evicted) = self._entries.popitem(last=False)
+            self.evictions += 1
+            if self.on_evict:
+                self.on_evict(evicted_key, evicted)
+
+    def invalidate(self, predicate):
+        """Drop every entry whose key matches predicate(key)"""
+        for key in [k for k in self._entries if predicate(k)]:
+            del self._entries[key]
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+# Patient documents by user_id, and rendered summaries (Markdown and HTML) by
+# (user_id, last_updated). Writes through this process invalidate
+# both; the TTL bounds staleness for writes made by other workers.
+PATIENT_CACHE_SIZE = int(os.getenv("PATIENT_CACHE_SIZE", "1024"))
+PATIENT_CACHE_TTL = float(os.getenv("PATIENT_CACHE_TTL", "300"))
+patient_cache = LRUCache("patient", PATIENT_CACHE_SIZE, PATIENT_CACHE_TTL)
+patient_summary_cache = LRUCache("patient_summary", PATIENT_CACHE_SIZE, PATIENT_CACHE_TTL)
+
+# Cached marker for "no patient document", so unknown users don't hit storage every turn
+_NO_PATIENT = object()
 
-# Initialize Firebase
-firebase_creds = os.getenv("FIREBASE_CREDENTIALS")
-cred_dict = json.loads(firebase_creds)
+# ==================== SCRATCH SPACE ====================
+class ScratchSpace:
+    """
+    Managed directory for the few temp files that cannot be avoided (e.g.
+    MP4/M4A uploads, which ffmpeg cannot demux from a pipe). Callers release
+    files when done; a periodic sweeper removes anything older than max_age
+    and enforces a disk quota, so crashes and bugs cannot fill /tmp.
+    """
+    def __init__(self, directory: str, quota_bytes: int, max_age: float):
+        self.directory = directory
+        self.quota_bytes = quota_bytes
+        self.max_age = max_age
+        self.allocated = 0
+        self.released = 0
+        self.swept = 0
+        self.rejected = 0
+        self.usage_bytes = 0
+        self.usage_files = 0
+
+    def _scan(self) -> list:
+        os.makedirs(self.directory, exist_ok=True)
+        files = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file():
+                st = entry.stat()
+                files.append((st.st_mtime, st.st_size, entry.path))
+        self.usage_files = len(files)
+        self.usage_bytes = sum(size for _, size, _ in files)
+        return files
+
+    def write(self, data: bytes, suffix: str = "") -> str:
+        """Store data in a new scratch file and return its path; blocking"""
+        self._scan()
+        if self.usage_bytes + len(data) > self.quota_bytes:
+            self.sweep()
+            if self.usage_bytes + len(data) > self.quota_bytes:
+                self.rejected += 1
+                raise OSError(f"Scratch space quota of {self.quota_bytes} bytes exceeded")
+        path = os.path.join(self.directory, f"{uuid.uuid4().hex}{suffix}")
+        with open(path, "wb") as f:
+            f.write(data)
+        self.allocated += 1
+        self.usage_files += 1
+        self.usage_bytes += len(data)
+        return path
+
+    def release(self, path: str):
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+        except FileNotFoundError:
+            return
+        self.released += 1
+        self.usage_files -= 1
+        self.usage_bytes -= size
+
+    def sweep(self):
+        """Remove expired files, then the oldest ones until usage is under quota; blocking"""
+        now = time.time()
+        files = sorted(self._scan())
+        for mtime, size, path in files:
+            if now - mtime < self.max_age and self.usage_bytes <= self.quota_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                continue
+            self.swept += 1
+            self.usage_files -= 1
+            self.usage_bytes -= size
+
+    async def run_sweeper(self, interval: float):
+        while True:
+            try:
+                await run_blocking("disk", self.sweep)
+            except Exception as e:
+                log_error("scratch sweep", e)
+            await asyncio.sleep(interval)
+
+    def stats(self) -> dict:
+        return {
+            "usage_bytes": self.usage_bytes,
+            "usage_files": self.usage_files,
+            "quota_bytes": self.quota_bytes,
+            "allocated": self.allocated,
+            "released": self.released,
+            "swept": self.swept,
+            "rejected": self.rejected,
+        }
 
-if not firebase_admin._apps:
-    cred = credentials.Certificate(cred_dict)
-    firebase_admin.initialize_app(cred)
+SCRATCH_DIR = os.getenv("SCRATCH_DIR", os.path.join(tempfile.gettempdir(), "healbot_scratch"))
+SCRATCH_SWEEP_INTERVAL = float(os.getenv("SCRATCH_SWEEP_INTERVAL", "60"))
+scratch_space = ScratchSpace(
+    SCRATCH_DIR,
+    quota_bytes=int(os.getenv("SCRATCH_QUOTA_MB", "256")) * 1024 * 1024,
+    max_age=float(os.getenv("SCRATCH_MAX_AGE", "600")),
+)
 
-db = firestore.client()
+# ==================== APP LIFESPAN ====================
+class Readiness:
+    """Initialization state of each dependency, filled in by the warm-up task"""
+    def __init__(self):
+        self.dependencies = {}
+        self.done = asyncio.Event()
+
+    async def initialize(self, name: str, init, pool=None):
+        self.dependencies[name] = {"state": "initializing", "seconds": None, "error": None}
+        start = time.monotonic()
+        try:
+            await run_blocking_unlimited(init, _pool=pool)
+            self.dependencies[name]["state"] = "ready"
+        except Exception as e:
+            print(f"❌ Failed to initialize {name}: {str(e)}")
+            self.dependencies[name].update(state="failed", error=str(e))
+        self.dependencies[name]["seconds"] = round(time.monotonic() - start, 3)
+
+    @property
+    def ready(self) -> bool:
+        return self.done.is_set() and all(d["state"] == "ready" for d in self.dependencies.values())
+
+readiness = Readiness()
+
+def init_gemini_models():
+    init_gemini()
+    init_model_registry()
+
+async def warm_up():
+    """Import the SDKs and create this worker's clients and models, in parallel"""
+    try:
+        await asyncio.gather(
+            readiness.initialize("gemini", init_gemini_models),
+            readiness.initialize("storage", storage.init),
+            readiness.initialize("speech", init_speech),
+            readiness.initialize("stt_model", stt_backend.load, stt_pool),
+            readiness.initialize("tts", lambda: gtts.gTTS),
+            readiness.initialize("symptoms", init_symptom_extractors),
+        )
+    finally:
+        readiness.done.set()
+
+# Paths that never touch a dependency and are served during warm-up
+WARMUP_EXEMPT_PATHS = {"/", "/ping", "/ready", "/metrics", "/docs", "/openapi.json"}
+
+class WarmupGate:
+    """ASGI middleware: requests that need dependencies wait until warm-up has finished"""
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] in ("http", "websocket") and scope["path"] not in WARMUP_EXEMPT_PATHS:
+            await readiness.done.wait()
+        await self.app(scope, receive, send)
+
+# JSON responses are gzipped (e.g. /patient-summary returns the summary plus
+# raw_data). Streams and audio are not: gzip buffers SSE chunks until it has a
+# block to emit, and audio is already compressed. "/" serves precompressed files.
+GZIP_MIN_SIZE = int(os.getenv("GZIP_MIN_SIZE", "1024"))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+GZIP_EXCLUDED_PREFIXES = ("/chat/stream", "/tts", "/stt", "/ws/")
+
+class SelectiveGZip:
+    """ASGI middleware: GZipMiddleware except for streaming and audio paths"""
+    def __init__(self, app):
+        self.app = app
+        self.gzip = GZipMiddleware(app, minimum_size=GZIP_MIN_SIZE, compresslevel=GZIP_LEVEL)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"] != "/" and not scope["path"].startswith(GZIP_EXCLUDED_PREFIXES):
+            await self.gzip(scope, receive, send)
+        else:
+            await self.app(scope, receive, send)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Runs once in every worker process. Clients are created by a background
+    # warm-up task so the port is bound immediately.
+    validate_environment()
+    init_tracing()
+    warmup = asyncio.create_task(warm_up())
+    sweeper = asyncio.create_task(scratch_space.run_sweeper(SCRATCH_SWEEP_INTERVAL))
+    try:
+        yield
+    finally:
+        warmup.cancel()
+        sweeper.cancel()
+        blocking_pool.shutdown(wait=False, cancel_futures=True)
+        stt_pool.shutdown(wait=False, cancel_futures=True)
 
 # Initialize FastAPI
-app = FastAPI(title="Dr. HealBot - Medical Consultation API")
+app = FastAPI(title="Dr. HealBot - Medical Consultation API", lifespan=lifespan)
 
 # CORS
 app.add_middleware(
@@ -52,11 +987,16 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(SelectiveGZip)
+app.add_middleware(WarmupGate)
+# Outermost, so time spent waiting on warm-up or admission is included
+app.add_middleware(MetricsMiddleware)
 
 # ==================== MODELS ====================
 class ChatRequest(BaseModel):
     message: str
     user_id: str
+    # Language code of the message ("en", "es-ES", ...) or "auto"; picks the symptom vocabulary
     language: str = "auto"
 
 class PatientData(BaseModel):
@@ -67,6 +1007,7 @@ class PatientData(BaseModel):
 class TTSRequest(BaseModel):
     text: str
     language_code: str = "en"
+    format: str = None  # "mp3", "opus" or "wav"; defaults to TTS_OUTPUT_FORMAT
 
 # ==================== SYSTEM PROMPT ====================
 DOCTOR_SYSTEM_PROMPT = """
@@ -76,8 +1017,7 @@ GOAL:
 Hold a natural, focused conversation with the patient to understand their health issue through a series of questions (ONE AT A TIME) before providing comprehensive guidance.
 
 PATIENT HISTORY (IMPORTANT):
-The following medical profile belongs to the current patient:
-{patient_summary}
+The current patient's medical profile is given under PATIENT MEDICAL DATA at the end of these instructions.
 
 RULES FOR PATIENT HISTORY:
 - ALWAYS use patient history in your reasoning (chronic diseases, medications, allergies, surgeries, recent labs, lifestyle).
@@ -183,296 +1123,1661 @@ IMPORTANT:
 - response has No Emoji or  No emojis No smileys No flags No pictographs
 """
 
-# ==================== HELPER FUNCTIONS ====================
-def generate_patient_summary(patient_data: dict) -> str:
-    """Generate a comprehensive summary of patient's medical profile and lab results"""
-    if not patient_data:
-        return ""
+CHAT_INSTRUCTIONS = """
+Instructions:
+1. **Conversational Stage**:
+   - Start by acknowledging the patient's symptoms warmly.
+   - Ask **only one question at a time** to clarify their condition.
+   - Wait for the patient's answer before asking the next question.
+   - Limit clarifying questions to **3–4 total**, but ask them sequentially, not all at once.
+   - Example:
+       - "I'm sorry you're feeling unwell. How long have you had this fever?"
+       - Wait for response, then: "Are you experiencing any chills or body aches?"
+       - And so on.
+2. **Structured Guidance Stage**:
+   - Only after 3–4 clarifying questions, provide the structured advice in the FINAL RESPONSE FORMAT.
+
+- Always factor in patient history (conditions, medications, allergies, labs).
+- Keep tone warm, empathetic, professional.
+- Never give definitive diagnoses; always use soft language.
+"""
+
+PATIENT_CONTEXT_TEMPLATE = """
+PATIENT MEDICAL DATA:
+You MUST always consider the following patient medical data when responding:
+
+{patient_summary}
+"""
+
+# ==================== MODEL REGISTRY ====================
+# GenerativeModel objects are created once and reused. The static doctor
+# prompt is sent as the model's system_instruction; per-patient chat models
+# append the patient summary and are cached by its hash. The system
+# instruction of a per-patient model is stored server-side with Gemini
+# context caching, so turns only send the history and the new message and
+# the summary is uploaded again only when it changes. Instructions below the
+# model's minimum cacheable size, or any caching failure, fall back to
+# sending the instruction inline with every call; GEMINI_CONTEXT_CACHE=0
+# always sends it inline.
+GEMINI_CHAT_MODEL = os.getenv("GEMINI_CHAT_MODEL", "gemini-2.5-flash")
+GEMINI_SUMMARY_MODEL = os.getenv("GEMINI_SUMMARY_MODEL", GEMINI_CHAT_MODEL)
+GEMINI_CONTEXT_CACHE = os.getenv("GEMINI_CONTEXT_CACHE", "1") == "1"
+GEMINI_CONTEXT_CACHE_TTL = int(os.getenv("GEMINI_CONTEXT_CACHE_TTL", "3600"))
+# Smallest context Gemini caches (1024 tokens for 2.5 Flash, 2048 for 2.5 Pro)
+GEMINI_CONTEXT_CACHE_MIN_TOKENS = int(os.getenv("GEMINI_CONTEXT_CACHE_MIN_TOKENS", "1024"))
+
+CHAT_SYSTEM_INSTRUCTION = DOCTOR_SYSTEM_PROMPT + CHAT_INSTRUCTIONS
+
+MODEL_CONFIGS = {
+    "chat": {
+        "model_name": GEMINI_CHAT_MODEL,
+        "system_instruction": CHAT_SYSTEM_INSTRUCTION,
+        "generation_config": {
+            "temperature": 0.7,
+            "max_output_tokens": 1024,
+        },
+    },
+    "summary": {
+        "model_name": GEMINI_SUMMARY_MODEL,
+        "system_instruction": None,
+        "generation_config": {
+            "temperature": 0.2,
+            "max_output_tokens": 512,
+        },
+    },
+}
+
+model_registry = {}
+
+def delete_cached_chat_model(name: str):
+    """Blocking: delete the server-side cached content of an evicted chat model"""
+    from google.generativeai import caching
+    try:
+        caching.CachedContent.get(name).delete()
+    except Exception as e:
+        # Already gone; anything left expires with GEMINI_CONTEXT_CACHE_TTL
+        print(f"Could not delete Gemini cached content {name}: {str(e)}")
+
+def evict_chat_model(digest: str, model):
+    if model.cached_content:
+        blocking_pool.submit(delete_cached_chat_model, model.cached_content)
+
+# Per-patient chat models keyed by sha256 of the patient summary. The TTL is
+# kept below the context cache TTL so a model never outlives its cached content;
+# evicted models delete theirs instead of leaving it stored until it expires.
+chat_model_cache = LRUCache(
+    "chat_model",
+    int(os.getenv("CHAT_MODEL_CACHE_SIZE", "256")),
+    max(GEMINI_CONTEXT_CACHE_TTL - 60, 60),
+    on_evict=evict_chat_model,
+)
+
+def init_model_registry():
+    for name, config in MODEL_CONFIGS.items():
+        if name not in model_registry:
+            model_registry[name] = genai.GenerativeModel(**config)
+
+def get_model(name: str):
+    if name not in model_registry:
+        init_model_registry()
+    return model_registry[name]
+
+def create_cached_chat_model(system_instruction: str, digest: str):
+    """Blocking: store the system instruction with Gemini context caching"""
+    from google.generativeai import caching
+    config = MODEL_CONFIGS["chat"]
+    cached = caching.CachedContent.create(
+        model=f"models/{config['model_name']}",
+        display_name=f"healbot-{digest[:16]}",
+        system_instruction=system_instruction,
+        ttl=timedelta(seconds=GEMINI_CONTEXT_CACHE_TTL),
+    )
+    return genai.GenerativeModel.from_cached_content(cached, generation_config=config["generation_config"])
+
+async def get_chat_model(patient_summary: str):
+    """Chat model whose system instruction carries this patient summary"""
+    digest = hashlib.sha256(patient_summary.encode("utf-8")).hexdigest()
+    model = chat_model_cache.get(digest)
+    if model is not None:
+        return model
+    
+    system_instruction = CHAT_SYSTEM_INSTRUCTION + PATIENT_CONTEXT_TEMPLATE.format(patient_summary=patient_summary)
+    if GEMINI_CONTEXT_CACHE and estimate_tokens(system_instruction) >= GEMINI_CONTEXT_CACHE_MIN_TOKENS:
+        try:
+            model = await run_blocking("gemini", create_cached_chat_model, system_instruction, digest)
+        except Exception as e:
+            # e.g. below the minimum cacheable size or unsupported model
+            print(f"Gemini context caching unavailable, sending system instruction inline: {str(e)}")
+    if model is None:
+        config = MODEL_CONFIGS["chat"]
+        model = genai.GenerativeModel(
+            config["model_name"],
+            system_instruction=system_instruction,
+            generation_config=config["generation_config"],
+        )
+    chat_model_cache.set(digest, model)
+    return model
+
+# ==================== RESILIENT GEMINI CLIENT ====================
+# Every Gemini call goes through GeminiClient:
+# - per-attempt deadline (GEMINI_TIMEOUT)
+# - jittered exponential backoff retries for transient upstream errors
+# - optional hedging: a duplicate request is sent if the first one is slower
+#   than the recent p95 latency, and whichever finishes first wins
+# - a circuit breaker that fails fast after repeated failures, so callers can
+#   answer with FALLBACK_REPLY instead of waiting on a broken upstream
+GEMINI_TIMEOUT = float(os.getenv("GEMINI_TIMEOUT", "30"))
+GEMINI_MAX_RETRIES = int(os.getenv("GEMINI_MAX_RETRIES", "2"))
+GEMINI_RETRY_BASE_DELAY = float(os.getenv("GEMINI_RETRY_BASE_DELAY", "0.5"))
+GEMINI_HEDGE = os.getenv("GEMINI_HEDGE", "0") == "1"
+GEMINI_HEDGE_MIN_SAMPLES = int(os.getenv("GEMINI_HEDGE_MIN_SAMPLES", "20"))
+GEMINI_BREAKER_THRESHOLD = int(os.getenv("GEMINI_BREAKER_THRESHOLD", "5"))
+GEMINI_BREAKER_COOLDOWN = float(os.getenv("GEMINI_BREAKER_COOLDOWN", "30"))
+# The SDK's built-in retry (up to minutes on 503) is disabled; GeminiClient owns the retry policy
+GEMINI_REQUEST_OPTIONS = {"timeout": GEMINI_TIMEOUT, "retry": None}
+
+@functools.lru_cache(maxsize=None)
+def retryable_gemini_errors() -> tuple:
+    """Transient upstream errors (a function so google.api_core loads lazily)"""
+    return (
+        asyncio.TimeoutError,
+        google_exceptions.TooManyRequests,
+        google_exceptions.InternalServerError,
+        google_exceptions.BadGateway,
+        google_exceptions.ServiceUnavailable,
+        google_exceptions.GatewayTimeout,
+        google_exceptions.DeadlineExceeded,
+    )
+
+FALLBACK_REPLY = (
+    "I'm sorry, I'm having trouble reaching my medical knowledge service right now. "
+    "Please try again in a moment. If your symptoms are severe or getting worse, "
+    "please contact a doctor or emergency services."
+)
+
+class CircuitOpenError(Exception):
+    """Raised without calling upstream while the circuit breaker is open"""
+
+class CircuitBreaker:
+    """Opens after `threshold` consecutive failures; lets one trial call through after `cooldown`"""
+    def __init__(self, threshold: int, cooldown: float):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_progress = False
+        self.times_opened = 0
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.cooldown:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self.trial_in_progress:
+            self.trial_in_progress = True
+            return True
+        return False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_progress = False
+
+    def record_failure(self):
+        self.failures += 1
+        self.trial_in_progress = False
+        if self.state == "half_open" or self.failures >= self.threshold:
+            if self.opened_at is None or self.state == "half_open":
+                self.times_opened += 1
+            self.opened_at = time.monotonic()
+
+class LatencyTracker:
+    """Rolling window of recent call latencies"""
+    def __init__(self, window: int = 200):
+        self.samples = deque(maxlen=window)
+
+    def record(self, seconds: float):
+        self.samples.append(seconds)
+
+    def percentile(self, pct: float):
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(pct / 100 * len(ordered)))]
+
+class GeminiClient:
+    def __init__(self):
+        self.breaker = CircuitBreaker(GEMINI_BREAKER_THRESHOLD, GEMINI_BREAKER_COOLDOWN)
+        self.latency = LatencyTracker()
+        self.calls = 0
+        self.retries = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.failures = 0
+        self.short_circuited = 0
+
+    async def _call_once(self, model, prompt):
+        async with dependency_semaphores["gemini"]:
+            start = time.monotonic()
+            if GEMINI_TRANSPORT == "rest":
+                call = run_blocking_unlimited(
+                    model.generate_content, prompt, request_options=GEMINI_REQUEST_OPTIONS
+                )
+            else:
+                call = model.generate_content_async(prompt, request_options=GEMINI_REQUEST_OPTIONS)
+            response = await asyncio.wait_for(call, GEMINI_TIMEOUT)
+            self.latency.record(time.monotonic() - start)
+            return response
+
+    async def _call_hedged(self, model, prompt):
+        hedge_after = self.latency.percentile(95) if len(self.latency.samples) >= GEMINI_HEDGE_MIN_SAMPLES else None
+        if not GEMINI_HEDGE or hedge_after is None:
+            return await self._call_once(model, prompt)
+
+        primary = asyncio.ensure_future(self._call_once(model, prompt))
+        tasks = [primary]
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=hedge_after)
+            if done:
+                return primary.result()
+
+            self.hedges += 1
+            hedge = asyncio.ensure_future(self._call_once(model, prompt))
+            tasks.append(hedge)
+            pending = {primary, hedge}
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            self.hedge_wins += 1
+                        return task.result()
+            # Both attempts failed: surface the primary's error
+            return primary.result()
+        finally:
+            # Also runs when the caller is cancelled: no attempt outlives it
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    async def _backoff(self, attempt: int):
+        self.retries += 1
+        # Full jitter: uniform in [0, base * 2^attempt]
+        await asyncio.sleep(random.uniform(0, GEMINI_RETRY_BASE_DELAY * (2 ** attempt)))
+
+    def _admit(self, prompt: str, purpose: str):
+        if not self.breaker.allow():
+            self.short_circuited += 1
+            GEMINI_CALLS.labels(purpose, "short_circuited").inc()
+            raise CircuitOpenError("Gemini circuit breaker is open")
+        self.calls += 1
+        GEMINI_PROMPT_BYTES.labels(purpose).observe(len(prompt.encode("utf-8")))
+
+    @staticmethod
+    def _record_usage(purpose: str, usage):
+        if usage is None:
+            return
+        GEMINI_TOKENS.labels(purpose, "prompt").inc(usage.prompt_token_count or 0)
+        GEMINI_TOKENS.labels(purpose, "response").inc(usage.candidates_token_count or 0)
+        GEMINI_TOKENS.labels(purpose, "cached").inc(getattr(usage, "cached_content_token_count", 0) or 0)
+
+    async def generate(self, model, prompt: str, purpose: str = "chat"):
+        """generate_content with deadline, retries, hedging and circuit breaking"""
+        self._admit(prompt, purpose)
+        trial = self.breaker.trial_in_progress
+
+        try:
+            for attempt in range(GEMINI_MAX_RETRIES + 1):
+                try:
+                    response = await self._call_hedged(model, prompt)
+                    self.breaker.record_success()
+                    GEMINI_CALLS.labels(purpose, "ok").inc()
+                    self._record_usage(purpose, getattr(response, "usage_metadata", None))
+                    return response
+                except retryable_gemini_errors() as e:
+                    if attempt == GEMINI_MAX_RETRIES:
+                        self.failures += 1
+                        self.breaker.record_failure()
+                        GEMINI_CALLS.labels(purpose, "failed").inc()
+                        raise
+                    print(f"Gemini call failed ({type(e).__name__}), retrying")
+                    GEMINI_CALLS.labels(purpose, "retried").inc()
+                    await self._backoff(attempt)
+                except Exception:
+                    # Not an availability problem (bad request, safety block...)
+                    GEMINI_CALLS.labels(purpose, "error").inc()
+                    raise
+        finally:
+            # Also frees a half-open trial that was cancelled mid-call
+            if trial:
+                self.breaker.trial_in_progress = False
+
+    async def stream(self, model, prompt: str, purpose: str = "chat"):
+        """
+        Streaming generate_content. Deadlines apply to the first chunk and to
+        each gap between chunks; retries only happen before the first chunk,
+        since text already forwarded to the client cannot be taken back.
+        """
+        self._admit(prompt, purpose)
+        trial = self.breaker.trial_in_progress
+
+        async with dependency_semaphores["gemini"]:
+            try:
+                for attempt in range(GEMINI_MAX_RETRIES + 1):
+                    try:
+                        start = time.monotonic()
+                        if GEMINI_TRANSPORT == "rest":
+                            chunks = iterate_in_thread(
+                                lambda: model.generate_content(
+                                    prompt, stream=True, request_options=GEMINI_REQUEST_OPTIONS
+                                )
+                            )
+                        else:
+                            response = await asyncio.wait_for(
+                                model.generate_content_async(
+                                    prompt, stream=True, request_options=GEMINI_REQUEST_OPTIONS
+                                ),
+                                GEMINI_TIMEOUT
+                            )
+                            chunks = response.__aiter__()
+                        first = await asyncio.wait_for(chunks.__anext__(), GEMINI_TIMEOUT)
+                        self.latency.record(time.monotonic() - start)
+                        break
+                    except StopAsyncIteration:
+                        self.breaker.record_success()
+                        GEMINI_CALLS.labels(purpose, "ok").inc()
+                        return
+                    except retryable_gemini_errors() as e:
+                        if attempt == GEMINI_MAX_RETRIES:
+                            self.failures += 1
+                            self.breaker.record_failure()
+                            GEMINI_CALLS.labels(purpose, "failed").inc()
+                            raise
+                        print(f"Gemini stream failed to start ({type(e).__name__}), retrying")
+                        GEMINI_CALLS.labels(purpose, "retried").inc()
+                        await self._backoff(attempt)
+                    except Exception:
+                        GEMINI_CALLS.labels(purpose, "error").inc()
+                        raise
+            finally:
+                # Also frees a half-open trial whose client disconnected
+                # before the first chunk
+                if trial:
+                    self.breaker.trial_in_progress = False
+
+            self.breaker.record_success()
+            GEMINI_CALLS.labels(purpose, "ok").inc()
+            last = first
+            yield first
+            while True:
+                try:
+                    chunk = await asyncio.wait_for(chunks.__anext__(), GEMINI_TIMEOUT)
+                except StopAsyncIteration:
+                    # Usage in the final chunk covers the whole response
+                    self._record_usage(purpose, getattr(last, "usage_metadata", None))
+                    return
+                last = chunk
+                yield chunk
+
+    def stats(self) -> dict:
+        p50 = self.latency.percentile(50)
+        p95 = self.latency.percentile(95)
+        return {
+            "breaker_state": self.breaker.state,
+            "breaker_opened": self.breaker.times_opened,
+            "calls": self.calls,
+            "retries": self.retries,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "failures": self.failures,
+            "short_circuited": self.short_circuited,
+            "latency_p50": round(p50, 4) if p50 is not None else None,
+            "latency_p95": round(p95, 4) if p95 is not None else None,
+        }
+
+def is_gemini_unavailable(error: Exception) -> bool:
+    """Errors for which callers should degrade to FALLBACK_REPLY"""
+    return isinstance(error, (CircuitOpenError,) + retryable_gemini_errors())
+
+gemini_client = GeminiClient()
+
+# ==================== ADMISSION CONTROL ====================
+# Chat turns are admitted before any history is read:
+# - turns for one user_id run one at a time, in arrival order, so concurrent
+#   requests can't interleave their reads and writes of the same conversation;
+#   at most CHAT_USER_QUEUE_DEPTH turns may wait behind the running one
+# - at most CHAT_MAX_INFLIGHT turns (i.e. Gemini calls) run at once
+# Anything beyond that is rejected immediately with 429 and Retry-After rather
+# than queued behind an overloaded upstream.
+# ADMISSION_BACKEND=redis shares these limits, arrival order included, between
+# worker processes through any Redis-compatible server at REDIS_URL (Redis,
+# Valkey, or benchmarks/fake_redis.py for development).
+ADMISSION_BACKEND = os.getenv("ADMISSION_BACKEND", "memory")
+CHAT_MAX_INFLIGHT = int(os.getenv("CHAT_MAX_INFLIGHT", str(DEPENDENCY_LIMITS["gemini"] * 2)))
+CHAT_USER_QUEUE_DEPTH = int(os.getenv("CHAT_USER_QUEUE_DEPTH", "2"))
+CHAT_USER_WAIT = float(os.getenv("CHAT_USER_WAIT", "60"))
+# Redis locks expire after this long so a crashed worker can't hold them forever
+ADMISSION_LEASE = float(os.getenv("ADMISSION_LEASE", "120"))
+
+class AdmissionRejected(Exception):
+    """The request can't be admitted now; retry after `retry_after` seconds"""
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.retry_after = retry_after
+
+def admission_retry_after() -> int:
+    """Suggested Retry-After: about one typical Gemini call"""
+    p50 = gemini_client.latency.percentile(50)
+    return max(1, math.ceil(p50)) if p50 is not None else 1
+
+class InProcessAdmission:
+    """Admission state for a single worker process"""
+    def __init__(self, max_inflight: int, user_queue_depth: int, user_wait: float):
+        self.max_inflight = max_inflight
+        self.user_queue_depth = user_queue_depth
+        self.user_wait = user_wait
+        self.inflight = 0
+        self.user_locks = {}    # user_id -> asyncio.Lock (FIFO)
+        self.user_waiting = {}  # user_id -> turns waiting or running
+        self.rejected = 0
+
+    async def acquire_user(self, user_id: str):
+        if self.user_waiting.get(user_id, 0) > self.user_queue_depth:
+            self.rejected += 1
+            raise AdmissionRejected("Too many pending messages for this conversation", admission_retry_after())
+        lock = self.user_locks.setdefault(user_id, asyncio.Lock())
+        self.user_waiting[user_id] = self.user_waiting.get(user_id, 0) + 1
+        try:
+            await asyncio.wait_for(lock.acquire(), self.user_wait)
+        except asyncio.TimeoutError:
+            self._leave(user_id)
+            self.rejected += 1
+            raise AdmissionRejected("Previous message for this conversation is still being answered", admission_retry_after())
+        except BaseException:
+            self._leave(user_id)
+            raise
+        return lock
+
+    def _leave(self, user_id: str):
+        self.user_waiting[user_id] -= 1
+        if not self.user_waiting[user_id]:
+            del self.user_waiting[user_id]
+            del self.user_locks[user_id]
+
+    async def release_user(self, user_id: str, token):
+        token.release()
+        self._leave(user_id)
+
+    async def acquire_slot(self):
+        if self.inflight >= self.max_inflight:
+            self.rejected += 1
+            raise AdmissionRejected("Server is busy", admission_retry_after())
+        self.inflight += 1
+        return True
+
+    async def release_slot(self, token):
+        self.inflight -= 1
+
+    async def stats(self) -> dict:
+        return {
+            "backend": "memory",
+            "inflight": self.inflight,
+            "max_inflight": self.max_inflight,
+            "users_active": len(self.user_locks),
+            "rejected": self.rejected,
+        }
+
+class RedisAdmission:
+    """
+    Admission state shared by all workers through Redis.
+    Each user has a list of turn tokens in arrival order; a turn runs once its
+    token is at the head and leaves by removing it. Every token has a lease
+    key, refreshed while its turn waits (WAITER_LEASE) and set to the admission
+    lease once it runs, so the token of a dead worker is skipped. In-flight
+    slots are a sorted set of lease-stamped tokens, so slots held by a dead
+    worker expire on their own.
+    """
+    POLL_INTERVAL = 0.05
+    WAITER_LEASE = 10.0
+
+    def __init__(self, url: str, max_inflight: int, user_queue_depth: int, user_wait: float, lease: float):
+        try:
+            import redis.asyncio as redis_asyncio
+        except ImportError:
+            raise RuntimeError("ADMISSION_BACKEND=redis requires the redis package")
+        self.redis = redis_asyncio.from_url(url)
+        self.max_inflight = max_inflight
+        self.user_queue_depth = user_queue_depth
+        self.user_wait = user_wait
+        self.lease_ms = int(lease * 1000)
+        self.rejected = 0
+
+    async def acquire_user(self, user_id: str):
+        queue_key = f"admission:queue:{user_id}"
+        token = uuid.uuid4().hex
+        lease_key = f"admission:lease:{token}"
+        waiter_lease_ms = int(self.WAITER_LEASE * 1000)
+        await self.redis.set(lease_key, user_id, px=waiter_lease_ms)
+        try:
+            position = await self.redis.rpush(queue_key, token)
+            await self.redis.pexpire(queue_key, int(self.user_wait * 1000) + self.lease_ms)
+            if position > self.user_queue_depth + 1:
+                self.rejected += 1
+                raise AdmissionRejected("Too many pending messages for this conversation", admission_retry_after())
+
+            deadline = time.monotonic() + self.user_wait
+            while True:
+                head = await self.redis.lindex(queue_key, 0)
+                if head is None:
+                    # The list expired under a turn that outlived every lease
+                    await self.redis.rpush(queue_key, token)
+                    continue
+                head = head.decode()
+                if head == token:
+                    await self.redis.set(lease_key, user_id, px=self.lease_ms)
+                    return token
+                if not await self.redis.exists(f"admission:lease:{head}"):
+                    # Its worker died while the turn waited or ran
+                    await self.redis.lrem(queue_key, 1, head)
+                    continue
+                if time.monotonic() >= deadline:
+                    self.rejected += 1
+                    raise AdmissionRejected(
+                        "Previous message for this conversation is still being answered", admission_retry_after()
+                    )
+                await self.redis.set(lease_key, user_id, px=waiter_lease_ms)
+                await asyncio.sleep(self.POLL_INTERVAL)
+        except BaseException:
+            await self._leave(queue_key, token)
+            raise
+
+    async def _leave(self, queue_key: str, token: str):
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.lrem(queue_key, 1, token)
+            pipe.delete(f"admission:lease:{token}")
+            await pipe.execute()
+
+    async def release_user(self, user_id: str, token):
+        await self._leave(f"admission:queue:{user_id}", token)
+
+    async def acquire_slot(self):
+        token = uuid.uuid4().hex
+        now_ms = int(time.time() * 1000)
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.zremrangebyscore("admission:inflight", 0, now_ms - self.lease_ms)
+            pipe.zadd("admission:inflight", {token: now_ms})
+            pipe.zrank("admission:inflight", token)
+            _, _, rank = await pipe.execute()
+        if rank >= self.max_inflight:
+            await self.redis.zrem("admission:inflight", token)
+            self.rejected += 1
+            raise AdmissionRejected("Server is busy", admission_retry_after())
+        return token
+
+    async def release_slot(self, token):
+        await self.redis.zrem("admission:inflight", token)
+
+    async def stats(self) -> dict:
+        return {
+            "backend": "redis",
+            "inflight": await self.redis.zcard("admission:inflight"),
+            "max_inflight": self.max_inflight,
+            "rejected_by_this_worker": self.rejected,
+        }
+
+if ADMISSION_BACKEND == "redis":
+    admission = RedisAdmission(
+        os.getenv("REDIS_URL", "redis://localhost:6379/0"),
+        CHAT_MAX_INFLIGHT, CHAT_USER_QUEUE_DEPTH, CHAT_USER_WAIT, ADMISSION_LEASE
+    )
+else:
+    admission = InProcessAdmission(CHAT_MAX_INFLIGHT, CHAT_USER_QUEUE_DEPTH, CHAT_USER_WAIT)
+
+class ChatTicket:
+    """An admitted chat turn; release() is idempotent"""
+    def __init__(self, user_id: str, user_token, slot_token):
+        self.user_id = user_id
+        self.user_token = user_token
+        self.slot_token = slot_token
+        self.released = False
+
+    async def release(self):
+        if self.released:
+            return
+        self.released = True
+        await admission.release_slot(self.slot_token)
+        await admission.release_user(self.user_id, self.user_token)
+
+async def admit_chat_turn(user_id: str) -> ChatTicket:
+    """Wait for this user's previous turn, then take an in-flight slot; 429 if either is unavailable"""
+    try:
+        user_token = await admission.acquire_user(user_id)
+        try:
+            slot_token = await admission.acquire_slot()
+        except BaseException:
+            await admission.release_user(user_id, user_token)
+            raise
+    except AdmissionRejected as e:
+        raise HTTPException(
+            status_code=429,
+            detail=str(e),
+            headers={"Retry-After": str(e.retry_after)}
+        )
+    return ChatTicket(user_id, user_token, slot_token)
+
+# ==================== LAB RESULTS ====================
+# lab_test_results arrive as {category: {test: result}}, where a result is a
+# status string ("high", "not_tested", ...), null (not tested) or an object
+# with a status and optional numeric value, unit and measurement time.
+# POST /patient-data normalizes them once, on write, to
+#   {category: {test: {"status", "value"?, "unit"?, "measured_at"?, "text"?}}}
+# ("text" keeps a free-text result that isn't exactly a status) and stores
+# two indexes next to them:
+# - abnormal_labs: [{"category", "test", "status"}] in input order, which the
+#   patient summary reads instead of scanning every result
+# - abnormal_index: "test" and "test:status" tokens (lowercase), queried with
+#   array_contains (Firestore) or an index table (SQLite) by /lab-results/abnormal
+class LabStatus(str, Enum):
+    NORMAL = "normal"
+    LOW = "low"
+    BORDERLINE_LOW = "borderline_low"
+    SLIGHTLY_LOW = "slightly_low"
+    SLIGHTLY_HIGH = "slightly_high"
+    BORDERLINE_HIGH = "borderline_high"
+    HIGH = "high"
+    ELEVATED = "elevated"
+    ABNORMAL = "abnormal"
+    NOT_TESTED = "not_tested"
+    UNKNOWN = "unknown"
+
+NON_ABNORMAL_LAB_STATUSES = {LabStatus.NORMAL, LabStatus.NOT_TESTED, LabStatus.UNKNOWN}
+
+# For free text: the first status word found, e.g. "Very high" -> high
+# Whole words of the underscored key only: "follow-up" and "slowly rising" aren't "low"
+LAB_STATUS_WORDS = re.compile(
+    r"(?<![a-z])(?:(borderline|slightly)_(high|low)|not_tested|abnormal|elevated|high|low|normal|borderline)(?![a-z])"
+)
+LAB_RESULT_FIELDS = {"status", "value", "unit", "measured_at"}
+LAB_QUERY_LIMIT = 100
+LAB_QUERY_MAX_LIMIT = 1000
+
+def parse_lab_status(text: str) -> LabStatus:
+    key = re.sub(r"[\s\-]+", "_", text.strip().lower())
+    match = LAB_STATUS_WORDS.search(key)
+    if not match:
+        return LabStatus.UNKNOWN
+    if match.group(0) == "borderline":
+        return LabStatus.ABNORMAL
+    return LabStatus(match.group(0))
+
+def normalize_lab_result(result) -> dict:
+    """One result (status string, number, null or object) as a compact record; ValueError if malformed"""
+    if isinstance(result, dict):
+        unknown = set(result) - LAB_RESULT_FIELDS
+        if unknown:
+            raise ValueError(f"unexpected fields {sorted(unknown)}")
+        record = normalize_lab_result(result.get("status") or "")
+        if result.get("value") is not None:
+            try:
+                record["value"] = float(result["value"])
+            except (TypeError, ValueError):
+                raise ValueError(f"value must be a number, got {result['value']!r}")
+        for field in ("unit", "measured_at"):
+            if result.get(field):
+                record[field] = str(result[field])
+        return record
+    if result is None:
+        return {"status": LabStatus.NOT_TESTED.value}
+    if isinstance(result, bool):
+        raise ValueError(f"expected a status, number or object, got {result!r}")
+    if isinstance(result, (int, float)):
+        return {"status": LabStatus.UNKNOWN.value, "value": float(result)}
+    
+    text = str(result)
+    status = parse_lab_status(text) if text else LabStatus.UNKNOWN
+    record = {"status": status.value}
+    if text and text != status.value:
+        record["text"] = text
+    return record
+
+def normalize_lab_results(lab_test_results: dict) -> tuple:
+    """Return (normalized results, abnormal_labs, abnormal_index); ValueError names the bad result"""
+    normalized, abnormal = {}, []
+    for category, tests in lab_test_results.items():
+        if not isinstance(tests, dict):
+            # Not a group of results (e.g. a note); kept as sent
+            normalized[category] = tests
+            continue
+        normalized[category] = {}
+        for test, result in tests.items():
+            try:
+                record = normalize_lab_result(result)
+            except ValueError as e:
+                raise ValueError(f"lab_test_results.{category}.{test}: {str(e)}")
+            normalized[category][test] = record
+            if LabStatus(record["status"]) not in NON_ABNORMAL_LAB_STATUSES:
+                abnormal.append({"category": category, "test": test, "status": record["status"]})
     
-    summary = "\n🏥 **PATIENT MEDICAL PROFILE**\n"
+    # dict.fromkeys: unique tokens, in order
+    index = dict.fromkeys(
+        token for lab in abnormal for token in (lab_index_token(lab["test"]), lab_index_token(lab["test"], lab["status"]))
+    )
+    return normalized, abnormal, list(index)
+
+def lab_index_token(test: str, status: str = None) -> str:
+    test = test.strip().lower()
+    return f"{test}:{status}" if status else test
+
+def lab_result_display(record: dict) -> str:
+    """How a normalized result reads in the summary, e.g. high (1.4 mg/dL)"""
+    text = record.get("text") or record["status"]
+    if "value" in record:
+        unit = f" {record['unit']}" if record.get("unit") else ""
+        text = f"{text} ({record['value']:g}{unit})"
+    return text
+
+# ==================== HELPER FUNCTIONS ====================
+# Patient summary rules as data: sections in output order, the fields each one
+# shows and when. compile_patient_summary() turns the schema into a renderer
+# once; it writes Markdown (the Gemini system instruction and the default
+# /patient-summary format) and HTML in the same pass.
+#
+# Section kinds:
+# - fields: a titled list of "Label: value" lines from profile[section]; with
+#   "only_if_any" the title is left out when no line applies
+# - labs: the abnormal_labs index, up to "limit" lines; for documents saved
+#   before lab results were normalized, raw values matching "require"
+# - inline: a single titled value, profile[key]
+# Field options:
+# - default: always shown, with this value when the key is missing
+# - otherwise shown only when the value is truthy and passes every test:
+#   "require"/"reject" (case-insensitive substrings), "not_equal" (exact value)
+# - template: formats the value; "suffix" adds " (other field)" when it is set
+ABNORMAL_LAB_WORDS = ["high", "low", "elevated", "borderline"]
+
+PATIENT_SUMMARY_SCHEMA = [
+    {"kind": "fields", "section": "critical_medical_info", "icon": "📌", "title": "Critical Medical Information:", "fields": [
+        {"key": "major_conditions", "label": "Major Conditions", "default": "None"},
+        {"key": "current_medications", "label": "Current Medications", "default": "None"},
+        {"key": "allergies", "label": "Allergies", "default": "None"},
+        {"key": "past_surgeries_or_treatments", "label": "Past Surgeries", "not_equal": "None"},
+    ]},
+    {"kind": "fields", "section": "vital_risk_factors", "icon": "⚠️", "title": "Risk Factors:", "fields": [
+        {"key": "smoking_status", "label": "Smoking", "require": ["smok"]},
+        {"key": "blood_pressure_issue", "label": "Blood Pressure", "not_equal": "No"},
+        {"key": "cholesterol_issue", "label": "Cholesterol", "not_equal": "No"},
+        {"key": "diabetes_status", "label": "Diabetes", "require": ["diabetes"]},
+        {"key": "family_history_major_disease", "label": "Family History"},
+    ]},
+    {"kind": "fields", "section": "organ_health_summary", "icon": "🫀", "title": "Organ Health Concerns:", "only_if_any": True, "fields": [
+        {"key": "heart_health", "label": "Heart", "reject": ["normal"]},
+        {"key": "kidney_health", "label": "Kidney", "reject": ["no"]},
+        {"key": "liver_health", "label": "Liver", "reject": ["normal", "no"]},
+        {"key": "gut_health", "label": "Gut", "reject": ["normal"]},
+    ]},
+    {"kind": "fields", "section": "mental_sleep_health", "icon": "🧠", "title": "Mental & Sleep Health:", "fields": [
+        {"key": "mental_health_status", "label": "Mental Status", "default": "Not specified"},
+        {"key": "mental_conditions", "label": "Mental Conditions"},
+        {"key": "sleep_hours", "label": "Sleep", "default": "Not specified", "template": "{} per night", "suffix": "sleep_problems"},
+    ]},
+    {"kind": "fields", "section": "lifestyle", "icon": "🏃", "title": "Lifestyle:", "fields": [
+        {"key": "physical_activity_level", "label": "Activity", "default": "Not specified"},
+        {"key": "diet_type", "label": "Diet", "default": "Not specified"},
+    ]},
+    {"kind": "labs", "icon": "🔬", "title": "Key Lab Results (Abnormal):", "require": ABNORMAL_LAB_WORDS, "limit": 10},
+    {"kind": "inline", "key": "primary_health_goals", "icon": "🎯", "title": "Health Goals:"},
+]
+
+def compile_words(words: list):
+    return re.compile("|".join(re.escape(word) for word in words), re.IGNORECASE) if words else None
+
+def compile_summary_field(field: dict):
+    """Return line(values) -> (markdown text, html text) or None for one field"""
+    key, label = field["key"], field["label"]
+    has_default, default = "default" in field, field.get("default")
+    require, reject = compile_words(field.get("require")), compile_words(field.get("reject"))
+    not_equal, template, suffix_key = field.get("not_equal"), field.get("template", "{}"), field.get("suffix")
     
-    # Patient Profile Section
-    if "patient_profile" in patient_data:
-        profile = patient_data["patient_profile"]
+    def line(values: dict):
+        if has_default:
+            value = values.get(key, default)
+        else:
+            value = values.get(key)
+            if not value or value == not_equal:
+                return None
+            if require and not require.search(value):
+                return None
+            if reject and reject.search(value):
+                return None
+        text = template.format(value)
+        suffix = values.get(suffix_key) if suffix_key else None
+        if suffix:
+            text = f"{text} ({suffix})"
+        return f"{label}: {text}", f"{label}: {html_escape(text, quote=False)}"
+    return line
+
+def compile_summary_section(spec: dict):
+    """Return render(patient_data, profile) -> list of (markdown, html) lines, or None to skip the section"""
+    kind = spec["kind"]
+    if kind == "fields":
+        section, only_if_any = spec["section"], spec.get("only_if_any", False)
+        lines = [compile_summary_field(field) for field in spec["fields"]]
+        def render(patient_data: dict, profile: dict):
+            if profile is None or section not in profile:
+                return None
+            values = profile[section]
+            rendered = [text for text in (line(values) for line in lines) if text]
+            return rendered if rendered or not only_if_any else None
+    elif kind == "labs":
+        require, limit = compile_words(spec["require"]), spec["limit"]
         
-        # Critical Medical Info
-        if "critical_medical_info" in profile:
-            cmi = profile["critical_medical_info"]
-            summary += "\n📌 **Critical Medical Information:**\n"
-            summary += f"- Major Conditions: {cmi.get('major_conditions', 'None')}\n"
-            summary += f"- Current Medications: {cmi.get('current_medications', 'None')}\n"
-            summary += f"- Allergies: {cmi.get('allergies', 'None')}\n"
-            if cmi.get('past_surgeries_or_treatments') and cmi['past_surgeries_or_treatments'] != 'None':
-                summary += f"- Past Surgeries: {cmi.get('past_surgeries_or_treatments')}\n"
+        # Test names and result values repeat across patients ("high", "normal", ...)
+        @functools.lru_cache(maxsize=8192)
+        def lab_line(test_name: str, result: str):
+            text = f"{test_name.replace('_', ' ').title()}: {result}"
+            return text, html_escape(text, quote=False)
         
-        # Vital Risk Factors
-        if "vital_risk_factors" in profile:
-            vrf = profile["vital_risk_factors"]
-            summary += "\n⚠️ **Risk Factors:**\n"
-            if vrf.get('smoking_status') and 'smok' in vrf['smoking_status'].lower():
-                summary += f"- Smoking: {vrf.get('smoking_status')}\n"
-            if vrf.get('blood_pressure_issue') and vrf['blood_pressure_issue'] != 'No':
-                summary += f"- Blood Pressure: {vrf.get('blood_pressure_issue')}\n"
-            if vrf.get('cholesterol_issue') and vrf['cholesterol_issue'] != 'No':
-                summary += f"- Cholesterol: {vrf.get('cholesterol_issue')}\n"
-            if vrf.get('diabetes_status') and 'diabetes' in vrf['diabetes_status'].lower():
-                summary += f"- Diabetes: {vrf.get('diabetes_status')}\n"
-            if vrf.get('family_history_major_disease'):
-                summary += f"- Family History: {vrf.get('family_history_major_disease')}\n"
+        @functools.lru_cache(maxsize=8192)
+        def legacy_lab_line(test_name: str, result: str):
+            return lab_line(test_name, result) if require.search(result) else None
         
-        # Organ Health Summary
-        if "organ_health_summary" in profile:
-            ohs = profile["organ_health_summary"]
-            issues = []
-            if ohs.get('heart_health') and 'normal' not in ohs['heart_health'].lower():
-                issues.append(f"Heart: {ohs['heart_health']}")
-            if ohs.get('kidney_health') and 'no' not in ohs['kidney_health'].lower():
-                issues.append(f"Kidney: {ohs['kidney_health']}")
-            if ohs.get('liver_health') and 'normal' not in ohs['liver_health'].lower() and 'no' not in ohs['liver_health'].lower():
-                issues.append(f"Liver: {ohs['liver_health']}")
-            if ohs.get('gut_health') and 'normal' not in ohs['gut_health'].lower():
-                issues.append(f"Gut: {ohs['gut_health']}")
+        def render(patient_data: dict, profile: dict):
+            if "abnormal_labs" in patient_data:
+                # Normalized on write: read the precomputed index, not every result
+                labs = patient_data["lab_test_results"]
+                rendered = [
+                    lab_line(lab["test"], lab_result_display(labs[lab["category"]][lab["test"]]))
+                    for lab in patient_data["abnormal_labs"][:limit]
+                ]
+                return rendered or None
             
-            if issues:
-                summary += "\n🫀 **Organ Health Concerns:**\n"
-                for issue in issues:
-                    summary += f"- {issue}\n"
-        
-        # Mental & Sleep Health
-        if "mental_sleep_health" in profile:
-            msh = profile["mental_sleep_health"]
-            summary += "\n🧠 **Mental & Sleep Health:**\n"
-            summary += f"- Mental Status: {msh.get('mental_health_status', 'Not specified')}\n"
-            if msh.get('mental_conditions'):
-                summary += f"- Mental Conditions: {msh.get('mental_conditions')}\n"
-            summary += f"- Sleep: {msh.get('sleep_hours', 'Not specified')} per night"
-            if msh.get('sleep_problems'):
-                summary += f" ({msh.get('sleep_problems')})\n"
-            else:
-                summary += "\n"
-        
-        # Lifestyle
-        if "lifestyle" in profile:
-            ls = profile["lifestyle"]
-            summary += "\n🏃 **Lifestyle:**\n"
-            summary += f"- Activity: {ls.get('physical_activity_level', 'Not specified')}\n"
-            summary += f"- Diet: {ls.get('diet_type', 'Not specified')}\n"
-    
-    # Lab Test Results Section
-    if "lab_test_results" in patient_data:
-        lab_results = patient_data["lab_test_results"]
-        abnormal_results = []
-        
-        # Check each test category for abnormal results
-        for test_category, tests in lab_results.items():
-            if isinstance(tests, dict):
+            # Documents saved before normalization hold raw strings
+            rendered = []
+            for tests in (patient_data.get("lab_test_results") or {}).values():
+                if not isinstance(tests, dict):
+                    continue
                 for test_name, result in tests.items():
                     if result and isinstance(result, str):
-                        result_lower = result.lower()
-                        if any(word in result_lower for word in ['high', 'low', 'elevated', 'borderline']):
-                            abnormal_results.append(f"{test_name.replace('_', ' ').title()}: {result}")
-        
-        if abnormal_results:
-            summary += "\n🔬 **Key Lab Results (Abnormal):**\n"
-            for result in abnormal_results[:10]:
-                summary += f"- {result}\n"
+                        text = legacy_lab_line(test_name, result)
+                        if text:
+                            rendered.append(text)
+                            if len(rendered) == limit:
+                                return rendered
+            return rendered or None
+    elif kind == "inline":
+        key = spec["key"]
+        def render(patient_data: dict, profile: dict):
+            if profile is None or key not in profile:
+                return None
+            return str(profile[key])
+    else:
+        raise ValueError(f"Unknown patient summary section kind '{kind}'")
+    return render
+
+def compile_patient_summary(schema: list):
+    """Compile the schema into render(patient_data) -> (markdown, html)"""
+    sections = []
+    for spec in schema:
+        md_title = f"{spec['icon']} **{spec['title']}**"
+        html_title = f"{spec['icon']} <strong>{html_escape(spec['title'], quote=False)}</strong>"
+        sections.append((compile_summary_section(spec), spec["kind"] == "inline", md_title, html_title))
     
-    # Health Goals
-    if "patient_profile" in patient_data and "primary_health_goals" in patient_data["patient_profile"]:
-        goals = patient_data["patient_profile"]["primary_health_goals"]
-        summary += f"\n🎯 **Health Goals:** {goals}\n"
-    
-    return summary
+    def render(patient_data: dict) -> tuple:
+        if not patient_data:
+            return "", ""
+        profile = patient_data.get("patient_profile") if "patient_profile" in patient_data else None
+        md = ["\n🏥 **PATIENT MEDICAL PROFILE**\n"]
+        html = ["<p>🏥 <strong>PATIENT MEDICAL PROFILE</strong></p>"]
+        for render_section, inline, md_title, html_title in sections:
+            lines = render_section(patient_data, profile)
+            if lines is None:
+                continue
+            if inline:
+                value = lines
+                md.append(f"\n{md_title} {value}\n")
+                html.append(f"<p>{html_title} {html_escape(value, quote=False)}</p>")
+                continue
+            md.append(f"\n{md_title}\n")
+            md.extend(f"- {text}\n" for text, _ in lines)
+            html.append(f"<p>{html_title}</p>")
+            if lines:
+                html.append("<ul>\n" + "\n".join(f"<li>{text}</li>" for _, text in lines) + "\n</ul>")
+        return "".join(md), "\n".join(html)
+    return render
+
+patient_summary_renderer = compile_patient_summary(PATIENT_SUMMARY_SCHEMA)
+
+def generate_patient_summary(patient_data: dict) -> str:
+    """Generate a comprehensive summary of patient's medical profile and lab results"""
+    return patient_summary_renderer(patient_data)[0]
 
-def save_patient_data(user_id: str, data: dict):
-    """Save patient data to Firebase Firestore"""
+def invalidate_patient_cache(user_id: str):
+    patient_cache.invalidate(lambda key: key == user_id)
+    patient_summary_cache.invalidate(lambda key: key[0] == user_id)
+
+async def save_patient_data(user_id: str, data: dict):
+    """Save patient data to storage"""
     data["last_updated"] = datetime.now().isoformat()
-    db.collection("patients").document(user_id).set(data)
-
-def load_patient_data(user_id: str) -> dict:
-    """Load patient data from Firebase Firestore"""
-    doc = db.collection("patients").document(user_id).get()
-    if doc.exists:
-        return doc.to_dict()
-    return None
-
-def save_chat_history(user_id: str, messages: list):
-    db.collection("chat_history").document(user_id).set({
-        "messages": messages,
-        "last_updated": datetime.now().isoformat()
-    })
+    try:
+        await storage.save_patient(user_id, data)
+    finally:
+        invalidate_patient_cache(user_id)
 
-def load_chat_history(user_id: str) -> list:
-    doc = db.collection("chat_history").document(user_id).get()
-    if doc.exists:
-        return doc.to_dict().get("messages", [])
-    return []
+async def load_patient_data(user_id: str) -> dict:
+    """
+    Load patient data, served from the in-process cache when possible.
+    The returned dict is shared with the cache: copy it before modifying.
+    """
+    cached = patient_cache.get(user_id)
+    if cached is not None:
+        return None if cached is _NO_PATIENT else cached
+    
+    data = await storage.load_patient(user_id)
+    patient_cache.set(user_id, _NO_PATIENT if data is None else data)
+    return data
 
-def delete_chat_history(user_id: str):
-    db.collection("chat_history").document(user_id).delete()
+async def load_conversation_state(user_id: str) -> dict:
+    """
+    Load what the prompt builder needs: the running summary, the total message
+    count and only the messages not yet folded into the summary.
+    """
+    meta = await storage.load_chat_meta(user_id)
+    summarized_count = meta.get("summarized_count", 0)
+    records = await storage.load_chat_messages(user_id, start_seq=summarized_count) if meta else []
+    return {
+        "messages": [chat_message_from_record(r) for r in records],
+        "summary": meta.get("summary", ""),
+        "summarized_count": summarized_count,
+        "message_count": meta.get("message_count", 0),
+    }
+
+async def load_chat_history(user_id: str, cursor: int = None, limit: int = None) -> dict:
+    """
+    Load a page of chat history. `cursor` is the seq of the last message already
+    seen; `next_cursor` is None once the end of the conversation is reached.
+    """
+    meta = await storage.load_chat_meta(user_id)
+    if not meta:
+        return {"messages": [], "next_cursor": None, "message_count": 0}
+    
+    start_seq = 0 if cursor is None else cursor + 1
+    records = await storage.load_chat_messages(user_id, start_seq=start_seq, limit=limit + 1 if limit else None)
+    next_cursor = None
+    if limit and len(records) > limit:
+        records = records[:limit]
+        next_cursor = records[-1]["seq"]
+    return {
+        "messages": [chat_message_from_record(r) for r in records],
+        "next_cursor": next_cursor,
+        "message_count": meta.get("message_count", 0),
+    }
+
+# Emoji are removed as whole sequences: a pictograph with its variation
+# selector, skin-tone modifier and tag characters, and the pictographs ZWJ
+# joins into one glyph (👩‍⚕️, 👨‍👩‍👧), plus flags (regional indicator pairs) and
+# keycaps (1️⃣). ZWJ is only removed inside a sequence, since Urdu and other
+# scripts use it between letters. Components left over when a sequence is
+# split across stream chunks are removed on their own. Pictographs are the
+# Unicode blocks that hold them, except (c), (R) and TM, which are
+# Extended_Pictographic but appear in plain text ("Tylenol®").
+EMOJI_PICTOGRAPH_CHARS = (
+    "\u203c\u2049\u2139\u2194-\u2199\u21a9\u21aa\u231a\u231b\u2328\u23cf"
+    "\u23e9-\u23f3\u23f8-\u23fa\u24c2\u25aa\u25ab\u25b6\u25c0\u25fb-\u25fe\u2600-\u27bf"
+    "\u2934\u2935\u2b00-\u2bff\u3030\u303d\u3297\u3299\U0001f000-\U0001faff\U0001fc00-\U0001fffd"
+)
+REGIONAL_INDICATOR_CHARS = "\U0001f1e6-\U0001f1ff"
+EMOJI_COMPONENT_CHARS = "\ufe0f\u20e3\U0001f3fb-\U0001f3ff\U000e0020-\U000e007f"
+EMOJI_ELEMENT_TAIL = "[\ufe0e\ufe0f]?[\U0001f3fb-\U0001f3ff]?[\U000e0020-\U000e007f]*"
+# Every alternative starts with the same character class, so the engine can
+# scan for candidate characters instead of trying each alternative at every
+# position; a lookbehind then picks the alternative. An emoji between two
+# spaces takes one of them with it, so "Rest 😊 well" becomes "Rest well"
+# while "soon!😊 Take care" keeps its space.
+EMOJI = (
+    f"[0-9#*{REGIONAL_INDICATOR_CHARS}{EMOJI_PICTOGRAPH_CHARS}{EMOJI_COMPONENT_CHARS}]"
+    "(?:(?<=[ \t].)(?P<spaced>))?"
+    "(?:"
+    "(?<=[0-9#*])\ufe0f?\u20e3"  # keycap
+    f"|(?<=[{REGIONAL_INDICATOR_CHARS}])[{REGIONAL_INDICATOR_CHARS}]?"  # flag
+    f"|(?<=[{EMOJI_PICTOGRAPH_CHARS}]){EMOJI_ELEMENT_TAIL}"  # ZWJ sequence
+    f"(?:\u200d[{EMOJI_PICTOGRAPH_CHARS}]{EMOJI_ELEMENT_TAIL})*\u200d?"
+    f"|(?<=[{EMOJI_COMPONENT_CHARS}])"  # stray component
+    ")(?(spaced)[ \t]?)"
+)
+# Markdown that shouldn't be read aloud. A link keeps its text and emphasis
+# keeps the text between its delimiters (the "link" and "emphasis" groups),
+# cleaned in turn; anything else matched is dropped. Every repetition is
+# bounded, so a match attempt looks at most a few hundred characters ahead and
+# the pass stays linear even on text like "[[[[...". A single asterisk only
+# counts as emphasis when it pairs up around text, so "2*3 tablets" is read as
+# written; runs of two or more are markdown even when unclosed (a reply cut
+# off by the output token limit).
+MARKDOWN_BLOCKS = (
+    r"^[ \t]*(?:(?:-{3,}|\*{3,}|_{3,})[ \t]*$|#{1,6}[ \t]*|>[ \t]?|[-*+•][ \t]+)"  # rule, heading, quote, bullet
+)
+MARKDOWN_INLINE = (
+    r"\[(?P<link>[^\[\]\n]{0,200})\]\([^)\n]{0,500}\)"  # link
+    # Emphasis: the delimiter must not follow a word character, checked after
+    # its first character so that candidates are found by scanning for * and _
+    r"|(?P<delimiter>\*(?<![\w*]\*)\*{0,2}|_(?<![\w*]_)_)(?P<emphasis>[^\s*][^\n]{0,300}?)(?<![\s*])(?P=delimiter)(?![\w*])"
+    r"|\*{2,}|`+"  # unpaired bold, code
+)
 
-import re
+EMOJI_PATTERN = re.compile(EMOJI)
+SPEECH_PATTERN = re.compile(f"{MARKDOWN_BLOCKS}|{MARKDOWN_INLINE}|{EMOJI}", re.MULTILINE)
+# For kept link and emphasis text, which doesn't start a line
+INLINE_SPEECH_PATTERN = re.compile(f"{MARKDOWN_INLINE}|{EMOJI}")
 
 def remove_emojis(text: str) -> str:
     """
     Remove all emojis from a string.
     """
-    emoji_pattern = re.compile(
-        "[" 
-        "\U0001F600-\U0001F64F"  # emoticons
-        "\U0001F300-\U0001F5FF"  # symbols & pictographs
-        "\U0001F680-\U0001F6FF"  # transport & map symbols
-        "\U0001F1E0-\U0001F1FF"  # flags
-        "\U00002700-\U000027BF"  # Dingbats
-        "\U0001F900-\U0001F9FF"  # Supplemental Symbols and Pictographs
-        "\U00002600-\U000026FF"  # Misc symbols
-        "\U00002B00-\U00002BFF"  # Misc symbols & arrows
-        "]+", flags=re.UNICODE
+    return EMOJI_PATTERN.sub("", text)
+
+def kept_speech_text(match) -> str:
+    kept = match.group("link") or match.group("emphasis")
+    return INLINE_SPEECH_PATTERN.sub(kept_speech_text, kept) if kept else ""
+
+def speech_text(text: str) -> str:
+    """Remove emojis and markdown formatting from text that will be spoken, in one pass"""
+    return SPEECH_PATTERN.sub(kept_speech_text, text)
+
+def render_patient_summary(user_id: str, patient_data: dict, format: str = "markdown") -> str:
+    """Markdown or HTML patient summary; both are cached per (user_id, last_updated)"""
+    key = (user_id, patient_data.get("last_updated"))
+    summaries = patient_summary_cache.get(key)
+    if summaries is None:
+        summaries = patient_summary_renderer(patient_data)
+        patient_summary_cache.set(key, summaries)
+    return summaries[1] if format == "html" else summaries[0]
+
+
+# ==================== STATIC ASSETS ====================
+# Static files are read once, on first request, and kept in memory with
+# precompressed gzip and brotli variants (brotli when the package is
+# installed), each with its own strong ETag. Clients revalidate with
+# If-None-Match and get a 304 while the file is unchanged.
+# STATIC_RELOAD=1 re-reads a file whenever its mtime changes (for development).
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+STATIC_RELOAD = os.getenv("STATIC_RELOAD", "0") == "1"
+STATIC_CACHE_CONTROL = os.getenv("STATIC_CACHE_CONTROL", "public, max-age=300")
+
+def accepted_encodings(header: str) -> set:
+    """Content codings from an Accept-Encoding header, without q=0 entries"""
+    accepted = set()
+    for item in header.split(","):
+        coding, _, params = item.strip().partition(";")
+        if params.strip() in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            continue
+        accepted.add(coding.strip().lower())
+    return accepted
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # If-None-Match uses the weak comparison
+    return etag in (tag.strip().removeprefix("W/") for tag in if_none_match.split(","))
+
+class StaticAsset:
+    """One static file held in memory as {encoding: (body, etag)}"""
+    ENCODINGS = ("br", "gzip")
+
+    def __init__(self, path: str, media_type: str):
+        self.path = path
+        self.media_type = media_type
+        self.variants = None
+        self.mtime = None
+
+    def load(self):
+        """(Re)build the variants; an empty dict if the file doesn't exist"""
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            self.variants, self.mtime = {}, None
+            return
+        if mtime == self.mtime:
+            return
+        with open(self.path, "rb") as f:
+            body = f.read()
+        digest = hashlib.sha256(body).hexdigest()[:32]
+        variants = {
+            "identity": (body, f'"{digest}"'),
+            "gzip": (gzip.compress(body, compresslevel=9, mtime=0), f'"{digest}-gzip"'),
+        }
+        if brotli is not None:
+            variants["br"] = (brotli.compress(body, quality=11), f'"{digest}-br"')
+        self.variants, self.mtime = variants, mtime
+
+    @property
+    def exists(self) -> bool:
+        if self.variants is None or STATIC_RELOAD:
+            self.load()
+        return bool(self.variants)
+
+    def response(self, request: Request) -> Response:
+        accepted = accepted_encodings(request.headers.get("accept-encoding", ""))
+        encoding = next((e for e in self.ENCODINGS if e in accepted and e in self.variants), "identity")
+        body, etag = self.variants[encoding]
+        headers = {"ETag": etag, "Cache-Control": STATIC_CACHE_CONTROL, "Vary": "Accept-Encoding"}
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            return Response(status_code=304, headers=headers)
+        return Response(body, media_type=self.media_type, headers=headers)
+
+index_page = StaticAsset("index.html", "text/html; charset=utf-8")
+
+# ==================== ROOT ENDPOINT ====================
+@app.get("/", response_class=HTMLResponse)
+async def root(request: Request):
+    """Root endpoint - serves index.html, falls back to JSON"""
+    if index_page.exists:
+        return index_page.response(request)
+    
+    return JSONResponse({
+        "status": "healthy",
+        "service": "Dr. HealBot API",
+        "version": "1.0.0",
+        "endpoints": {
+            "chat": "/chat",
+            "chat_stream": "/chat/stream",
+            "tts": "/tts",
+            "tts_stream": "/tts/stream",
+            "stt": "/stt",
+            "stt_stream": "/ws/stt",
+            "patient_data": "/patient-data/{user_id}",
+            "chat_history": "/chat-history/{user_id}",
+            "patient_summary": "/patient-summary/{user_id}",
+            "abnormal_lab_results": "/lab-results/abnormal?test=...&status=...",
+            "ready": "/ready",
+            "metrics": "/metrics"
+        }
+    })
+
+@app.get("/ping")
+async def ping():
+    return {"message": "pong"}
+
+@app.get("/ready")
+async def ready():
+    """Readiness probe: 200 once every dependency is initialized, 503 until then"""
+    return JSONResponse(
+        {"ready": readiness.ready, "dependencies": readiness.dependencies},
+        status_code=200 if readiness.ready else 503
     )
-    return emoji_pattern.sub(r'', text)
-import markdown
 
-def generate_patient_summary_html(patient_data: dict) -> str:
+@app.get("/gemini-stats")
+async def gemini_stats():
+    """Circuit breaker state, retry/hedge counters and recent latency of Gemini calls"""
+    return gemini_client.stats()
+
+@app.get("/admission-stats")
+async def admission_stats():
+    """In-flight chat turns and admission rejections"""
+    return await admission.stats()
+
+@app.get("/scratch-stats")
+async def scratch_stats():
+    """Disk usage and cleanup counters for the managed scratch space"""
+    return scratch_space.stats()
+
+@app.get("/cache-stats")
+async def cache_stats():
+    """Hit/miss counters for the in-process caches"""
+    return {
+        "patient": patient_cache.stats(),
+        "patient_summary": patient_summary_cache.stats(),
+        "tts": tts_cache.stats(),
+        "chat_model": chat_model_cache.stats(),
+    }
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics (aggregated across workers in multi-worker mode)"""
+    return Response(generate_latest(metrics_registry()), media_type=CONTENT_TYPE_LATEST)
+
+# ==================== HISTORY COMPACTION ====================
+# The prompt keeps the last HISTORY_VERBATIM_TURNS exchanges word for word.
+# Older messages are folded into a stored running summary in batches of
+# HISTORY_SUMMARY_BATCH_TURNS exchanges, after the response has been sent.
+HISTORY_VERBATIM_TURNS = int(os.getenv("HISTORY_VERBATIM_TURNS", "6"))
+HISTORY_SUMMARY_BATCH_TURNS = int(os.getenv("HISTORY_SUMMARY_BATCH_TURNS", "2"))
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "12000"))
+
+HISTORY_SUMMARY_PROMPT = """
+You maintain a running clinical summary of a consultation between a patient and Dr. HealBot.
+Update the existing summary with the new messages below. Keep every medically relevant fact:
+symptoms, onset, duration, severity, answers to questions, medications taken, advice already given.
+Write plain text, at most 200 words, no emojis, no greetings.
+
+EXISTING SUMMARY:
+{summary}
+
+NEW MESSAGES:
+{messages}
+
+UPDATED SUMMARY:
+"""
+
+# Users whose compaction is currently running in this process
+_compacting_users = set()
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (about 4 characters per token) used for prompt budgeting"""
+    return len(text) // 4 + 1
+
+def format_history_message(msg: dict) -> str:
+    role = "Patient" if msg["role"] == "user" else "Dr. HealBot"
+    return f"\n{role}: {msg['content']}\n"
+
+def build_history_section(summary: str, messages: list, token_budget: int) -> str:
     """
-    Generate patient summary as HTML instead of Markdown.
+    Render the running summary and the unsummarized messages within token_budget.
+    The summary may use up to a third of the budget; the newest messages take the
+    rest, and the oldest verbatim messages are dropped first when it runs out.
     """
-    md_summary = generate_patient_summary(patient_data)
-    html_summary = markdown.markdown(md_summary)
-    return html_summary
+    section = ""
+    remaining = max(token_budget, 0)
+    
+    if summary:
+        summary_cap = remaining // 3
+        if estimate_tokens(summary) > summary_cap:
+            # Keep the most recent part of the summary
+            summary = summary[-summary_cap * 4:] if summary_cap else ""
+        if summary:
+            block = f"\nSummary of earlier conversation:\n{summary}\n"
+            section += block
+            remaining -= estimate_tokens(block)
+    
+    kept = []
+    for msg in reversed(messages):
+        line = format_history_message(msg)
+        cost = estimate_tokens(line)
+        if cost > remaining:
+            break
+        kept.append(line)
+        remaining -= cost
+    
+    omitted = len(messages) - len(kept)
+    if omitted:
+        section += f"\n[{omitted} earlier messages omitted]\n"
+    
+    return section + "".join(reversed(kept))
 
+async def summarize_history(summary: str, messages: list) -> str:
+    """Fold messages into the existing running summary with a short Gemini call"""
+    prompt = HISTORY_SUMMARY_PROMPT.format(
+        summary=summary or "(none yet)",
+        messages="".join(format_history_message(msg) for msg in messages),
+    )
+    response = await gemini_client.generate(get_model("summary"), prompt, purpose="summary")
+    return response.text.strip()
 
-# ==================== ROOT ENDPOINT ====================
-@app.get("/", response_class=HTMLResponse)
-async def root():
-    """Root endpoint - tries to serve index.html, falls back to JSON"""
+async def compact_chat_history(user_id: str):
+    """
+    Background task: fold messages that have left the verbatim window into the
+    running summary. Only runs once a full batch is pending, so the summary is
+    refreshed incrementally instead of on every request.
+    """
+    if user_id in _compacting_users:
+        return
+    _compacting_users.add(user_id)
     try:
-        with open("index.html", "r", encoding="utf-8") as f:
-            return f.read()
-    except FileNotFoundError:
-        return JSONResponse({
-            "status": "healthy",
-            "service": "Dr. HealBot API",
-            "version": "1.0.0",
-            "endpoints": {
-                "chat": "/chat",
-                "tts": "/tts",
-                "stt": "/stt",
-                "patient_data": "/patient-data/{user_id}",
-                "chat_history": "/chat-history/{user_id}",
-                "patient_summary": "/patient-summary/{user_id}"
-            }
-        })
+        state = await load_conversation_state(user_id)
+        summarized_count = state["summarized_count"]
+        window_start = max(0, state["message_count"] - HISTORY_VERBATIM_TURNS * 2)
+        pending = window_start - summarized_count
+        if pending < HISTORY_SUMMARY_BATCH_TURNS * 2:
+            return
+        
+        # state["messages"] starts at summarized_count
+        with stage("compaction.summarize"):
+            summary = await summarize_history(state["summary"], state["messages"][:pending])
+        await storage.save_history_summary(user_id, summary, window_start)
+    except Exception as e:
+        log_error("compaction", e)
+    finally:
+        _compacting_users.discard(user_id)
+
+
+# ==================== SYMPTOM EXTRACTION ====================
+# Symptom reports are found with per-language vocabularies loaded from
+# SYMPTOM_VOCABULARY_DIR, one JSON file per language:
+#   {"language": "en", "symptoms": {"headache": ["headache", "head pain", ...]}}
+# Every term of a vocabulary is compiled into one regex whose alternation is
+# factored as a trie (shared prefixes are matched once), anchored on word
+# boundaries so "ache" doesn't match inside "headache" nor "pain" inside
+# "painting". A single finditer pass is linear in the message length whatever
+# the vocabulary size. Within a term, spaces also match hyphens and repeated
+# whitespace. The "auto" extractor combines all languages.
+SYMPTOM_VOCABULARY_DIR = os.getenv("SYMPTOM_VOCABULARY_DIR", "resources/symptoms")
+
+def normalize_symptom_term(term: str) -> str:
+    return re.sub(r"[\s\-]+", " ", term.strip().lower())
+
+def trie_pattern(terms) -> str:
+    """Regex alternation for terms, factored by common prefix"""
+    trie = {}
+    for term in terms:
+        node = trie
+        for char in term:
+            node = node.setdefault(char, {})
+        node[""] = {}
+    
+    def pattern(node):
+        branches = [
+            (r"[\s\-]+" if char == " " else re.escape(char)) + pattern(child)
+            for char, child in sorted(node.items()) if char
+        ]
+        if not branches:
+            return ""
+        group = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        if "" in node:
+            # A term ends here; the longer terms are tried first
+            return f"(?:{group})?"
+        return group
+    
+    return pattern(trie)
+
+class SymptomExtractor:
+    """All terms of one or more vocabularies, compiled into a single regex"""
+    def __init__(self, vocabularies: list):
+        # normalized term -> (symptom, language); the first vocabulary wins
+        self.terms = {}
+        for vocabulary in vocabularies:
+            for symptom, synonyms in vocabulary["symptoms"].items():
+                # Keys are the English canonical names: a term of "en" only
+                terms = [symptom, *synonyms] if vocabulary["language"] == "en" else synonyms
+                for term in terms:
+                    self.terms.setdefault(normalize_symptom_term(term), (symptom, vocabulary["language"]))
+        self.pattern = re.compile(rf"(?<!\w){trie_pattern(self.terms)}(?!\w)", re.IGNORECASE)
+    
+    def extract(self, text: str) -> list:
+        """Matches as [{"symptom", "term", "start", "end", "language"}], in text order"""
+        matches = []
+        for match in self.pattern.finditer(text):
+            entry = self.terms.get(normalize_symptom_term(match.group()))
+            if entry:
+                matches.append({
+                    "symptom": entry[0],
+                    "term": match.group(),
+                    "start": match.start(),
+                    "end": match.end(),
+                    "language": entry[1],
+                })
+        return matches
+
+def load_symptom_vocabularies(directory: str = SYMPTOM_VOCABULARY_DIR) -> dict:
+    """{language: vocabulary} for every JSON file in directory"""
+    vocabularies = {}
+    for name in sorted(os.listdir(directory)):
+        if name.endswith(".json"):
+            with open(os.path.join(directory, name), encoding="utf-8") as f:
+                vocabulary = json.load(f)
+            vocabularies[vocabulary["language"].lower()] = vocabulary
+    if not vocabularies:
+        raise RuntimeError(f"No symptom vocabularies in {directory}")
+    return vocabularies
+
+# language -> SymptomExtractor, plus "auto"; built by warm-up
+symptom_extractors = {}
+
+def init_symptom_extractors():
+    vocabularies = load_symptom_vocabularies()
+    extractors = {language: SymptomExtractor([vocabulary]) for language, vocabulary in vocabularies.items()}
+    # English first, so a term shared between languages reports as English
+    ordered = sorted(vocabularies.values(), key=lambda v: v["language"] != "en")
+    extractors["auto"] = SymptomExtractor(ordered)
+    symptom_extractors.update(extractors)
+
+def symptom_extractor(language: str = "auto") -> SymptomExtractor:
+    """Extractor for a language code such as "es" or "en-US"; unknown codes use all languages"""
+    if not symptom_extractors:
+        init_symptom_extractors()
+    code = (language or "auto").split("-")[0].split("_")[0].lower()
+    return symptom_extractors.get(code) or symptom_extractors["auto"]
+
+def detect_symptoms(message: str, language: str = "auto") -> list:
+    """Canonical names of the symptoms a message mentions, without duplicates"""
+    return list(dict.fromkeys(match["symptom"] for match in symptom_extractor(language).extract(message)))
 
-@app.get("/ping")
-async def ping():
-    return {"message": "pong"}
 
 # ==================== CHAT ENDPOINT ====================
+async def log_symptoms(user_id: str, seq: int, message: str, language: str):
+    """If the message reports symptoms, add it to the symptom log; a failure here doesn't fail the turn"""
+    try:
+        keywords = detect_symptoms(message, language)
+        if keywords:
+            await storage.append_symptom_event(user_id, symptom_event_record(seq, message, keywords))
+    except Exception as e:
+        log_error("symptom log", e)
+
+async def prepare_chat_turn(user_id: str, user_message: str):
+    """
+    Load patient data and chat history and build the Gemini request for this
+    turn. Returns (model, conversation_prompt, conversation); the model already
+    carries the system prompt and patient summary. Makes no writes.
+    """
+    # Load patient data & conversation state concurrently
+    patient_data, conversation = await asyncio.gather(
+        timed("chat.load_patient", load_patient_data(user_id)),
+        timed("chat.load_history", load_conversation_state(user_id)),
+    )
+    patient_data = patient_data or {}
+    
+    # Generate patient summary
+    with stage("chat.patient_summary"):
+        persistent_summary = render_patient_summary(user_id, patient_data) if patient_data else "No patient history available."
+    
+    with stage("chat.model"):
+        model = await get_chat_model(persistent_summary)
+    
+    # Build conversation prompt: running summary + recent history, within the token budget
+    with stage("chat.build_prompt"):
+        system_instruction_tokens = estimate_tokens(CHAT_SYSTEM_INSTRUCTION) + estimate_tokens(persistent_summary)
+        history_header = "=== CONVERSATION HISTORY ===\n"
+        current_turn = f"\nPatient: {user_message}\n\nDr. HealBot:"
+        history_budget = PROMPT_TOKEN_BUDGET - system_instruction_tokens - estimate_tokens(history_header + current_turn)
+        history_section = build_history_section(
+            conversation["summary"],
+            conversation["messages"],
+            history_budget,
+        )
+        conversation_prompt = history_header + history_section + current_turn
+    
+    return model, conversation_prompt, conversation
+
+async def record_chat_turn(user_id: str, conversation: dict, user_message: str, reply_text: str, language: str = "auto"):
+    """
+    Append the finished user/assistant exchange to the stored chat history and,
+    if the message reports symptoms, add it to the symptom log (one small write
+    after the history write, which assigns the turn's seq; the patient profile
+    is not touched).
+    """
+    turn = [
+        {"role": "user", "content": user_message},
+        {"role": "assistant", "content": reply_text},
+    ]
+    with stage("chat.save_history"):
+        # The storage picks the seq: another turn may have been saved since this one was prepared
+        seq = await storage.append_chat_messages(user_id, turn)
+        await log_symptoms(user_id, seq, user_message, language)
+    conversation["messages"].extend(turn)
+    conversation["message_count"] = seq + len(turn)
+
+async def generate_chat_reply(user_id: str, user_message: str, language: str = "auto") -> dict:
+    """Run one complete chat turn and return the /chat response payload"""
+    model, conversation_prompt, conversation = await prepare_chat_turn(user_id, user_message)
+    
+    # Call Gemini API
+    try:
+        with stage("chat.generate"):
+            response = await gemini_client.generate(model, conversation_prompt)
+    except Exception as e:
+        if not is_gemini_unavailable(e):
+            raise
+        # Upstream is down or too slow: answer gracefully and don't record the turn
+        print(f"Gemini unavailable for {user_id}: {type(e).__name__}")
+        return {
+            "reply": FALLBACK_REPLY,
+            "user_id": user_id,
+            "message_count": conversation["message_count"],
+            "degraded": True
+        }
+    
+    # The system prompt asks for no emojis; enforce it
+    reply_text = remove_emojis(response.text).strip()
+    
+    # Update chat history
+    await record_chat_turn(user_id, conversation, user_message, reply_text, language)
+    
+    return {
+        "reply": reply_text,
+        "user_id": user_id,
+        "message_count": conversation["message_count"]
+    }
+
 @app.post("/chat")
-async def chat(request: ChatRequest):
+async def chat(request: ChatRequest, background_tasks: BackgroundTasks):
     """
     Chat endpoint that:
     - Loads patient data and chat history
-    - Updates patient data if new symptoms are reported
+    - Logs the message if it reports symptoms
     - Sends patient summary + chat history + current message to Gemini
     - Returns structured, history-aware medical response
     """
+    ticket = await admit_chat_turn(request.user_id)
     try:
-        user_id = request.user_id
-        user_message = request.message.strip()
-        
-        # Load patient data & chat history
-        patient_data = load_patient_data(user_id) or {}
-        chat_history = load_chat_history(user_id)
-        
-        # Update patient data with new symptom info
-        if "new_symptoms" not in patient_data:
-            patient_data["new_symptoms"] = []
+        result = await generate_chat_reply(request.user_id, request.message.strip(), request.language)
         
-        # Simple heuristic: if message contains key symptoms, store it
-        symptom_keywords = ["fever", "cough", "headache", "ache", "pain", "rash", "vomit", "nausea"]
-        if any(word in user_message.lower() for word in symptom_keywords):
-            patient_data["new_symptoms"].append(user_message)
-            save_patient_data(user_id, patient_data)
+        # Fold old turns into the running summary after responding
+        background_tasks.add_task(compact_chat_history, request.user_id)
         
-        # Generate patient summary
-        persistent_summary = generate_patient_summary(patient_data) if patient_data else "No patient history available."
-        
-        # Prepare messages for Gemini (convert to single prompt format)
-        system_context = f"""
-{DOCTOR_SYSTEM_PROMPT}
-
-You MUST always consider the following patient medical data when responding:
+        return JSONResponse(result)
+    
+    except Exception as e:
+        log_error("/chat", e)
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        await ticket.release()
 
-{persistent_summary}
+def sse_event(event: str, data: dict) -> str:
+    """Format one Server-Sent Events frame"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
 
-Instructions:
-1. **Conversational Stage**:
-   - Start by acknowledging the patient's symptoms warmly.
-   - Ask **only one question at a time** to clarify their condition.
-   - Wait for the patient's answer before asking the next question.
-   - Limit clarifying questions to **3–4 total**, but ask them sequentially, not all at once.
-   - Example:
-       - "I'm sorry you're feeling unwell. How long have you had this fever?"
-       - Wait for response, then: "Are you experiencing any chills or body aches?"
-       - And so on.
-2. **Structured Guidance Stage**:
-   - Only after 3–4 clarifying questions, provide the structured advice in the FINAL RESPONSE FORMAT.
-
-- Always factor in patient history (conditions, medications, allergies, labs).
-- Keep tone warm, empathetic, professional.
-- Never give definitive diagnoses; always use soft language.
-"""
-        
-        # Build conversation prompt
-        conversation_prompt = system_context + "\n\n=== CONVERSATION HISTORY ===\n"
-        
-        # Add previous chat history
-        for msg in chat_history:
-            role = "Patient" if msg["role"] == "user" else "Dr. HealBot"
-            conversation_prompt += f"\n{role}: {msg['content']}\n"
-        
-        # Add current user message
-        conversation_prompt += f"\nPatient: {user_message}\n\nDr. HealBot:"
-        
-        # Call Gemini API
-        model = genai.GenerativeModel('gemini-2.5-flash')
-        response = model.generate_content(
-            conversation_prompt,
-            generation_config=genai.types.GenerationConfig(
-                temperature=0.7,
-                max_output_tokens=1024,
-            )
-        )
-        
-        reply_text = response.text.strip()
-        
-        # Update chat history
-        chat_history.append({"role": "user", "content": user_message})
-        chat_history.append({"role": "assistant", "content": reply_text})
-        save_chat_history(user_id, chat_history)
-        
-        return JSONResponse({
-            "reply": reply_text,
-            "user_id": user_id,
-            "message_count": len(chat_history)
-        })
+@app.post("/chat/stream")
+async def chat_stream(request: ChatRequest, background_tasks: BackgroundTasks):
+    """
+    Streaming variant of /chat using Server-Sent Events:
+    - `delta` events carry reply text as Gemini produces it
+    - a final `done` event carries the full reply once it has been saved
+    - an `error` event is sent if generation fails mid-stream
+    The turn is only persisted when the reply completes; if the client
+    disconnects first, the upstream call is abandoned and nothing is saved.
+    """
+    user_id = request.user_id
+    user_message = request.message.strip()
     
+    # Held until the stream finishes; released by event_stream, or by the
+    # background task if the stream never started
+    ticket = await admit_chat_turn(user_id)
+    background_tasks.add_task(ticket.release)
+    try:
+        model, conversation_prompt, conversation = await prepare_chat_turn(user_id, user_message)
     except Exception as e:
-        print(f"Error in /chat: {str(e)}")
+        await ticket.release()
+        log_error("/chat/stream", e)
         raise HTTPException(status_code=500, detail=str(e))
+    
+    async def event_stream():
+        parts = []
+        completed = False
+        started = time.perf_counter()
+        try:
+            try:
+                async for chunk in gemini_client.stream(model, conversation_prompt):
+                    text = chunk.text
+                    if text and not parts:
+                        STAGE_SECONDS.labels("chat.first_token").observe(time.perf_counter() - started)
+                    if text:
+                        parts.append(text)
+                        delta = remove_emojis(text)
+                        if delta:
+                            yield sse_event("delta", {"text": delta})
+            except Exception as e:
+                if parts or not is_gemini_unavailable(e):
+                    raise
+                # Nothing sent yet: degrade to the canned reply, without recording the turn
+                print(f"Gemini unavailable for {user_id}: {type(e).__name__}")
+                completed = True
+                yield sse_event("delta", {"text": FALLBACK_REPLY})
+                yield sse_event("done", {
+                    "reply": FALLBACK_REPLY,
+                    "user_id": user_id,
+                    "message_count": conversation["message_count"],
+                    "degraded": True
+                })
+                return
+            
+            STAGE_SECONDS.labels("chat.generate").observe(time.perf_counter() - started)
+            reply_text = remove_emojis("".join(parts)).strip()
+            await record_chat_turn(user_id, conversation, user_message, reply_text, request.language)
+            background_tasks.add_task(compact_chat_history, user_id)
+            completed = True
+            yield sse_event("done", {
+                "reply": reply_text,
+                "user_id": user_id,
+                "message_count": conversation["message_count"]
+            })
+        except Exception as e:
+            log_error("/chat/stream", e)
+            yield sse_event("error", {"detail": str(e)})
+        finally:
+            # Runs on errors and when the client disconnects (generator closed)
+            await ticket.release()
+            if not completed:
+                print(f"/chat/stream for {user_id} ended before the reply completed; turn not saved")
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=background_tasks
+    )
 
 # ==================== CHAT HISTORY ENDPOINTS ====================
 @app.get("/chat-history/{user_id}")
-async def get_chat_history(user_id: str):
-    """Get chat history for a user"""
+async def get_chat_history(user_id: str, cursor: int = None, limit: int = None):
+    """
+    Get chat history for a user.
+    Without `limit` the whole conversation is returned; with `limit`, pass the
+    returned `next_cursor` back as `cursor` to fetch the following page.
+    """
     try:
-        history = load_chat_history(user_id)
+        if limit is not None and limit <= 0:
+            raise HTTPException(status_code=400, detail="limit must be positive")
+        page = await load_chat_history(user_id, cursor=cursor, limit=limit)
         return JSONResponse({
             "user_id": user_id,
-            "chat_history": history,
-            "message_count": len(history)
+            "chat_history": page["messages"],
+            "message_count": page["message_count"],
+            "next_cursor": page["next_cursor"]
         })
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -480,7 +2785,7 @@ async def get_chat_history(user_id: str):
 async def clear_chat_history(user_id: str):
     """Clear chat history for a user"""
     try:
-        delete_chat_history(user_id)
+        await storage.delete_chat_history(user_id)
         return JSONResponse({"message": "Chat history cleared", "user_id": user_id})
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -488,15 +2793,21 @@ async def clear_chat_history(user_id: str):
 # ==================== PATIENT DATA ENDPOINTS ====================
 @app.post("/patient-data/{user_id}")
 async def save_patient(user_id: str, data: PatientData):
-    """Save patient profile and lab test results"""
+    """Save patient profile and lab test results (normalized and indexed, see LAB RESULTS)"""
+    try:
+        lab_test_results, abnormal_labs, abnormal_index = normalize_lab_results(data.lab_test_results)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     try:
         patient_info = {
             "name": data.name,
             "patient_profile": data.patient_profile,
-            "lab_test_results": data.lab_test_results,
+            "lab_test_results": lab_test_results,
+            "abnormal_labs": abnormal_labs,
+            "abnormal_index": abnormal_index,
             "last_updated": datetime.now().isoformat()
         }
-        save_patient_data(user_id, patient_info)
+        await save_patient_data(user_id, patient_info)
         return JSONResponse({
             "message": "Patient data saved successfully",
             "user_id": user_id
@@ -508,13 +2819,37 @@ async def save_patient(user_id: str, data: PatientData):
 async def get_patient(user_id: str):
     """Get patient data"""
     try:
-        data = load_patient_data(user_id)
+        data = await load_patient_data(user_id)
         if data:
             return JSONResponse(data)
         return JSONResponse({"message": "No patient data found"}, status_code=404)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/patient-data/{user_id}/symptoms")
+async def get_symptoms(user_id: str):
+    """Get the symptom log, oldest report first"""
+    try:
+        events = await storage.load_symptom_events(user_id)
+        return JSONResponse({"user_id": user_id, "symptoms": events})
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/lab-results/abnormal")
+async def find_abnormal_lab_results(test: str, status: LabStatus = None, limit: int = LAB_QUERY_LIMIT):
+    """
+    Patients with an abnormal result for `test`, e.g. ?test=creatinine&status=high.
+    Without `status`, any abnormal status matches.
+    """
+    if status in NON_ABNORMAL_LAB_STATUSES:
+        raise HTTPException(status_code=400, detail=f"status must be an abnormal status, not '{status.value}'")
+    try:
+        token = lab_index_token(test, status.value if status else None)
+        patients = await storage.find_patients_by_lab(token, max(1, min(limit, LAB_QUERY_MAX_LIMIT)))
+        return JSONResponse({"test": test, "status": status.value if status else None, "patients": patients})
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.get("/patient-summary/{user_id}")
 async def get_patient_summary(user_id: str, format: str = "markdown"):
     """
@@ -522,74 +2857,728 @@ async def get_patient_summary(user_id: str, format: str = "markdown"):
     Supports Markdown (default) or HTML output.
     """
     try:
-        data = load_patient_data(user_id)
+        data = await load_patient_data(user_id)
         if not data:
             return JSONResponse({"summary": "No patient data available"})
         
-        if format.lower() == "html":
-            summary = generate_patient_summary_html(data)
-        else:
-            summary = generate_patient_summary(data)
+        with stage("patient_summary.render"):
+            summary = render_patient_summary(user_id, data, "html" if format.lower() == "html" else "markdown")
         
         return JSONResponse({"summary": summary, "raw_data": data})
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+# ==================== TTS AUDIO CACHE ====================
+class AudioCache:
+    """
+    Content-addressed store for synthesized audio.
+    Entries live on disk with size-based LRU eviction (access time is kept in
+    the file mtime so it survives restarts); small entries are also kept in an
+    in-memory LRU tier. Concurrent misses for one key share a single synthesis.
+    Disk reads and writes run on the "disk" pool threads; the disk index is
+    only touched under _disk_lock, and file I/O happens outside it.
+    Several worker processes can share the directory: a key missing from the
+    index is still looked up on disk, and the index is rebuilt from a
+    directory scan before evicting and after every RESCAN_SHARE of max_bytes
+    written, so the size limit covers every worker's files (each worker can
+    overshoot it by at most that share between scans).
+    """
+    RESCAN_SHARE = 0.05
+    # Evict down to this share of max_bytes, so a full cache isn't rescanned on every write
+    EVICT_TO = 0.9
+
+    def __init__(self, directory: str, max_bytes: int, memory_max_bytes: int, memory_entry_max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.memory_max_bytes = memory_max_bytes
+        self.memory_entry_max_bytes = memory_entry_max_bytes
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._disk_index = None  # key -> (size, last_access), built on first use
+        self._disk_bytes = 0
+        self._written_since_scan = 0
+        self._disk_lock = threading.Lock()
+        self._inflight = {}
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(text: str, language_code: str, audio_format: str) -> str:
+        return hashlib.sha256(f"{audio_format}\0{language_code}\0{text}".encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key)
+
+    def _load_index(self):
+        """Blocking; call with _disk_lock held"""
+        os.makedirs(self.directory, exist_ok=True)
+        index = {}
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and not entry.name.endswith(".tmp"):
+                try:
+                    st = entry.stat()
+                except FileNotFoundError:
+                    continue  # evicted while scanning
+                index[entry.name] = (st.st_size, st.st_mtime)
+        self._disk_index = index
+        self._disk_bytes = sum(size for size, _ in index.values())
+        self._written_since_scan = 0
+
+    def _read_disk(self, key: str):
+        # Not checked against the index: another worker may have written the entry
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)
+        except FileNotFoundError:
+            # Evicted by another thread, or another worker sharing the directory
+            with self._disk_lock:
+                entry = (self._disk_index or {}).pop(key, None)
+                if entry is not None:
+                    self._disk_bytes -= entry[0]
+            return None
+        with self._disk_lock:
+            if self._disk_index is None:
+                self._load_index()
+            # The file may have been rewritten since it was indexed, or written
+            # by another worker after the last scan
+            previous = self._disk_index.get(key)
+            self._disk_bytes += len(data) - (previous[0] if previous else 0)
+            self._disk_index[key] = (len(data), time.time())
+        return data
+
+    def _write_disk(self, key: str, data: bytes):
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with self._disk_lock:
+            if self._disk_index is None:
+                self._load_index()
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+        # Pick the evictions under the lock; delete the files after releasing it
+        evicted = []
+        with self._disk_lock:
+            previous = self._disk_index.get(key)
+            if previous is not None:
+                self._disk_bytes -= previous[0]
+            self._disk_index[key] = (len(data), time.time())
+            self._disk_bytes += len(data)
+            self._written_since_scan += len(data)
+
+            if self._disk_bytes > self.max_bytes or self._written_since_scan > self.max_bytes * self.RESCAN_SHARE:
+                # Count the files other workers wrote since the last scan
+                self._load_index()
+            if self._disk_bytes > self.max_bytes:
+                target = self.max_bytes * self.EVICT_TO
+                for old_key, (size, _) in sorted(self._disk_index.items(), key=lambda item: item[1][1]):
+                    if self._disk_bytes <= target:
+                        break
+                    if old_key == key:
+                        continue
+                    del self._disk_index[old_key]
+                    self._disk_bytes -= size
+                    self.evictions += 1
+                    evicted.append(old_key)
+        for old_key in evicted:
+            try:
+                os.remove(self._path(old_key))
+            except FileNotFoundError:
+                pass
+
+    def _remember(self, key: str, data: bytes):
+        if not self.memory_max_bytes or len(data) > self.memory_entry_max_bytes:
+            return
+        if key in self._memory:
+            self._memory_bytes -= len(self._memory.pop(key))
+        self._memory[key] = data
+        self._memory_bytes += len(data)
+        while self._memory_bytes > self.memory_max_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+
+    async def get(self, key: str):
+        """Return (data, tier) for a cached entry, or (None, None)"""
+        data = self._memory.get(key)
+        if data is not None:
+            self._memory.move_to_end(key)
+            self.memory_hits += 1
+            return data, "memory"
+        data = await run_blocking("disk", self._read_disk, key)
+        if data is not None:
+            self.disk_hits += 1
+            self._remember(key, data)
+            return data, "disk"
+        return None, None
+
+    async def _create(self, key: str, factory):
+        data = await factory()
+        await run_blocking("disk", self._write_disk, key, data)
+        self._remember(key, data)
+        return data
+
+    async def get_or_create(self, key: str, factory):
+        """
+        Return (data, source) where source is "memory", "disk", "coalesced" or
+        "synthesized". factory is an async callable producing the audio bytes.
+        """
+        data, tier = await self.get(key)
+        if data is not None:
+            CACHE_REQUESTS.labels("tts", tier).inc()
+            return data, tier
+
+        task = self._inflight.get(key)
+        if task is None:
+            self.misses += 1
+            task = asyncio.ensure_future(self._create(key, factory))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+            source = "synthesized"
+        else:
+            self.coalesced += 1
+            source = "coalesced"
+        CACHE_REQUESTS.labels("tts", "miss" if source == "synthesized" else source).inc()
+        # shield: a disconnecting client must not cancel a synthesis others wait on
+        return await asyncio.shield(task), source
+
+    def stats(self) -> dict:
+        lookups = self.memory_hits + self.disk_hits + self.misses + self.coalesced
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+            "hit_rate": round((self.memory_hits + self.disk_hits) / lookups, 4) if lookups else 0.0,
+            "memory_bytes": self._memory_bytes,
+            "disk_bytes": self._disk_bytes,
+            "disk_entries": len(self._disk_index or {}),
+        }
+
+TTS_CACHE_DIR = os.getenv("TTS_CACHE_DIR", os.path.join(tempfile.gettempdir(), "healbot_tts_cache"))
+tts_cache = AudioCache(
+    TTS_CACHE_DIR,
+    max_bytes=int(os.getenv("TTS_CACHE_MAX_MB", "512")) * 1024 * 1024,
+    memory_max_bytes=int(os.getenv("TTS_MEMORY_CACHE_MB", "32")) * 1024 * 1024,
+    memory_entry_max_bytes=int(os.getenv("TTS_MEMORY_ENTRY_MAX_KB", "2048")) * 1024,
+)
+
 # ==================== TTS ENDPOINT ====================
+# Output formats: mp3 is gTTS's native output and is passed through untouched;
+# the others are transcoded by ffmpeg over stdin/stdout pipes (no temp files).
+TTS_FORMATS = {
+    "mp3": {"media_type": "audio/mpeg", "extension": "mp3", "ffmpeg_args": None},
+    "opus": {"media_type": "audio/ogg", "extension": "ogg",
+             "ffmpeg_args": ["-c:a", "libopus", "-b:a", "32k", "-f", "ogg"]},
+    "wav": {"media_type": "audio/wav", "extension": "wav",
+            "ffmpeg_args": ["-ar", "44100", "-ac", "2", "-f", "wav"]},
+}
+TTS_OUTPUT_FORMAT = os.getenv("TTS_OUTPUT_FORMAT", "mp3")
+# A full chat reply (1024 output tokens) with its markdown fits comfortably
+TTS_MAX_CHARS = int(os.getenv("TTS_MAX_CHARS", "8000"))
+
+def check_tts_text_length(text: str):
+    if len(text) > TTS_MAX_CHARS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Text too long for speech ({len(text)} characters, limit {TTS_MAX_CHARS})"
+        )
+
+def synthesize_speech_mp3_blocking(text: str, language_code: str) -> bytes:
+    buffer = io.BytesIO()
+    gtts.gTTS(text=text, lang=language_code).write_to_fp(buffer)
+    return buffer.getvalue()
+
+async def synthesize_speech_mp3(text: str, language_code: str) -> bytes:
+    """Synthesize text with gTTS straight into memory"""
+    with stage("tts.synthesize"):
+        return await run_blocking("tts", synthesize_speech_mp3_blocking, text, language_code)
+
+async def transcode_audio(data: bytes, ffmpeg_args: list, input_path: str = None) -> bytes:
+    """
+    Transcode audio through ffmpeg, bounded by the ffmpeg concurrency limit.
+    Input comes from stdin, or from input_path for containers that need seeking.
+    """
+    async with dependency_semaphores["ffmpeg"]:
+        proc = await asyncio.create_subprocess_exec(
+            "ffmpeg", "-loglevel", "error", "-i", input_path or "pipe:0", *ffmpeg_args, "pipe:1",
+            stdin=asyncio.subprocess.DEVNULL if input_path else asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE
+        )
+        try:
+            output, errors = await proc.communicate(input=None if input_path else data)
+        except asyncio.CancelledError:
+            proc.kill()
+            raise
+    if proc.returncode != 0:
+        raise RuntimeError(f"ffmpeg exited with status {proc.returncode}: {errors.decode(errors='ignore').strip()}")
+    return output
+
+async def synthesize_speech(text: str, language_code: str, audio_format: str) -> bytes:
+    """Synthesize text in the requested output format"""
+    mp3 = await synthesize_speech_mp3(text, language_code)
+    ffmpeg_args = TTS_FORMATS[audio_format]["ffmpeg_args"]
+    if ffmpeg_args is None:
+        return mp3
+    with stage("tts.transcode"):
+        return await transcode_audio(mp3, ffmpeg_args)
+
 @app.post("/tts")
 async def text_to_speech(req: TTSRequest):
     try:
-        # Remove emojis from the input text
-        clean_text = remove_emojis(req.text)
-
-        tmp_mp3 = tempfile.NamedTemporaryFile(delete=False, suffix=".mp3")
-        tts = gTTS(text=clean_text, lang=req.language_code)
-        tts.save(tmp_mp3.name)
-
-        tmp_wav = tempfile.NamedTemporaryFile(delete=False, suffix=".wav")
-        subprocess.run(
-            ["ffmpeg", "-y", "-i", tmp_mp3.name, "-ar", "44100", "-ac", "2", tmp_wav.name],
-            stdout=subprocess.DEVNULL,
-            stderr=subprocess.DEVNULL
-        )
+        audio_format = (req.format or TTS_OUTPUT_FORMAT).lower()
+        if audio_format not in TTS_FORMATS:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Unsupported format '{audio_format}', expected one of: {', '.join(TTS_FORMATS)}"
+            )
+        fmt = TTS_FORMATS[audio_format]
+        check_tts_text_length(req.text)
+
+        # Remove emojis and markdown and collapse whitespace so equivalent texts share a cache entry
+        clean_text = " ".join(speech_text(req.text).split())
+        if not clean_text:
+            raise HTTPException(status_code=400, detail="No speakable text")
 
-        # Delete temporary mp3
-        os.remove(tmp_mp3.name)
+        key = AudioCache.make_key(clean_text, req.language_code, audio_format)
+        audio, source = await tts_cache.get_or_create(
+            key, lambda: synthesize_speech(clean_text, req.language_code, audio_format)
+        )
 
-        return FileResponse(tmp_wav.name, media_type="audio/wav", filename="speech.wav")
+        return Response(
+            content=audio,
+            media_type=fmt["media_type"],
+            headers={
+                "Content-Disposition": f'attachment; filename="speech.{fmt["extension"]}"',
+                "X-TTS-Cache": source
+            }
+        )
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+# ==================== STREAMING TTS ENDPOINT ====================
+# Long replies are split at sentence boundaries and synthesized a few segments
+# ahead of playback. MP3 frames can be concatenated, so segments are streamed
+# back in order as soon as each one is ready.
+TTS_STREAM_PREFETCH = int(os.getenv("TTS_STREAM_PREFETCH", "4"))
+TTS_SEGMENT_MIN_CHARS = int(os.getenv("TTS_SEGMENT_MIN_CHARS", "40"))
+
+# ".", "!", "?" and "…" only end a sentence before whitespace or the end of the
+# text, so "2.5 mg" and "38.5 degrees" stay in one segment; the CJK, Arabic and
+# Devanagari marks aren't followed by a space.
+SENTENCE_PATTERN = re.compile(r"(?:[^.!?…。！？؟।\n]|[.!?…]+(?!\s|$))+(?:[.!?…]+(?=\s|$)|[。！？؟।]+|\n+|$)")
+
+def split_sentences(text: str, min_chars: int = TTS_SEGMENT_MIN_CHARS) -> list:
+    """Split text into sentence segments, merging very short ones into the next"""
+    segments = []
+    current = ""
+    for match in SENTENCE_PATTERN.finditer(text):
+        sentence = " ".join(match.group(0).split())
+        if not sentence:
+            continue
+        current = f"{current} {sentence}" if current else sentence
+        if len(current) >= min_chars:
+            segments.append(current)
+            current = ""
+    if current:
+        segments.append(current)
+    return segments
+
+async def synthesize_segment_mp3(text: str, language_code: str) -> bytes:
+    key = AudioCache.make_key(text, language_code, "mp3")
+    audio, _ = await tts_cache.get_or_create(key, lambda: synthesize_speech_mp3(text, language_code))
+    return audio
+
+async def stream_speech(segments: list, language_code: str):
+    """Yield MP3 audio per segment, in order, keeping up to TTS_STREAM_PREFETCH in flight"""
+    remaining = iter(segments)
+    in_flight = deque()
+
+    def launch_next():
+        segment = next(remaining, None)
+        if segment is not None:
+            in_flight.append(asyncio.ensure_future(synthesize_segment_mp3(segment, language_code)))
+
+    for _ in range(max(TTS_STREAM_PREFETCH, 1)):
+        launch_next()
+    try:
+        while in_flight:
+            audio = await in_flight.popleft()
+            launch_next()
+            yield audio
+    except Exception as e:
+        # Headers are already sent, so end the stream early rather than fail it
+        log_error("/tts/stream", e)
+    finally:
+        # Client went away or synthesis failed: stop waiting on the rest
+        for task in in_flight:
+            task.cancel()
+
+def streaming_tts_response(text: str, language_code: str) -> StreamingResponse:
+    check_tts_text_length(text)
+    clean_text = speech_text(text)
+    segments = split_sentences(clean_text)
+    if not segments:
+        raise HTTPException(status_code=400, detail="No speakable text")
+    return StreamingResponse(
+        stream_speech(segments, language_code),
+        media_type="audio/mpeg",
+        headers={"Cache-Control": "no-store", "X-TTS-Segments": str(len(segments))}
+    )
+
+@app.post("/tts/stream")
+async def text_to_speech_stream(req: TTSRequest):
+    """Chunked MP3 stream of the text, synthesized sentence by sentence"""
+    return streaming_tts_response(req.text, req.language_code)
+
+
+# ==================== STT BACKENDS ====================
+
+STT_PARTIAL_INTERVAL = float(os.getenv("STT_PARTIAL_INTERVAL", "2.0"))
+STT_SEGMENT_MAX_SECONDS = float(os.getenv("STT_SEGMENT_MAX_SECONDS", "15"))
+STT_SILENCE_SECONDS = float(os.getenv("STT_SILENCE_SECONDS", "0.5"))
+STT_SILENCE_LEVEL = int(os.getenv("STT_SILENCE_LEVEL", "300"))  # peak amplitude of 16-bit PCM
+
+class BufferedSTTStream:
+    """
+    Incremental session for engines without a streaming API. PCM frames are
+    buffered and cut into segments at pauses of STT_SILENCE_SECONDS (or every
+    STT_SEGMENT_MAX_SECONDS of speech); each finished segment is transcribed
+    once. Partials, after every STT_PARTIAL_INTERVAL seconds of new audio,
+    transcribe only the unfinished tail, so engine traffic grows linearly
+    with the length of the stream.
+    """
+    FRAME_SECONDS = 0.03
+
+    def __init__(self, backend, sample_rate: int, language: str):
+        self.backend = backend
+        self.sample_rate = sample_rate
+        self.language = language
+        self.segments = []
+        self.buffer = bytearray()
+        self._unreported = 0
+        self._frame_bytes = max(1, int(sample_rate * self.FRAME_SECONDS)) * 2
+        self._scanned = 0
+        self._quiet = 0
+        self._heard = False
+        self._cut = 0
+        self._cut_heard = False
+        self._heard_after_cut = False
+
+    def _transcribe(self, pcm) -> str:
+        return self.backend.transcribe(sr.AudioData(bytes(pcm), self.sample_rate, 2), self.language)
+
+    def _scan(self):
+        """Classify the new frames; self._cut marks the end of the latest pause"""
+        min_quiet = STT_SILENCE_SECONDS * self.sample_rate * 2
+        while self._scanned + self._frame_bytes <= len(self.buffer):
+            samples = array("h", self.buffer[self._scanned:self._scanned + self._frame_bytes])
+            if sys.byteorder == "big":
+                samples.byteswap()
+            self._scanned += self._frame_bytes
+            if max(samples) - min(samples) < 2 * STT_SILENCE_LEVEL:
+                self._quiet += self._frame_bytes
+                if self._quiet >= min_quiet:
+                    if not self._cut:
+                        self._cut_heard = self._heard
+                    elif self._heard_after_cut:
+                        self._cut_heard = True
+                    self._cut = self._scanned
+                    self._heard_after_cut = False
+            else:
+                self._quiet = 0
+                self._heard = True
+                self._heard_after_cut = True
+
+    def _commit(self):
+        """Transcribe the audio before the latest pause once and drop it from the buffer"""
+        if not self._cut and len(self.buffer) >= STT_SEGMENT_MAX_SECONDS * self.sample_rate * 2:
+            self._cut, self._cut_heard, self._heard_after_cut = self._scanned, self._heard, False
+        if not self._cut:
+            return
+        if self._cut_heard:
+            try:
+                self.segments.append(self._transcribe(self.buffer[:self._cut]))
+            except sr.UnknownValueError:
+                pass
+        del self.buffer[:self._cut]
+        self._scanned -= self._cut
+        self._heard = self._heard_after_cut
+        self._cut = 0
+
+    def accept(self, pcm: bytes):
+        """Add 16-bit mono PCM; returns a partial transcript or None. Blocking."""
+        self.buffer.extend(pcm)
+        self._unreported += len(pcm)
+        if not STT_PARTIAL_INTERVAL or self._unreported < STT_PARTIAL_INTERVAL * self.sample_rate * 2:
+            return None
+        self._unreported = 0
+        self._scan()
+        try:
+            self._commit()
+            tail = self._transcribe(self.buffer) if self._heard else None
+        except sr.UnknownValueError:
+            tail = None
+        except sr.RequestError as e:
+            # A failed partial doesn't end the session: the audio stays
+            # buffered and is retried by the next partial or by finish()
+            log_error("/ws/stt partial", e)
+            return None
+        return " ".join(self.segments + ([tail] if tail else [])) or None
+
+    def finish(self) -> str:
+        """Final transcript of everything received. Blocking."""
+        self._scan()
+        if self.buffer and (self._heard or not self.segments):
+            try:
+                self.segments.append(self._transcribe(self.buffer))
+            except sr.UnknownValueError:
+                pass
+        self.buffer.clear()
+        if not self.segments:
+            raise sr.UnknownValueError()
+        return " ".join(self.segments)
+
+class STTBackend:
+    """
+    Speech-to-text engine. load() runs once at startup; transcribe() is
+    blocking and runs on the STT pool. Both raise sr.UnknownValueError when
+    nothing intelligible was heard and sr.RequestError when the engine fails.
+    create_stream() returns an incremental session used by /ws/stt.
+    """
+    name = "base"
+
+    def load(self):
+        pass
+
+    def transcribe(self, audio: "sr.AudioData", language: str) -> str:
+        raise NotImplementedError
+
+    def create_stream(self, sample_rate: int, language: str):
+        return BufferedSTTStream(self, sample_rate, language)
+
+class GoogleWebSTT(STTBackend):
+    """Google's free web speech API (network round trip, rate-limited)"""
+    name = "google"
+
+    def transcribe(self, audio: "sr.AudioData", language: str) -> str:
+        return recognizer.recognize_google(audio, language=language)
+
+class SphinxSTT(STTBackend):
+    """Offline CMU PocketSphinx through SpeechRecognition (pip install pocketsphinx)"""
+    name = "sphinx"
+
+    def load(self):
+        try:
+            import pocketsphinx  # noqa: F401
+        except ImportError:
+            raise RuntimeError("STT_BACKEND=sphinx requires the pocketsphinx package")
+
+    def transcribe(self, audio: "sr.AudioData", language: str) -> str:
+        return recognizer.recognize_sphinx(audio, language=language)
+
+class VoskSTT(STTBackend):
+    """Offline Kaldi-based Vosk engine (pip install vosk, model dir in VOSK_MODEL_PATH)"""
+    name = "vosk"
+    sample_rate = 16000
+
+    def __init__(self):
+        self.model = None
+
+    def load(self):
+        try:
+            import vosk
+        except ImportError:
+            raise RuntimeError("STT_BACKEND=vosk requires the vosk package")
+        model_path = os.getenv("VOSK_MODEL_PATH", "models/vosk")
+        if not os.path.isdir(model_path):
+            raise RuntimeError(f"Vosk model directory not found: {model_path}")
+        vosk.SetLogLevel(-1)
+        self.model = vosk.Model(model_path)
+
+    def transcribe(self, audio: "sr.AudioData", language: str) -> str:
+        import vosk
+        # The model is language-specific; `language` is ignored
+        rec = vosk.KaldiRecognizer(self.model, self.sample_rate)
+        rec.AcceptWaveform(audio.get_raw_data(convert_rate=self.sample_rate, convert_width=2))
+        text = json.loads(rec.FinalResult()).get("text", "").strip()
+        if not text:
+            raise sr.UnknownValueError()
+        return text
+
+    def create_stream(self, sample_rate: int, language: str):
+        return VoskSTTStream(self.model, sample_rate)
+
+class VoskSTTStream:
+    """Native incremental Vosk session: every frame yields a partial for free"""
+    def __init__(self, model, sample_rate: int):
+        import vosk
+        self.recognizer = vosk.KaldiRecognizer(model, sample_rate)
+        self.segments = []
+
+    def accept(self, pcm: bytes):
+        if self.recognizer.AcceptWaveform(pcm):
+            text = json.loads(self.recognizer.Result()).get("text", "")
+            if text:
+                self.segments.append(text)
+            return " ".join(self.segments) or None
+        partial = json.loads(self.recognizer.PartialResult()).get("partial", "")
+        return " ".join(self.segments + [partial]).strip() or None
+
+    def finish(self) -> str:
+        text = json.loads(self.recognizer.FinalResult()).get("text", "")
+        final = " ".join(self.segments + [text]).strip()
+        if not final:
+            raise sr.UnknownValueError()
+        return final
+
+STT_BACKENDS = {backend.name: backend for backend in (GoogleWebSTT, SphinxSTT, VoskSTT)}
+STT_BACKEND = os.getenv("STT_BACKEND", "google")
+if STT_BACKEND not in STT_BACKENDS:
+    raise ValueError(f"Unknown STT_BACKEND '{STT_BACKEND}', expected one of: {', '.join(STT_BACKENDS)}")
+stt_backend = STT_BACKENDS[STT_BACKEND]()
+
 # ==================== STT ENDPOINT ====================
-# Initialize speech recognizer
-recognizer = sr.Recognizer()
+
+STT_SAMPLE_RATE = 16000
+STT_PCM_ARGS = ["-ac", "1", "-ar", str(STT_SAMPLE_RATE), "-f", "s16le"]
+
+def is_native_audio(data: bytes) -> bool:
+    """WAV, AIFF and FLAC can be read by sr.AudioFile straight from memory"""
+    return (data[:4] == b"RIFF" and data[8:12] == b"WAVE") or data[:4] in (b"FORM", b"fLaC")
+
+def is_mp4_container(data: bytes) -> bool:
+    """MP4/M4A/3GP keep their index at the end, so ffmpeg needs a seekable file"""
+    return data[4:8] == b"ftyp"
+
+def read_audio_data(data: bytes) -> "sr.AudioData":
+    with sr.AudioFile(io.BytesIO(data)) as source:
+        return recognizer.record(source)
+
+async def decode_audio(data: bytes) -> "sr.AudioData":
+    """Decode an uploaded clip into AudioData, using scratch space only for MP4 containers"""
+    if is_native_audio(data):
+        return await run_blocking("stt", read_audio_data, data)
+
+    try:
+        if is_mp4_container(data):
+            path = await run_blocking("disk", scratch_space.write, data, ".m4a")
+            try:
+                pcm = await transcode_audio(b"", STT_PCM_ARGS, input_path=path)
+            finally:
+                await run_blocking("disk", scratch_space.release, path)
+        else:
+            # WebM/Ogg from MediaRecorder, MP3, ...: decode over pipes
+            pcm = await transcode_audio(data, STT_PCM_ARGS)
+    except RuntimeError as e:
+        raise HTTPException(status_code=400, detail=f"Unsupported or corrupt audio: {str(e)}")
+    return sr.AudioData(pcm, STT_SAMPLE_RATE, 2)
 
 @app.post("/stt")
-async def speech_to_text(file: UploadFile = File(...)):
+async def speech_to_text(file: UploadFile = File(...), language: str = Form("en-US")):
     try:
-        # Save uploaded file temporarily
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".wav") as tmp:
-            tmp.write(await file.read())
-            tmp_path = tmp.name
-        
-        # Use speech_recognition library with Google's free API
-        with sr.AudioFile(tmp_path) as source:
-            audio_data = recognizer.record(source)
-            # Use Google Speech Recognition (free, no API key needed)
-            transcript = recognizer.recognize_google(audio_data)
+        with stage("stt.decode"):
+            audio_data = await decode_audio(await file.read())
         
-        # Clean up temp file
-        os.remove(tmp_path)
+        # Transcribe with the configured STT backend, off the event loop
+        with stage("stt.transcribe"):
+            transcript = await run_blocking("stt", stt_backend.transcribe, audio_data, language)
         
         return JSONResponse({"transcript": transcript})
+    except HTTPException:
+        raise
     except sr.UnknownValueError:
         raise HTTPException(status_code=400, detail="Could not understand audio")
     except sr.RequestError as e:
         raise HTTPException(status_code=500, detail=f"Speech recognition service error: {str(e)}")
     except Exception as e:
-        print(f"Error in STT: {str(e)}")
+        log_error("/stt", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 
+# ==================== STREAMING STT (WEBSOCKET) ====================
+STT_STREAM_MAX_SECONDS = float(os.getenv("STT_STREAM_MAX_SECONDS", "120"))
+
+@app.websocket("/ws/stt")
+async def speech_to_text_stream(websocket: WebSocket, language: str = "en-US", sample_rate: int = 16000):
+    """
+    Incremental speech-to-text.
+    Client -> server: binary frames of 16-bit little-endian mono PCM at
+    `sample_rate`, then a text frame {"event": "end"}. Adding
+    "chat": {"user_id": ...} to the end event runs a /chat turn with the
+    final transcript.
+    Server -> client: {"type": "partial"|"final"|"reply"|"error", ...}
+    """
+    await websocket.accept()
+    stream = stt_backend.create_stream(sample_rate, language)
+    max_bytes = int(STT_STREAM_MAX_SECONDS * sample_rate * 2)
+    received = 0
+    last_partial = None
+    
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                return
+            if message.get("bytes"):
+                received += len(message["bytes"])
+                if received > max_bytes:
+                    await websocket.send_json({"type": "error", "detail": "Audio stream too long"})
+                    await websocket.close(code=1009)
+                    return
+                partial = await run_blocking("stt", stream.accept, message["bytes"])
+                if partial and partial != last_partial:
+                    last_partial = partial
+                    await websocket.send_json({"type": "partial", "text": partial})
+            elif message.get("text"):
+                control = json.loads(message["text"])
+                if control.get("event") == "end":
+                    break
+        
+        try:
+            transcript = await run_blocking("stt", stream.finish)
+        except sr.UnknownValueError:
+            await websocket.send_json({"type": "error", "detail": "Could not understand audio"})
+            await websocket.close()
+            return
+        await websocket.send_json({"type": "final", "text": transcript})
+        
+        chat_request = control.get("chat")
+        if chat_request and chat_request.get("user_id"):
+            try:
+                ticket = await admit_chat_turn(chat_request["user_id"])
+            except HTTPException as e:
+                await websocket.send_json({
+                    "type": "error",
+                    "detail": e.detail,
+                    "retry_after": int(e.headers["Retry-After"])
+                })
+                await websocket.close()
+                return
+            try:
+                result = await generate_chat_reply(chat_request["user_id"], transcript, language)
+            finally:
+                await ticket.release()
+            await websocket.send_json({"type": "reply", **result})
+            await compact_chat_history(chat_request["user_id"])
+        
+        await websocket.close()
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        log_error("/ws/stt", e)
+        try:
+            await websocket.send_json({"type": "error", "detail": str(e)})
+            await websocket.close(code=1011)
+        except Exception:
+            pass
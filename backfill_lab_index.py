@@ -0,0 +1,47 @@
+"""
+Lab Index Backfill Script
+Normalizes the lab_test_results of every patient document saved before lab
+results were indexed and adds its abnormal_labs and abnormal_index, so
+/lab-results/abnormal finds those patients too. Documents that already have
+an abnormal_index are left alone, so this script is safe to run more than
+once. Uses the configured STORAGE_BACKEND.
+"""
+
+import asyncio
+
+from backend import normalize_lab_results, storage
+
+
+async def backfill_all():
+    backfilled = 0
+    skipped = 0
+    failed = 0
+    async for user_id, data in storage.iter_patients():
+        if "abnormal_index" in data:
+            skipped += 1
+            continue
+        try:
+            lab_test_results, abnormal_labs, abnormal_index = normalize_lab_results(data.get("lab_test_results") or {})
+        except ValueError as e:
+            failed += 1
+            print(f"❌ {user_id}: {str(e)}")
+            continue
+        data.update(lab_test_results=lab_test_results, abnormal_labs=abnormal_labs, abnormal_index=abnormal_index)
+        # Written as is: last_updated stays the time the patient data last changed
+        await storage.save_patient(user_id, data)
+        backfilled += 1
+        print(f"✅ Backfilled {user_id} ({len(abnormal_labs)} abnormal results)")
+    return backfilled, skipped, failed
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("Dr. HealBot - Lab Index Backfill")
+    print("=" * 60)
+
+    storage.init()
+    backfilled, skipped, failed = asyncio.run(backfill_all())
+
+    print("\n" + "=" * 60)
+    print(f"✅ Backfill complete: {backfilled} backfilled, {skipped} already up to date, {failed} failed")
+    print("=" * 60)
@@ -0,0 +1,164 @@
+"""
+Admission Control Benchmark
+Checks and times the chat admission backends: InProcessAdmission and
+RedisAdmission, the latter against benchmarks/fake_redis.py started by this
+script (needs the fakeredis package).
+
+Each backend must
+- admit queued turns for one user in arrival order
+- reject turns beyond CHAT_USER_QUEUE_DEPTH, and turns that wait longer than
+  CHAT_USER_WAIT, without blocking the turns after them
+- reject chat turns beyond CHAT_MAX_INFLIGHT
+and RedisAdmission must skip the turn of a worker that died. The script
+exits 1 if any check fails, then prints turns/sec admitted for one busy
+user and for many users.
+
+Usage:
+    python benchmarks/bench_admission.py --turns 2000
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(0, os.path.join(ROOT_DIR, "benchmarks"))
+
+from backend import AdmissionRejected, InProcessAdmission, RedisAdmission
+
+import fake_redis
+
+QUEUE_DEPTH = 8
+
+
+def make_admission(backend: str, redis_url: str, max_inflight: int = 1000, user_wait: float = 5.0):
+    if backend == "redis":
+        return RedisAdmission(redis_url, max_inflight, QUEUE_DEPTH, user_wait, lease=120)
+    return InProcessAdmission(max_inflight, QUEUE_DEPTH, user_wait)
+
+
+def fail(message: str):
+    print(f"❌ {message}")
+    sys.exit(1)
+
+
+async def check_arrival_order(admission, user_id: str):
+    order = []
+
+    async def turn(i: int):
+        token = await admission.acquire_user(user_id)
+        order.append(i)
+        await asyncio.sleep(0.01)
+        await admission.release_user(user_id, token)
+
+    tasks = []
+    for i in range(QUEUE_DEPTH + 1):
+        tasks.append(asyncio.create_task(turn(i)))
+        await asyncio.sleep(0.01)
+    await asyncio.gather(*tasks)
+    if order != sorted(order):
+        fail(f"turns admitted out of arrival order: {order}")
+
+
+async def check_queue_depth(admission, user_id: str):
+    async def waiter():
+        await admission.release_user(user_id, await admission.acquire_user(user_id))
+
+    holder = await admission.acquire_user(user_id)
+    waiters = [asyncio.create_task(waiter()) for _ in range(QUEUE_DEPTH)]
+    await asyncio.sleep(0.1)
+    try:
+        await admission.acquire_user(user_id)
+        fail("a turn beyond the queue depth was admitted")
+    except AdmissionRejected:
+        pass
+    await admission.release_user(user_id, holder)
+    await asyncio.wait_for(asyncio.gather(*waiters), 5)
+
+
+async def check_wait_timeout(admission, user_id: str):
+    holder = await admission.acquire_user(user_id)
+    admission.user_wait = 0.2
+    try:
+        await admission.acquire_user(user_id)
+        fail("a turn waited longer than CHAT_USER_WAIT")
+    except AdmissionRejected:
+        pass
+    finally:
+        admission.user_wait = 5.0
+    await admission.release_user(user_id, holder)
+    # The abandoned turn must not block the next one
+    token = await asyncio.wait_for(admission.acquire_user(user_id), 1)
+    await admission.release_user(user_id, token)
+
+
+async def check_dead_worker(admission, user_id: str):
+    holder = await admission.acquire_user(user_id)
+    waiter = asyncio.create_task(admission.acquire_user(user_id))
+    await asyncio.sleep(0.1)
+    # The holder's worker dies: its lease expires and nothing releases it
+    await admission.redis.delete(f"admission:lease:{holder}")
+    token = await asyncio.wait_for(waiter, 1)
+    await admission.release_user(user_id, token)
+
+
+async def check_inflight_limit(admission):
+    admission.max_inflight = 3
+    slots = [await admission.acquire_slot() for _ in range(3)]
+    try:
+        await admission.acquire_slot()
+        fail("a turn beyond CHAT_MAX_INFLIGHT was admitted")
+    except AdmissionRejected:
+        pass
+    for slot in slots:
+        await admission.release_slot(slot)
+    admission.max_inflight = 1000
+
+
+async def turns_per_second(admission, users: int, turns: int) -> float:
+    async def user(user_id: str):
+        for _ in range(turns // users):
+            token = await admission.acquire_user(user_id)
+            slot = await admission.acquire_slot()
+            await admission.release_slot(slot)
+            await admission.release_user(user_id, token)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(user(f"bench-{users}-{i}") for i in range(users)))
+    return turns // users * users / (time.perf_counter() - start)
+
+
+async def run(turns: int, redis_port: int):
+    server = fake_redis.start(redis_port)
+    redis_url = f"redis://127.0.0.1:{redis_port}/0"
+    print("=" * 72)
+    print(f"Dr. HealBot - chat admission ({turns} turns, queue depth {QUEUE_DEPTH})")
+    print("=" * 72)
+    try:
+        print(f"{'backend':<10} {'1 user (turns/s)':>18} {'32 users (turns/s)':>20}")
+        for backend in ("memory", "redis"):
+            admission = make_admission(backend, redis_url)
+            await check_arrival_order(admission, f"{backend}-order")
+            await check_queue_depth(admission, f"{backend}-depth")
+            await check_wait_timeout(admission, f"{backend}-timeout")
+            if backend == "redis":
+                await check_dead_worker(admission, f"{backend}-dead")
+            await check_inflight_limit(admission)
+
+            single = await turns_per_second(admission, 1, turns)
+            many = await turns_per_second(admission, 32, turns)
+            print(f"{backend:<10} {single:>18,.0f} {many:>20,.0f}")
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check and benchmark chat admission backends")
+    parser.add_argument("--turns", type=int, default=2000)
+    parser.add_argument("--redis-port", type=int, default=6391)
+    args = parser.parse_args()
+
+    asyncio.run(run(args.turns, args.redis_port))
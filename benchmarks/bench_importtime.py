@@ -0,0 +1,102 @@
+"""
+Import-Time Profile
+Measures how long `import backend` takes in a fresh interpreter using
+`python -X importtime`, and lists the slowest top-level imports. Heavy SDKs
+(google.generativeai, firebase_admin, speech_recognition, gtts)
+are loaded lazily by the warm-up task and should not appear here; if one
+does, something imports it at module level again.
+
+--budget-ms makes the script exit non-zero when the median import time is
+over budget, so it can guard cold start in CI.
+
+Usage:
+    python benchmarks/bench_importtime.py --runs 5 --top 15
+    python benchmarks/bench_importtime.py --budget-ms 1500
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+LAZY_MODULES = ["google.generativeai", "firebase_admin", "speech_recognition", "gtts"]
+
+
+def profile_import(module: str) -> dict:
+    """Return {module name: (self us, cumulative us)} for `module` and its direct imports"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT_DIR,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+
+    # Children are printed before their parent; collect depth-1 lines until
+    # the depth-0 line of `module` (other depth-0 lines are interpreter startup)
+    timings = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        if depth == 1:
+            timings[name.strip()] = (int(self_us), int(cumulative_us))
+        elif depth == 0:
+            if name.strip() == module:
+                timings[module] = (int(self_us), int(cumulative_us))
+                return timings
+            timings = {}
+    raise RuntimeError(f"{module} not found in -X importtime output")
+
+
+def check_loaded(modules: list) -> list:
+    """Which of `modules` are in sys.modules after `import backend`"""
+    code = f"import sys, backend; print(' '.join(m for m in {modules!r} if m in sys.modules))"
+    result = subprocess.run([sys.executable, "-c", code], cwd=ROOT_DIR, capture_output=True, text=True)
+    return result.stdout.split()
+
+
+def run(runs: int, top: int, budget_ms: float):
+    print("=" * 60)
+    print(f"Dr. HealBot - import time of backend.py ({runs} runs)")
+    print("=" * 60)
+
+    profiles = [profile_import("backend") for _ in range(runs)]
+    totals = [profile["backend"][1] / 1000 for profile in profiles]
+    median_total = statistics.median(totals)
+    print(f"import backend: median {median_total:.0f} ms (min {min(totals):.0f}, max {max(totals):.0f})\n")
+
+    # Direct imports of backend.py, by median cumulative time
+    direct = {}
+    for profile in profiles:
+        for name, (_, cumulative_us) in profile.items():
+            if name != "backend":
+                direct.setdefault(name, []).append(cumulative_us / 1000)
+    ranked = sorted(direct.items(), key=lambda item: statistics.median(item[1]), reverse=True)
+    print(f"{'module':<40} {'cumulative (ms)':>16}")
+    for name, samples in ranked[:top]:
+        print(f"{name:<40} {statistics.median(samples):>16.1f}")
+
+    loaded = check_loaded(LAZY_MODULES)
+    eager = [name for name in LAZY_MODULES if name in loaded]
+    if eager:
+        print(f"\n⚠️  Imported eagerly (expected lazy): {', '.join(eager)}")
+
+    if budget_ms and median_total > budget_ms:
+        print(f"\n❌ Over budget: {median_total:.0f} ms > {budget_ms:.0f} ms")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Profile the import time of backend.py")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--budget-ms", type=float, default=0, help="fail if the median import time exceeds this")
+    args = parser.parse_args()
+
+    run(args.runs, args.top, args.budget_ms)
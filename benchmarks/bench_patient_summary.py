@@ -0,0 +1,195 @@
+"""
+Patient Summary Renderer Benchmark
+Times the patient summary renderer on the sample patients in
+data/patient_data/*.json, against the renderer it replaced (string
+concatenation, plus markdown.markdown() for HTML), and checks that both
+produce the same Markdown.
+
+The compiled renderer emits Markdown and HTML in one pass, so its timings
+cover both formats. "compiled" renders the raw fixture (the scan kept for
+documents saved before lab normalization); "normalized" renders it as
+POST /patient-data stores it, reading the precomputed abnormal_labs index.
+The legacy HTML column needs the markdown package; it is skipped when that
+isn't installed.
+
+Usage:
+    python benchmarks/bench_patient_summary.py --iterations 20000
+"""
+
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from backend import generate_patient_summary, normalize_lab_results, patient_summary_renderer
+
+try:
+    import markdown
+except ImportError:
+    markdown = None
+
+
+def legacy_patient_summary(patient_data: dict) -> str:
+    """The string-concatenating renderer that PATIENT_SUMMARY_SCHEMA replaced, kept verbatim"""
+    if not patient_data:
+        return ""
+    
+    summary = "\n🏥 **PATIENT MEDICAL PROFILE**\n"
+    
+    # Patient Profile Section
+    if "patient_profile" in patient_data:
+        profile = patient_data["patient_profile"]
+        
+        # Critical Medical Info
+        if "critical_medical_info" in profile:
+            cmi = profile["critical_medical_info"]
+            summary += "\n📌 **Critical Medical Information:**\n"
+            summary += f"- Major Conditions: {cmi.get('major_conditions', 'None')}\n"
+            summary += f"- Current Medications: {cmi.get('current_medications', 'None')}\n"
+            summary += f"- Allergies: {cmi.get('allergies', 'None')}\n"
+            if cmi.get('past_surgeries_or_treatments') and cmi['past_surgeries_or_treatments'] != 'None':
+                summary += f"- Past Surgeries: {cmi.get('past_surgeries_or_treatments')}\n"
+        
+        # Vital Risk Factors
+        if "vital_risk_factors" in profile:
+            vrf = profile["vital_risk_factors"]
+            summary += "\n⚠️ **Risk Factors:**\n"
+            if vrf.get('smoking_status') and 'smok' in vrf['smoking_status'].lower():
+                summary += f"- Smoking: {vrf.get('smoking_status')}\n"
+            if vrf.get('blood_pressure_issue') and vrf['blood_pressure_issue'] != 'No':
+                summary += f"- Blood Pressure: {vrf.get('blood_pressure_issue')}\n"
+            if vrf.get('cholesterol_issue') and vrf['cholesterol_issue'] != 'No':
+                summary += f"- Cholesterol: {vrf.get('cholesterol_issue')}\n"
+            if vrf.get('diabetes_status') and 'diabetes' in vrf['diabetes_status'].lower():
+                summary += f"- Diabetes: {vrf.get('diabetes_status')}\n"
+            if vrf.get('family_history_major_disease'):
+                summary += f"- Family History: {vrf.get('family_history_major_disease')}\n"
+        
+        # Organ Health Summary
+        if "organ_health_summary" in profile:
+            ohs = profile["organ_health_summary"]
+            issues = []
+            if ohs.get('heart_health') and 'normal' not in ohs['heart_health'].lower():
+                issues.append(f"Heart: {ohs['heart_health']}")
+            if ohs.get('kidney_health') and 'no' not in ohs['kidney_health'].lower():
+                issues.append(f"Kidney: {ohs['kidney_health']}")
+            if ohs.get('liver_health') and 'normal' not in ohs['liver_health'].lower() and 'no' not in ohs['liver_health'].lower():
+                issues.append(f"Liver: {ohs['liver_health']}")
+            if ohs.get('gut_health') and 'normal' not in ohs['gut_health'].lower():
+                issues.append(f"Gut: {ohs['gut_health']}")
+            
+            if issues:
+                summary += "\n🫀 **Organ Health Concerns:**\n"
+                for issue in issues:
+                    summary += f"- {issue}\n"
+        
+        # Mental & Sleep Health
+        if "mental_sleep_health" in profile:
+            msh = profile["mental_sleep_health"]
+            summary += "\n🧠 **Mental & Sleep Health:**\n"
+            summary += f"- Mental Status: {msh.get('mental_health_status', 'Not specified')}\n"
+            if msh.get('mental_conditions'):
+                summary += f"- Mental Conditions: {msh.get('mental_conditions')}\n"
+            summary += f"- Sleep: {msh.get('sleep_hours', 'Not specified')} per night"
+            if msh.get('sleep_problems'):
+                summary += f" ({msh.get('sleep_problems')})\n"
+            else:
+                summary += "\n"
+        
+        # Lifestyle
+        if "lifestyle" in profile:
+            ls = profile["lifestyle"]
+            summary += "\n🏃 **Lifestyle:**\n"
+            summary += f"- Activity: {ls.get('physical_activity_level', 'Not specified')}\n"
+            summary += f"- Diet: {ls.get('diet_type', 'Not specified')}\n"
+    
+    # Lab Test Results Section
+    if "lab_test_results" in patient_data:
+        lab_results = patient_data["lab_test_results"]
+        abnormal_results = []
+        
+        # Check each test category for abnormal results
+        for test_category, tests in lab_results.items():
+            if isinstance(tests, dict):
+                for test_name, result in tests.items():
+                    if result and isinstance(result, str):
+                        result_lower = result.lower()
+                        if any(word in result_lower for word in ['high', 'low', 'elevated', 'borderline']):
+                            abnormal_results.append(f"{test_name.replace('_', ' ').title()}: {result}")
+        
+        if abnormal_results:
+            summary += "\n🔬 **Key Lab Results (Abnormal):**\n"
+            for result in abnormal_results[:10]:
+                summary += f"- {result}\n"
+    
+    # Health Goals
+    if "patient_profile" in patient_data and "primary_health_goals" in patient_data["patient_profile"]:
+        goals = patient_data["patient_profile"]["primary_health_goals"]
+        summary += f"\n🎯 **Health Goals:** {goals}\n"
+    
+    return summary
+
+
+def time_per_call(func, patient: dict, iterations: int) -> float:
+    """Microseconds per call"""
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func(patient)
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def run(iterations: int):
+    print("=" * 72)
+    print(f"Dr. HealBot - patient summary rendering ({iterations} iterations)")
+    print("=" * 72)
+
+    # null means not tested: stored as such, never indexed as abnormal
+    labs, abnormal_labs, abnormal_index = normalize_lab_results({"kidney": {"creatinine": None}})
+    if labs != {"kidney": {"creatinine": {"status": "not_tested"}}} or abnormal_labs or abnormal_index:
+        print(f"❌ null lab result normalized to {labs}, index {abnormal_index}")
+        sys.exit(1)
+
+    paths = sorted(glob.glob(os.path.join(ROOT_DIR, "data", "patient_data", "*.json")))
+    print(f"{'patient':<12} {'legacy md (us)':>15} {'legacy html (us)':>17} {'compiled (us)':>14} "
+          f"{'normalized (us)':>16} {'speedup':>8}")
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            patient = json.load(f)
+        name = os.path.splitext(os.path.basename(path))[0]
+
+        labs, abnormal_labs, abnormal_index = normalize_lab_results(patient["lab_test_results"])
+        normalized = dict(patient, lab_test_results=labs, abnormal_labs=abnormal_labs, abnormal_index=abnormal_index)
+        for variant in (patient, normalized):
+            if generate_patient_summary(variant) != legacy_patient_summary(patient):
+                print(f"❌ {name}: Markdown differs from the legacy renderer")
+                sys.exit(1)
+
+        legacy_md = time_per_call(legacy_patient_summary, patient, iterations)
+        legacy_html = None
+        if markdown is not None:
+            legacy_html = time_per_call(
+                lambda data: markdown.markdown(legacy_patient_summary(data)), patient, max(1, iterations // 20)
+            )
+        compiled = time_per_call(patient_summary_renderer, patient, iterations)
+        indexed = time_per_call(patient_summary_renderer, normalized, iterations)
+        # Legacy cost of producing both formats vs one pass over a stored document
+        baseline = legacy_md + (legacy_html if legacy_html is not None else legacy_md)
+        print(
+            f"{name:<12} {legacy_md:>15.1f} {legacy_html if legacy_html is not None else float('nan'):>17.1f} "
+            f"{compiled:>14.1f} {indexed:>16.1f} {baseline / indexed:>7.1f}x"
+        )
+
+    print("\n✅ Markdown output identical to the legacy renderer")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the patient summary renderer")
+    parser.add_argument("--iterations", type=int, default=20000)
+    args = parser.parse_args()
+
+    run(args.iterations)
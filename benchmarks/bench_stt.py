@@ -0,0 +1,80 @@
+"""
+STT Backend Benchmark
+Measures model load time and real-time factor (RTF = processing time / audio
+duration) for each STT backend in backend.py on sample WAV files. RTF below
+1.0 means the engine transcribes faster than real time.
+
+Runs in-process with the same .env as the server (backend.py is imported).
+
+Usage:
+    STT_BACKEND=google python benchmarks/bench_stt.py --backends google vosk sphinx samples/*.wav
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import speech_recognition as sr
+
+from backend import STT_BACKENDS, init_speech, read_audio_data
+
+
+def load_samples(paths: list) -> list:
+    samples = []
+    for path in paths:
+        with open(path, "rb") as f:
+            audio = read_audio_data(f.read())
+        duration = len(audio.frame_data) / (audio.sample_rate * audio.sample_width)
+        samples.append((os.path.basename(path), audio, duration))
+    return samples
+
+
+def bench_backend(name: str, samples: list, language: str, repeats: int):
+    backend = STT_BACKENDS[name]()
+    start = time.perf_counter()
+    try:
+        backend.load()
+    except Exception as e:
+        print(f"{name:>8}  unavailable: {e}")
+        return
+    load_time = time.perf_counter() - start
+
+    total_audio = 0.0
+    total_time = 0.0
+    for sample_name, audio, duration in samples:
+        sample_time = 0.0
+        for _ in range(repeats):
+            start = time.perf_counter()
+            try:
+                transcript = backend.transcribe(audio, language)
+            except sr.UnknownValueError:
+                transcript = "<unintelligible>"
+            except sr.RequestError as e:
+                transcript = f"<error: {e}>"
+            sample_time += time.perf_counter() - start
+        total_audio += duration * repeats
+        total_time += sample_time
+        rtf = sample_time / (duration * repeats)
+        print(f"{name:>8}  {sample_name:<24} {duration:>6.2f}s  RTF {rtf:>6.3f}  {transcript[:40]!r}")
+
+    print(f"{name:>8}  load {load_time:.2f}s, overall RTF {total_time / total_audio:.3f}\n")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare real-time factor of STT backends")
+    parser.add_argument("wavs", nargs="+", help="WAV/AIFF/FLAC sample files")
+    parser.add_argument("--backends", nargs="+", default=list(STT_BACKENDS))
+    parser.add_argument("--language", default="en-US")
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    print("=" * 72)
+    print("Dr. HealBot - STT backend real-time factor")
+    print("=" * 72)
+    init_speech()
+    samples = load_samples(args.wavs)
+    for name in args.backends:
+        bench_backend(name, samples, args.language, args.repeats)
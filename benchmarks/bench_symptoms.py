@@ -0,0 +1,135 @@
+"""
+Symptom Extraction Benchmark
+Times the symptom extractor on the patient turns of consultations.json
+against the keyword loop it replaced, and against a substring loop over the
+same vocabulary (what growing the old keyword list would have cost).
+
+A second table runs the extractor over synthetic vocabularies of increasing
+size and over longer messages: one compiled regex pass should slow down
+only slightly as terms are added and scale linearly with the message length.
+
+Usage:
+    python benchmarks/bench_symptoms.py --iterations 200
+"""
+
+import argparse
+import json
+import os
+import random
+import string
+import sys
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+os.chdir(ROOT_DIR)
+
+from backend import SymptomExtractor, detect_symptoms, load_symptom_vocabularies, symptom_extractor
+
+LEGACY_KEYWORDS = ["fever", "cough", "headache", "ache", "pain", "rash", "vomit", "nausea"]
+
+# Messages the keyword loop got wrong
+ACCURACY_CASES = [
+    "I spent the weekend painting the fence",
+    "I have a headache",
+    "My brother Spain trip was fine",
+    "The rash on my arm is itchy and I feel feverish",
+    "Tengo fiebre y tos seca",
+]
+
+# (message, language, expected symptoms): English canonical names must not
+# match in the other languages
+LANGUAGE_CASES = [
+    ("Tengo headache y fiebre", "es", ["fever"]),
+    ("J'ai de la fever", "fr", []),
+    ("I have a headache", "en", ["headache"]),
+]
+
+
+def legacy_detect_symptoms(message: str) -> list:
+    text = message.lower()
+    return [word for word in LEGACY_KEYWORDS if word in text]
+
+
+def substring_detect(terms: list):
+    def detect(message: str) -> list:
+        text = message.lower()
+        return [term for term in terms if term in text]
+    return detect
+
+
+def throughput(func, messages: list, iterations: int):
+    """(messages per second, MB per second)"""
+    size = sum(len(m.encode("utf-8")) for m in messages)
+    start = time.perf_counter()
+    for _ in range(iterations):
+        for message in messages:
+            func(message)
+    elapsed = time.perf_counter() - start
+    return len(messages) * iterations / elapsed, size * iterations / elapsed / 1e6
+
+
+def synthetic_vocabulary(terms: int, seed: int = 7) -> dict:
+    rng = random.Random(seed)
+    symptoms = {}
+    for i in range(terms // 4):
+        words = ["".join(rng.choices(string.ascii_lowercase, k=rng.randint(4, 9))) for _ in range(5)]
+        symptoms[f"symptom {i}"] = [words[0], words[1], f"{words[2]} {words[3]}", words[4]]
+    return {"language": "xx", "symptoms": symptoms}
+
+
+def run(iterations: int):
+    print("=" * 72)
+    print(f"Dr. HealBot - symptom extraction ({iterations} iterations)")
+    print("=" * 72)
+
+    for message, language, expected in LANGUAGE_CASES:
+        found = detect_symptoms(message, language)
+        if found != expected:
+            print(f"❌ {message!r} ({language}) -> {found}, expected {expected}")
+            sys.exit(1)
+
+    with open(os.path.join(ROOT_DIR, "benchmarks", "consultations.json"), encoding="utf-8") as f:
+        messages = [turn for consultation in json.load(f) for turn in consultation["turns"]]
+    vocabularies = load_symptom_vocabularies()
+    all_terms = sorted(symptom_extractor("auto").terms)
+
+    print(f"\n{len(messages)} messages, vocabularies: "
+          + ", ".join(f"{language} ({len(symptom_extractor(language).terms)} terms)" for language in vocabularies))
+
+    print(f"\n{'method':<34} {'msgs/s':>12} {'MB/s':>8}")
+    for label, func in [
+        (f"legacy keyword loop ({len(LEGACY_KEYWORDS)} words)", legacy_detect_symptoms),
+        (f"substring loop ({len(all_terms)} terms)", substring_detect(all_terms)),
+        ("extractor en", lambda m: detect_symptoms(m, "en")),
+        ("extractor auto (all languages)", lambda m: detect_symptoms(m, "auto")),
+    ]:
+        per_second, mb = throughput(func, messages, iterations)
+        print(f"{label:<34} {per_second:>12,.0f} {mb:>8.2f}")
+
+    print(f"\n{'vocabulary':<12} {'compile (ms)':>13} {'1 KB msg MB/s':>14} {'64 KB msg MB/s':>15}")
+    filler = " ".join(messages)
+    short_text = (filler * 2)[:1024]
+    long_text = (filler * 200)[:65536]
+    for terms in (len(all_terms), 5000, 20000):
+        synthetic = [] if terms == len(all_terms) else [synthetic_vocabulary(terms)]
+        start = time.perf_counter()
+        extractor = SymptomExtractor([*vocabularies.values(), *synthetic])
+        label = f"{len(extractor.terms)}" + ("" if synthetic else " (real)")
+        compile_ms = (time.perf_counter() - start) * 1000
+        _, short_mb = throughput(extractor.extract, [short_text], iterations * 10)
+        _, long_mb = throughput(extractor.extract, [long_text], max(1, iterations // 5))
+        print(f"{label:<12} {compile_ms:>13.1f} {short_mb:>14.2f} {long_mb:>15.2f}")
+
+    print(f"\n{'message':<50} {'legacy':<22} extractor")
+    for message in ACCURACY_CASES:
+        print(f"{message[:48]:<50} {','.join(legacy_detect_symptoms(message)) or '-':<22} "
+              f"{','.join(detect_symptoms(message)) or '-'}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark symptom extraction")
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args()
+
+    run(args.iterations)
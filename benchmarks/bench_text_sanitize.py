@@ -0,0 +1,168 @@
+"""
+Text Sanitization Benchmark
+Times emoji and markdown removal on long chat replies: the remove_emojis it
+replaced (pattern compiled inside the call, no ZWJ/variation selector/tag
+handling), the precompiled remove_emojis applied to chat replies, and the
+single-pass speech_text applied to TTS input, against running the same
+cleanup as separate passes. EMOJI_CASES and SPEECH_CASES check replies the
+cleanup used to mangle, and the sentences /tts/stream would synthesize;
+PATHOLOGICAL_TEXTS must each be cleaned within PATHOLOGICAL_MAX_SECONDS.
+
+Replies are built from a markdown reply with emoji sequences (skin tones,
+ZWJ families, flags, keycaps) repeated to each size. The last column counts
+emoji components (ZWJ, variation selectors, modifiers, tags) each version
+leaves behind.
+
+Usage:
+    python benchmarks/bench_text_sanitize.py --iterations 200
+"""
+
+import argparse
+import os
+import re
+import sys
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from backend import remove_emojis, speech_text, split_sentences
+
+REPLY = """## 🩺 Assessment
+**Likely cause:** a *tension* headache 🤕, made worse by poor sleep 😴.
+
+### What you can do 👩🏽‍⚕️
+- Rest in a quiet, dark room 🛌
+- Drink water regularly 💧
+* Take paracetamol as directed on the pack 💊
+> If the pain is sudden and severe, call emergency services 🚑 1️⃣ 🇵🇰
+
+---
+1. Keep a headache diary 📓 for a week 👨‍👩‍👧
+2. See [your GP](https://www.nhs.uk) if it doesn't improve ❤️ __soon__.
+"""
+
+# Chat replies and remove_emojis output: spacing and (R)/(C)/TM survive
+EMOJI_CASES = [
+    ("Take Tylenol® or Advil® as directed.", "Take Tylenol® or Advil® as directed."),
+    ("Acme© and HealBot™ 2026", "Acme© and HealBot™ 2026"),
+    ("Feel better soon!😊 Take care", "Feel better soon! Take care"),
+    ("Rest 😴 and drink water 💧", "Rest and drink water "),
+    ("Call 1️⃣ now 🇵🇰!", "Call now !"),
+    ("Your nurse 👩🏽‍⚕️ will call", "Your nurse will call"),
+]
+
+# TTS input and the sentences /tts/stream should synthesize from it
+SPEECH_CASES = [
+    ("Take 2.5 mg twice daily. A temperature of 38.5 degrees is a mild fever.",
+     ["Take 2.5 mg twice daily.", "A temperature of 38.5 degrees is a mild fever."]),
+    ("**Feel better soon!**😊 Take Advil® with food 🍞.",
+     ["Feel better soon!", "Take Advil® with food ."]),
+    ("Take 2*3 tablets a day, *not* more.",
+     ["Take 2*3 tablets a day, not more."]),
+    ("**Important:** rest for 2 * 3 days. **Call us if",
+     ["Important: rest for 2 * 3 days.", "Call us if"]),
+    ("See *your **GP** soon* or read [the `NHS` page 🩺](https://www.nhs.uk).",
+     ["See your GP soon or read the NHS page ."]),
+]
+
+# Unclosed markup that made the link rule quadratic; longer than /tts accepts
+PATHOLOGICAL_TEXTS = ["[" * 40000, "[a" * 20000, "*a " * 13000, "**x" * 13000]
+PATHOLOGICAL_MAX_SECONDS = 0.5
+
+SIZES = [2 * 1024, 16 * 1024, 128 * 1024]
+
+COMPONENTS = re.compile("[\u200d\ufe0e\ufe0f\u20e3\U0001f3fb-\U0001f3ff\U000e0020-\U000e007f]")
+
+# The markdown cleanup of speech_text, one pass per rule: (pattern, replacement)
+MARKDOWN_PASSES = [
+    (re.compile(r"^[ \t]*(?:(?:-{3,}|\*{3,}|_{3,})[ \t]*$|#{1,6}[ \t]*|>[ \t]?|[-*+•][ \t]+)", re.MULTILINE), ""),
+    (re.compile(r"\[([^\[\]\n]{0,200})\]\([^)\n]{0,500}\)"), r"\1"),
+    (re.compile(r"(\*(?<![\w*]\*)\*{0,2}|_(?<![\w*]_)_)([^\s*][^\n]{0,300}?)(?<![\s*])\1(?![\w*])"), r"\2"),
+    (re.compile(r"\*{2,}|`+"), ""),
+]
+
+
+def legacy_remove_emojis(text: str) -> str:
+    """The remove_emojis that EMOJI_PATTERN replaced, kept verbatim"""
+    emoji_pattern = re.compile(
+        "["
+        "\U0001F600-\U0001F64F"  # emoticons
+        "\U0001F300-\U0001F5FF"  # symbols & pictographs
+        "\U0001F680-\U0001F6FF"  # transport & map symbols
+        "\U0001F1E0-\U0001F1FF"  # flags
+        "\U00002700-\U000027BF"  # Dingbats
+        "\U0001F900-\U0001F9FF"  # Supplemental Symbols and Pictographs
+        "\U00002600-\U000026FF"  # Misc symbols
+        "\U00002B00-\U00002BFF"  # Misc symbols & arrows
+        "]+", flags=re.UNICODE
+    )
+    return emoji_pattern.sub(r'', text)
+
+
+def multi_pass_speech_text(text: str) -> str:
+    text = remove_emojis(text)
+    for pattern, replacement in MARKDOWN_PASSES:
+        text = pattern.sub(replacement, text)
+    return text
+
+
+def time_per_call(func, text: str, iterations: int) -> float:
+    """Microseconds per call"""
+    func(text)
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func(text)
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def run(iterations: int):
+    print("=" * 72)
+    print(f"Dr. HealBot - text sanitization ({iterations} iterations)")
+    print("=" * 72)
+
+    if speech_text(REPLY) != multi_pass_speech_text(REPLY):
+        print("❌ speech_text differs from the multi-pass cleanup")
+        sys.exit(1)
+    for text, expected in EMOJI_CASES:
+        if remove_emojis(text) != expected:
+            print(f"❌ remove_emojis({text!r}) = {remove_emojis(text)!r}, expected {expected!r}")
+            sys.exit(1)
+    for text, expected in SPEECH_CASES:
+        sentences = split_sentences(speech_text(text), 1)
+        if sentences != expected:
+            print(f"❌ {text!r} was spoken as {sentences!r}")
+            sys.exit(1)
+    for text in PATHOLOGICAL_TEXTS:
+        seconds = time_per_call(speech_text, text, 1) / 1e6
+        if seconds > PATHOLOGICAL_MAX_SECONDS:
+            print(f"❌ speech_text({text[:6]!r} * ...) took {seconds:.2f}s")
+            sys.exit(1)
+
+    methods = [
+        ("legacy remove_emojis", legacy_remove_emojis),
+        ("remove_emojis", remove_emojis),
+        ("speech_text (1 pass)", speech_text),
+        ("emojis + markdown (5 passes)", multi_pass_speech_text),
+    ]
+    print(f"{'method':<30} " + " ".join(f"{f'{size // 1024} KB (us)':>13}" for size in SIZES)
+          + f" {'MB/s':>8} {'left over':>10}")
+    for label, func in methods:
+        timings = []
+        for size in SIZES:
+            text = (REPLY * (size // len(REPLY) + 1))[:size]
+            timings.append(time_per_call(func, text, max(1, iterations * SIZES[0] // size)))
+        left_over = len(COMPONENTS.findall(func(REPLY)))
+        mb_per_second = SIZES[-1] / timings[-1]
+        print(f"{label:<30} " + " ".join(f"{t:>13.1f}" for t in timings) + f" {mb_per_second:>8.1f} {left_over:>10}")
+
+    print("\nSpoken text:")
+    print(" ".join(speech_text(REPLY).split()))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark emoji and markdown removal")
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args()
+
+    run(args.iterations)
@@ -0,0 +1,72 @@
+"""
+TTS Output Format Benchmark
+Compares /tts latency and bytes served per request for each output format
+against a running backend (default: http://localhost:8000).
+
+Cold requests use a unique sentence each time so they miss the audio cache
+and measure synthesis + transcoding; warm requests repeat one sentence.
+
+Usage:
+    python benchmarks/bench_tts.py --formats mp3 opus wav --requests 10
+"""
+
+import argparse
+import statistics
+import time
+import uuid
+
+import httpx
+
+API_URL = "http://localhost:8000"
+
+SAMPLE_REPLY = (
+    "I'm sorry you're feeling unwell. How long have you had this headache, "
+    "and have you noticed anything that makes it better or worse?"
+)
+
+
+def percentile(values: list, pct: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def measure(client: httpx.Client, text: str, audio_format: str) -> tuple:
+    start = time.perf_counter()
+    response = client.post(f"{API_URL}/tts", json={"text": text, "language_code": "en", "format": audio_format})
+    response.raise_for_status()
+    return time.perf_counter() - start, len(response.content)
+
+
+def run(formats: list, requests: int):
+    print("=" * 72)
+    print(f"Dr. HealBot - /tts format benchmark against {API_URL}")
+    print("=" * 72)
+    print(f"{'format':>7} {'mode':>5} {'p50 (ms)':>9} {'p95 (ms)':>9} {'mean bytes':>11}")
+
+    with httpx.Client(timeout=120) as client:
+        for audio_format in formats:
+            warm_text = f"{SAMPLE_REPLY} Reference {uuid.uuid4().hex[:6]}."
+            cold = [measure(client, f"{SAMPLE_REPLY} Reference {uuid.uuid4().hex[:6]}.", audio_format)
+                    for _ in range(requests)]
+            measure(client, warm_text, audio_format)
+            warm = [measure(client, warm_text, audio_format) for _ in range(requests)]
+
+            for mode, samples in (("cold", cold), ("warm", warm)):
+                latencies = [latency for latency, _ in samples]
+                sizes = [size for _, size in samples]
+                print(
+                    f"{audio_format:>7} {mode:>5} {percentile(latencies, 50) * 1000:>9.1f} "
+                    f"{percentile(latencies, 95) * 1000:>9.1f} {statistics.mean(sizes):>11.0f}"
+                )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare /tts latency and payload size per output format")
+    parser.add_argument("--url", default=API_URL)
+    parser.add_argument("--formats", nargs="+", default=["mp3", "opus", "wav"])
+    parser.add_argument("--requests", type=int, default=10)
+    args = parser.parse_args()
+
+    API_URL = args.url.rstrip("/")
+    run(args.formats, args.requests)
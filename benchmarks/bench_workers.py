@@ -0,0 +1,127 @@
+"""
+Worker Scaling Benchmark
+Measures /chat requests/sec of the gunicorn profile (gunicorn.conf.py) at
+1, 2, 4 and 8 workers against local stand-ins, so the numbers reflect the
+server rather than upstream APIs:
+- Gemini: benchmarks/fake_gemini.py, started by this script
+- Storage: STORAGE_BACKEND=sqlite in a temporary file shared by the workers
+- Admission: ADMISSION_BACKEND=redis against benchmarks/fake_redis.py
+  (needs the fakeredis package)
+
+Each worker count gets a fresh gunicorn on --port and the same load from
+benchmarks/load_test.py. Run it on an otherwise idle machine; results depend
+on core count, so record them together with the output of `nproc`.
+
+Usage:
+    python benchmarks/bench_workers.py --workers 1 2 4 8 --users 32
+"""
+
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+import fake_redis
+import load_test
+
+
+def wait_until_up(url: str, timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(url, timeout=1).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    raise RuntimeError(f"{url} did not come up within {timeout:.0f}s")
+
+
+def start_fake_gemini(port: int, latency_ms: float) -> subprocess.Popen:
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(BENCH_DIR, "fake_gemini.py"), "--port", str(port), "--latency-ms", str(latency_ms)],
+        stdout=subprocess.DEVNULL,
+    )
+    wait_until_up(f"http://localhost:{port}/docs")
+    return process
+
+
+def start_server(workers: int, port: int, gemini_port: int, redis_port: int, sqlite_path: str) -> subprocess.Popen:
+    env = dict(
+        os.environ,
+        WEB_CONCURRENCY=str(workers),
+        PORT=str(port),
+        GEMINI_API_ENDPOINT=f"http://localhost:{gemini_port}",
+        GEMINI_API_KEY=os.getenv("GEMINI_API_KEY", "fake"),
+        STORAGE_BACKEND="sqlite",
+        SQLITE_PATH=sqlite_path,
+        ADMISSION_BACKEND="redis",
+        REDIS_URL=f"redis://127.0.0.1:{redis_port}/0",
+        # Measure raw throughput, not admission rejections
+        CHAT_MAX_INFLIGHT="100000",
+        LOG_LEVEL="warning",
+    )
+    process = subprocess.Popen(
+        ["gunicorn", "backend:app", "-c", "gunicorn.conf.py", "--access-logfile", "/dev/null"],
+        cwd=ROOT_DIR,
+        env=env,
+    )
+    wait_until_up(f"http://localhost:{port}/ping")
+    return process
+
+
+def main(worker_counts: list, users: int, turns: int, port: int, gemini_port: int, redis_port: int, latency_ms: float):
+    load_test.API_URL = f"http://localhost:{port}"
+    print("=" * 72)
+    print(f"Dr. HealBot - worker scaling, {users} users x {turns} turns, {os.cpu_count()} cores")
+    print("=" * 72)
+    print(f"{'workers':>8} {'reqs':>6} {'errors':>7} {'req/s':>8} {'p50 (s)':>8} {'max (s)':>8} {'scaling':>8}")
+
+    gemini = start_fake_gemini(gemini_port, latency_ms)
+    redis_server = fake_redis.start(redis_port)
+    baseline = None
+    try:
+        for workers in worker_counts:
+            sqlite_path = os.path.join(tempfile.mkdtemp(prefix="healbot-bench-"), "healbot.sqlite3")
+            server = start_server(workers, port, gemini_port, redis_port, sqlite_path)
+            try:
+                # One warm-up turn per worker count so model setup isn't measured
+                asyncio.run(load_test.run_level(1, 1))
+                result = asyncio.run(load_test.run_level(users, turns))
+            finally:
+                server.terminate()
+                server.wait()
+            if baseline is None:
+                baseline = result["throughput"] or 1.0
+            print(
+                f"{workers:>8} {result['requests']:>6} {result['errors']:>7} "
+                f"{result['throughput']:>8.2f} {result['p50']:>8.2f} {result['max']:>8.2f} "
+                f"{result['throughput'] / baseline:>7.2f}x"
+            )
+    finally:
+        gemini.terminate()
+        gemini.wait()
+        redis_server.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure /chat throughput at increasing gunicorn worker counts")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--users", type=int, default=32)
+    parser.add_argument("--turns", type=int, default=3)
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--gemini-port", type=int, default=8900)
+    parser.add_argument("--redis-port", type=int, default=6390)
+    parser.add_argument("--gemini-latency-ms", type=float, default=300)
+    args = parser.parse_args()
+
+    main(args.workers, args.users, args.turns, args.port, args.gemini_port, args.redis_port, args.gemini_latency_ms)
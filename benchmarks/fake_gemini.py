@@ -0,0 +1,167 @@
+"""
+Fake Gemini API Server
+Serves the subset of the Gemini REST API used by backend.py (generateContent,
+streamGenerateContent and cachedContents) with configurable latency and
+failure injection, so retries, hedging and the circuit breaker can be
+exercised without network access or an API key.
+
+Latency is lognormal around --latency-ms; --slow-rate of requests take
+--slow-ms extra (the tail that hedging targets) and --error-rate of requests
+fail with 503 (the failures that retries and the breaker handle).
+
+Usage:
+    python benchmarks/fake_gemini.py --port 8900 --latency-ms 300 --error-rate 0.05
+    GEMINI_API_ENDPOINT=http://localhost:8900 GEMINI_API_KEY=fake uvicorn backend:app
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import math
+import random
+import time
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+config = {
+    "latency_ms": 300.0,
+    "sigma": 0.4,
+    "slow_rate": 0.0,
+    "slow_ms": 3000.0,
+    "error_rate": 0.0,
+    "chunk_ms": 40.0,
+}
+
+REPLY = (
+    "I'm sorry you're not feeling well. Could you tell me when the symptoms started, "
+    "how severe they are on a scale of 1 to 10, and whether anything makes them better or worse?"
+)
+
+app = FastAPI(title="Fake Gemini API")
+cached_contents = {}
+cached_content_ids = itertools.count(1)
+
+
+def sample_latency() -> float:
+    seconds = random.lognormvariate(math.log(config["latency_ms"] / 1000), config["sigma"])
+    if random.random() < config["slow_rate"]:
+        seconds += config["slow_ms"] / 1000
+    return seconds
+
+
+def unavailable() -> JSONResponse:
+    return JSONResponse(
+        status_code=503,
+        content={"error": {"code": 503, "message": "The model is overloaded.", "status": "UNAVAILABLE"}},
+    )
+
+
+def prompt_tokens(body: dict) -> int:
+    text = json.dumps(body.get("contents", []))
+    return max(1, len(text) // 4)
+
+
+def candidate(text: str, finished: bool, tokens: int) -> dict:
+    result = {
+        "candidates": [{
+            "content": {"parts": [{"text": text}], "role": "model"},
+            "index": 0,
+        }],
+        "usageMetadata": {
+            "promptTokenCount": tokens,
+            "candidatesTokenCount": len(text) // 4,
+            "totalTokenCount": tokens + len(text) // 4,
+        },
+    }
+    if finished:
+        result["candidates"][0]["finishReason"] = "STOP"
+    return result
+
+
+@app.post("/v1beta/models/{model}:generateContent")
+async def generate_content(model: str, request: Request):
+    body = await request.json()
+    await asyncio.sleep(sample_latency())
+    if random.random() < config["error_rate"]:
+        return unavailable()
+    return candidate(REPLY, True, prompt_tokens(body))
+
+
+@app.post("/v1beta/models/{model}:streamGenerateContent")
+async def stream_generate_content(model: str, request: Request):
+    body = await request.json()
+    await asyncio.sleep(sample_latency())
+    if random.random() < config["error_rate"]:
+        return unavailable()
+
+    tokens = prompt_tokens(body)
+    words = REPLY.split(" ")
+    pieces = [" ".join(words[i:i + 6]) + " " for i in range(0, len(words), 6)]
+
+    async def chunks():
+        # The REST transport reads the stream as one JSON array
+        yield "["
+        for i, piece in enumerate(pieces):
+            if i:
+                await asyncio.sleep(config["chunk_ms"] / 1000)
+                yield ",\r\n"
+            yield json.dumps(candidate(piece, i == len(pieces) - 1, tokens))
+        yield "]"
+
+    return StreamingResponse(chunks(), media_type="application/json")
+
+
+@app.post("/v1beta/cachedContents")
+async def create_cached_content(request: Request):
+    body = await request.json()
+    name = f"cachedContents/fake-{next(cached_content_ids)}"
+    now = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+    cached_contents[name] = {
+        "name": name,
+        "model": body.get("model", ""),
+        "displayName": body.get("displayName", ""),
+        "createTime": now,
+        "updateTime": now,
+        "expireTime": now,
+        "usageMetadata": {"totalTokenCount": prompt_tokens(body)},
+    }
+    return cached_contents[name]
+
+
+@app.get("/v1beta/cachedContents/{cache_id}")
+async def get_cached_content(cache_id: str):
+    name = f"cachedContents/{cache_id}"
+    if name not in cached_contents:
+        return JSONResponse(status_code=404, content={"error": {"code": 404, "status": "NOT_FOUND"}})
+    return cached_contents[name]
+
+
+@app.delete("/v1beta/cachedContents/{cache_id}")
+async def delete_cached_content(cache_id: str):
+    if cached_contents.pop(f"cachedContents/{cache_id}", None) is None:
+        return JSONResponse(status_code=404, content={"error": {"code": 404, "status": "NOT_FOUND"}})
+    return {}
+
+
+@app.get("/v1beta/cachedContents")
+async def list_cached_contents():
+    return {"cachedContents": list(cached_contents.values())}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a fake Gemini API server with injected latency and errors")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency-ms", type=float, default=config["latency_ms"], help="median response latency")
+    parser.add_argument("--sigma", type=float, default=config["sigma"], help="lognormal spread of latency")
+    parser.add_argument("--slow-rate", type=float, default=config["slow_rate"], help="fraction of very slow responses")
+    parser.add_argument("--slow-ms", type=float, default=config["slow_ms"], help="extra latency of slow responses")
+    parser.add_argument("--error-rate", type=float, default=config["error_rate"], help="fraction of 503 responses")
+    parser.add_argument("--chunk-ms", type=float, default=config["chunk_ms"], help="gap between streamed chunks")
+    args = parser.parse_args()
+
+    config.update({key: value for key, value in vars(args).items() if key != "port"})
+    print(f"🤖 Fake Gemini API on http://localhost:{args.port} {config}")
+    uvicorn.run(app, host="0.0.0.0", port=args.port, log_level="warning")
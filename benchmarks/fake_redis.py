@@ -0,0 +1,64 @@
+"""
+Fake Redis Server
+Serves an in-memory Redis-compatible server (fakeredis) over TCP, so
+ADMISSION_BACKEND=redis and multi-worker gunicorn can run without a Redis
+installation. State is lost when the process exits.
+
+Requires the fakeredis package (pip install fakeredis).
+
+Usage:
+    python benchmarks/fake_redis.py --port 6390
+    ADMISSION_BACKEND=redis REDIS_URL=redis://localhost:6390/0 gunicorn backend:app -c gunicorn.conf.py
+"""
+
+import argparse
+import threading
+
+try:
+    from fakeredis import TcpFakeServer
+    from fakeredis._tcp_server import TCPFakeRequestHandler
+except ImportError:
+    raise RuntimeError("benchmarks/fake_redis.py requires the fakeredis package")
+
+
+class FakeRedisHandler(TCPFakeRequestHandler):
+    disable_nagle_algorithm = True
+
+    def handle(self):
+        while True:
+            data = self.reader.load()
+            if data is None:
+                return  # client closed the connection
+            try:
+                self.writer.dump(self.current_client.connection.execute_command(*data))
+            except Exception as e:
+                self.writer.dump(e)
+
+
+class FakeRedisServer(TcpFakeServer):
+    # Rebind straight after a previous run instead of waiting out TIME_WAIT,
+    # and accept a burst of pool connections without resetting them
+    allow_reuse_address = True
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, server_address):
+        super().__init__(server_address)
+        self.RequestHandlerClass = FakeRedisHandler
+
+
+def start(port: int, host: str = "127.0.0.1") -> FakeRedisServer:
+    """Serve on a background thread; call shutdown() on the result to stop"""
+    server = FakeRedisServer((host, port))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="In-memory Redis-compatible server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6390)
+    args = parser.parse_args()
+
+    print(f"Fake Redis listening on {args.host}:{args.port}")
+    FakeRedisServer((args.host, args.port)).serve_forever()
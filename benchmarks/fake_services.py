@@ -0,0 +1,141 @@
+"""
+Backend With Local Stand-ins
+Runs backend.py with its network dependencies replaced by local fakes with
+configurable latency, so benchmarks measure the server itself:
+- Gemini: point GEMINI_API_ENDPOINT at benchmarks/fake_gemini.py
+- Storage: SQLite in a temporary directory, with added per-call latency to
+  model a remote database
+- gTTS: returns silent MP3 frames sized to the text
+- STT: a fake engine with a configurable real-time factor
+
+Latencies are lognormal around the given median; a *-slow-rate fraction of
+calls take an extra *-slow-ms (the tail that p99 should reveal).
+
+Usage:
+    python benchmarks/fake_services.py --port 8000 --gemini-url http://localhost:8900 --storage-ms 5
+"""
+
+import argparse
+import asyncio
+import math
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# One MPEG-1 Layer III frame, 128 kbps / 44.1 kHz, all-zero payload (silence)
+SILENT_MP3_FRAME = b"\xff\xfb\x90\x64" + bytes(413)
+MP3_FRAME_SECONDS = 1152 / 44100
+SPEECH_CHARS_PER_SECOND = 15
+
+
+class Latency:
+    """Lognormal latency with an optional slow tail"""
+    def __init__(self, median_ms: float, sigma: float = 0.4, slow_rate: float = 0.0, slow_ms: float = 0.0):
+        self.median_ms = median_ms
+        self.sigma = sigma
+        self.slow_rate = slow_rate
+        self.slow_ms = slow_ms
+
+    def sample(self) -> float:
+        if self.median_ms <= 0:
+            return 0.0
+        seconds = random.lognormvariate(math.log(self.median_ms / 1000), self.sigma)
+        if random.random() < self.slow_rate:
+            seconds += self.slow_ms / 1000
+        return seconds
+
+
+class FakeGTTS:
+    """Drop-in for gtts.gTTS: sleeps like the Google endpoint, writes silent MP3"""
+    latency = Latency(150)
+
+    def __init__(self, text: str, lang: str = "en", **kwargs):
+        self.text = text
+
+    def write_to_fp(self, fp):
+        time.sleep(self.latency.sample())
+        seconds = max(1.0, len(self.text) / SPEECH_CHARS_PER_SECOND)
+        fp.write(SILENT_MP3_FRAME * int(seconds / MP3_FRAME_SECONDS))
+
+
+class FakeGTTSModule:
+    gTTS = FakeGTTS
+
+
+def make_fake_stt(backend, rtf: float, latency: Latency):
+    class FakeSTT(backend.STTBackend):
+        """Takes `rtf` x the audio duration plus a network-like delay"""
+        name = "fake"
+        transcript = "I have had a headache since yesterday"
+
+        def transcribe(self, audio, language: str) -> str:
+            duration = len(audio.frame_data) / (audio.sample_rate * audio.sample_width)
+            time.sleep(duration * rtf + latency.sample())
+            return self.transcript
+
+    return FakeSTT
+
+
+class LatencyStorage:
+    """Wraps a storage backend and delays every call, modelling a remote database"""
+    def __init__(self, inner, latency: Latency):
+        self.inner = inner
+        self.latency = latency
+        self.name = f"{inner.name}+latency"
+
+    def init(self):
+        self.inner.init()
+
+    def __getattr__(self, attr):
+        method = getattr(self.inner, attr)
+
+        async def delayed(*args, **kwargs):
+            await asyncio.sleep(self.latency.sample())
+            return await method(*args, **kwargs)
+
+        return delayed
+
+
+def build_app(args):
+    os.environ.setdefault("GEMINI_API_KEY", "fake")
+    os.environ["GEMINI_API_ENDPOINT"] = args.gemini_url
+    os.environ["STORAGE_BACKEND"] = "sqlite"
+    workdir = tempfile.mkdtemp(prefix="healbot-fake-")
+    os.environ["SQLITE_PATH"] = os.path.join(workdir, "healbot.sqlite3")
+    os.environ.setdefault("TTS_CACHE_DIR", os.path.join(workdir, "tts_cache"))
+    os.environ.setdefault("SCRATCH_DIR", os.path.join(workdir, "scratch"))
+
+    import backend
+
+    FakeGTTS.latency = Latency(args.tts_ms, args.sigma, args.tts_slow_rate, args.slow_ms)
+    backend.gtts = FakeGTTSModule
+    backend.stt_backend = make_fake_stt(backend, args.stt_rtf, Latency(args.stt_ms, args.sigma))()
+    backend.storage = LatencyStorage(
+        backend.storage,
+        Latency(args.storage_ms, args.sigma, args.storage_slow_rate, args.slow_ms),
+    )
+    return backend.app
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run backend.py against local fake services")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--gemini-url", default="http://localhost:8900")
+    parser.add_argument("--sigma", type=float, default=0.4, help="lognormal spread of all latencies")
+    parser.add_argument("--slow-ms", type=float, default=500, help="extra latency of slow-tail calls")
+    parser.add_argument("--storage-ms", type=float, default=5, help="median storage call latency")
+    parser.add_argument("--storage-slow-rate", type=float, default=0.0)
+    parser.add_argument("--tts-ms", type=float, default=150, help="median gTTS request latency")
+    parser.add_argument("--tts-slow-rate", type=float, default=0.0)
+    parser.add_argument("--stt-ms", type=float, default=100, help="median STT request latency")
+    parser.add_argument("--stt-rtf", type=float, default=0.1, help="STT processing time per second of audio")
+    args = parser.parse_args()
+
+    import uvicorn
+    app = build_app(args)
+    print(f"🧪 backend.py with fake services on http://localhost:{args.port}")
+    uvicorn.run(app, host="0.0.0.0", port=args.port, log_level="warning")
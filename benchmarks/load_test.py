@@ -0,0 +1,93 @@
+"""
+Concurrent Load Test
+Measures how /chat throughput scales with the number of concurrent users
+against a running backend (default: http://localhost:8000).
+
+Usage:
+    python benchmarks/load_test.py --users 1 2 4 8 16 --turns 3
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+
+API_URL = "http://localhost:8000"
+
+MESSAGES = [
+    "I have had a headache since yesterday morning.",
+    "It is about a 6 out of 10 and gets worse in the evening.",
+    "No, I have not taken any medication yet.",
+    "I also feel a little nauseous.",
+]
+
+
+async def simulate_user(client: httpx.AsyncClient, user_id: str, turns: int, latencies: list, errors: list):
+    """Run one patient's consultation sequentially, the way the UI does"""
+    for turn in range(turns):
+        start = time.perf_counter()
+        try:
+            response = await client.post(
+                f"{API_URL}/chat",
+                json={"message": MESSAGES[turn % len(MESSAGES)], "user_id": user_id, "language": "auto"},
+            )
+            response.raise_for_status()
+            latencies.append(time.perf_counter() - start)
+        except Exception as e:
+            errors.append(str(e))
+
+
+async def run_level(users: int, turns: int) -> dict:
+    latencies, errors = [], []
+    limits = httpx.Limits(max_connections=users, max_keepalive_connections=users)
+    async with httpx.AsyncClient(timeout=120, limits=limits) as client:
+        # Start from an empty history so every level does comparable work
+        await asyncio.gather(*[
+            client.delete(f"{API_URL}/chat-history/loadtest_{users}_{i}") for i in range(users)
+        ])
+        start = time.perf_counter()
+        await asyncio.gather(*[
+            simulate_user(client, f"loadtest_{users}_{i}", turns, latencies, errors) for i in range(users)
+        ])
+        elapsed = time.perf_counter() - start
+
+    return {
+        "users": users,
+        "requests": len(latencies),
+        "errors": len(errors),
+        "elapsed": elapsed,
+        "throughput": len(latencies) / elapsed if elapsed else 0.0,
+        "p50": statistics.median(latencies) if latencies else 0.0,
+        "max": max(latencies) if latencies else 0.0,
+    }
+
+
+async def main(levels: list, turns: int):
+    print("=" * 60)
+    print(f"Dr. HealBot - /chat load test against {API_URL}")
+    print("=" * 60)
+    print(f"{'users':>6} {'reqs':>6} {'errors':>7} {'req/s':>8} {'p50 (s)':>8} {'max (s)':>8} {'scaling':>8}")
+
+    baseline = None
+    for users in levels:
+        result = await run_level(users, turns)
+        if baseline is None:
+            baseline = result["throughput"] or 1.0
+        print(
+            f"{result['users']:>6} {result['requests']:>6} {result['errors']:>7} "
+            f"{result['throughput']:>8.2f} {result['p50']:>8.2f} {result['max']:>8.2f} "
+            f"{result['throughput'] / baseline:>7.2f}x"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure /chat throughput at increasing concurrency")
+    parser.add_argument("--url", default=API_URL)
+    parser.add_argument("--users", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    parser.add_argument("--turns", type=int, default=3)
+    args = parser.parse_args()
+
+    API_URL = args.url.rstrip("/")
+    asyncio.run(main(args.users, args.turns))
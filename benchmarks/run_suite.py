@@ -0,0 +1,286 @@
+"""
+Benchmark Suite
+Starts backend.py against local stand-ins (benchmarks/fake_gemini.py and
+benchmarks/fake_services.py), replays multi-turn consultations for the
+patients in data/patient_data/*.json, and reports p50/p95/p99 latency and
+throughput for /chat, /patient-summary, /tts and /stt.
+
+Each virtual user uploads one of the sample patients, runs one of the
+scripted consultations in benchmarks/consultations.json, then requests the
+patient summary, speech for the assistant's replies, and transcription of a
+short recording. Endpoints are measured in separate phases so one does not
+skew another.
+
+Results are written as JSON (commit, machine, configuration, per-endpoint
+statistics); pass an earlier file to --compare to see the change.
+
+Usage:
+    python benchmarks/run_suite.py --users 8
+    python benchmarks/run_suite.py --users 16 --gemini-latency-ms 800 --compare benchmarks/results/<old>.json
+"""
+
+import argparse
+import asyncio
+import glob
+import io
+import json
+import math
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import wave
+from datetime import datetime
+
+import httpx
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+
+ENDPOINTS = ["/chat", "/patient-summary", "/tts", "/stt"]
+
+
+def percentile(values: list, pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+
+def summarize(latencies: list, errors: int, elapsed: float) -> dict:
+    if not latencies:
+        return {"requests": 0, "errors": errors}
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput": round(len(latencies) / elapsed, 3),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "mean_ms": round(statistics.mean(latencies) * 1000, 2),
+        "max_ms": round(max(latencies) * 1000, 2),
+    }
+
+
+def sample_wav(seconds: float = 3.0, sample_rate: int = 16000) -> bytes:
+    """A short 440 Hz tone as 16-bit mono WAV"""
+    frames = bytearray()
+    for i in range(int(seconds * sample_rate)):
+        value = int(8000 * math.sin(2 * math.pi * 440 * i / sample_rate))
+        frames += value.to_bytes(2, "little", signed=True)
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(sample_rate)
+        f.writeframes(bytes(frames))
+    return buffer.getvalue()
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def wait_until_ready(url: str, timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(url, timeout=1).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.25)
+    raise RuntimeError(f"{url} was not ready within {timeout:.0f}s")
+
+
+def start_services(args) -> list:
+    gemini = subprocess.Popen([
+        sys.executable, os.path.join(BENCH_DIR, "fake_gemini.py"),
+        "--port", str(args.gemini_port),
+        "--latency-ms", str(args.gemini_latency_ms),
+        "--slow-rate", str(args.gemini_slow_rate),
+        "--error-rate", str(args.gemini_error_rate),
+    ], stdout=subprocess.DEVNULL)
+    server = subprocess.Popen([
+        sys.executable, os.path.join(BENCH_DIR, "fake_services.py"),
+        "--port", str(args.port),
+        "--gemini-url", f"http://localhost:{args.gemini_port}",
+        "--storage-ms", str(args.storage_ms),
+        "--tts-ms", str(args.tts_ms),
+        "--stt-ms", str(args.stt_ms),
+    ], stdout=subprocess.DEVNULL, cwd=ROOT_DIR)
+    processes = [gemini, server]
+    try:
+        wait_until_ready(f"http://localhost:{args.gemini_port}/docs")
+        wait_until_ready(f"http://localhost:{args.port}/ready")
+    except Exception:
+        stop_services(processes)
+        raise
+    return processes
+
+
+def stop_services(processes: list):
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        process.wait()
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = []
+        self.errors = 0
+
+    async def call(self, send):
+        start = time.perf_counter()
+        try:
+            response = await send()
+            response.raise_for_status()
+        except httpx.HTTPError:
+            self.errors += 1
+            return None
+        self.latencies.append(time.perf_counter() - start)
+        return response
+
+
+async def run_phase(name: str, users: list, worker) -> dict:
+    recorder = Recorder()
+    start = time.perf_counter()
+    await asyncio.gather(*[worker(user, recorder) for user in users])
+    result = summarize(recorder.latencies, recorder.errors, time.perf_counter() - start)
+    print(f"{name:<18} {result.get('requests', 0):>6} {result['errors']:>7} {result.get('throughput', 0):>8.2f} "
+          f"{result.get('p50_ms', 0):>9.1f} {result.get('p95_ms', 0):>9.1f} {result.get('p99_ms', 0):>9.1f}")
+    return result
+
+
+async def run_suite(args) -> dict:
+    api = f"http://localhost:{args.port}"
+    patients = sorted(glob.glob(os.path.join(ROOT_DIR, "data", "patient_data", "*.json")))
+    with open(os.path.join(BENCH_DIR, "consultations.json"), encoding="utf-8") as f:
+        consultations = json.load(f)
+    wav = sample_wav()
+
+    users = []
+    for i in range(args.users):
+        with open(patients[i % len(patients)], encoding="utf-8") as f:
+            patient = json.load(f)
+        users.append({
+            "user_id": f"bench_{i}_{os.path.splitext(os.path.basename(patients[i % len(patients)]))[0]}",
+            "patient": patient,
+            "turns": consultations[i % len(consultations)]["turns"][:args.turns],
+            "replies": [],
+        })
+
+    limits = httpx.Limits(max_connections=args.users * 2, max_keepalive_connections=args.users * 2)
+    async with httpx.AsyncClient(base_url=api, timeout=120, limits=limits) as client:
+        for user in users:
+            response = await client.post(f"/patient-data/{user['user_id']}", json=user["patient"])
+            response.raise_for_status()
+
+        async def chat(user, recorder):
+            for message in user["turns"]:
+                response = await recorder.call(lambda: client.post(
+                    "/chat", json={"message": message, "user_id": user["user_id"], "language": "auto"}
+                ))
+                if response is not None:
+                    user["replies"].append(response.json()["reply"])
+
+        async def patient_summary(user, recorder):
+            for i in range(args.requests):
+                summary_format = "html" if i % 2 else "markdown"
+                await recorder.call(lambda: client.get(
+                    f"/patient-summary/{user['user_id']}", params={"format": summary_format}
+                ))
+
+        async def tts(user, recorder):
+            replies = user["replies"] or ["How long have you had these symptoms?"]
+            for i in range(args.requests):
+                # A unique suffix so every request misses the audio cache
+                text = f"{replies[i % len(replies)]} Reference {user['user_id']} {i}."
+                await recorder.call(lambda: client.post("/tts", json={"text": text, "language_code": "en"}))
+
+        async def stt(user, recorder):
+            for _ in range(args.requests):
+                await recorder.call(lambda: client.post(
+                    "/stt", files={"file": ("sample.wav", wav, "audio/wav")}, data={"language": "en-US"}
+                ))
+
+        print(f"{'endpoint':<18} {'reqs':>6} {'errors':>7} {'req/s':>8} {'p50 (ms)':>9} {'p95 (ms)':>9} {'p99 (ms)':>9}")
+        results = {}
+        for name, worker in (("/chat", chat), ("/patient-summary", patient_summary), ("/tts", tts), ("/stt", stt)):
+            results[name] = await run_phase(name, users, worker)
+        return results
+
+
+def compare(results: dict, baseline_path: str):
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)
+    print(f"\nChange vs {baseline_path} (commit {baseline.get('commit')}):")
+    print(f"{'endpoint':<18} {'req/s':>9} {'p50':>9} {'p95':>9} {'p99':>9}")
+    for name in ENDPOINTS:
+        old, new = baseline["endpoints"].get(name), results.get(name)
+        if not old or not new or "p50_ms" not in old or "p50_ms" not in new:
+            continue
+        deltas = [
+            (new[key] - old[key]) / old[key] * 100 if old[key] else 0.0
+            for key in ("throughput", "p50_ms", "p95_ms", "p99_ms")
+        ]
+        print(f"{name:<18} " + " ".join(f"{delta:>+8.1f}%" for delta in deltas))
+
+
+def main(args):
+    print("=" * 72)
+    print(f"Dr. HealBot - benchmark suite, {args.users} users")
+    print("=" * 72)
+
+    processes = start_services(args)
+    try:
+        results = asyncio.run(run_suite(args))
+    finally:
+        stop_services(processes)
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "machine": {
+            "cpu_count": os.cpu_count(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+        },
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+        "endpoints": results,
+    }
+
+    output = args.output or os.path.join(
+        BENCH_DIR, "results", f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{report['commit']}.json"
+    )
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"\n✅ Results written to {output}")
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark backend.py endpoints against local fake services")
+    parser.add_argument("--users", type=int, default=8, help="concurrent virtual patients")
+    parser.add_argument("--turns", type=int, default=6, help="chat turns per consultation (max per script)")
+    parser.add_argument("--requests", type=int, default=5, help="per-user requests for summary/tts/stt")
+    parser.add_argument("--port", type=int, default=8200)
+    parser.add_argument("--gemini-port", type=int, default=8901)
+    parser.add_argument("--gemini-latency-ms", type=float, default=300)
+    parser.add_argument("--gemini-slow-rate", type=float, default=0.01)
+    parser.add_argument("--gemini-error-rate", type=float, default=0.0)
+    parser.add_argument("--storage-ms", type=float, default=5)
+    parser.add_argument("--tts-ms", type=float, default=150)
+    parser.add_argument("--stt-ms", type=float, default=100)
+    parser.add_argument("--output", help="result file (default: benchmarks/results/<time>-<commit>.json)")
+    parser.add_argument("--compare", help="earlier result file to compare against")
+    main(parser.parse_args())
@@ -0,0 +1,88 @@
+"""
+Gunicorn Configuration - multi-worker production profile
+Runs backend:app in uvicorn worker processes: one per CPU core when
+ADMISSION_BACKEND=redis, a single worker otherwise. Each worker creates its
+own Firestore/Gemini/speech clients in the FastAPI lifespan, so nothing is
+shared across the fork.
+
+Usage:
+    gunicorn backend:app -c gunicorn.conf.py
+    ADMISSION_BACKEND=redis WEB_CONCURRENCY=4 gunicorn backend:app -c gunicorn.conf.py
+
+State that is per worker process:
+- Admission control: per-user ordering only holds within one worker unless
+  ADMISSION_BACKEND=redis, so starting more than one worker without it is
+  refused.
+- In-process caches: a patient data write only invalidates the cache of the
+  worker that handled it, so the patient cache TTL is shortened below.
+- Thread pools and dependency limits: CPU-bound pools are divided between
+  workers so the machine isn't oversubscribed.
+The TTS audio cache, scratch space and SQLite storage live on disk and are
+shared safely (cache entries are written with atomic renames and every
+worker finds the others' entries on disk and counts them toward
+TTS_CACHE_MAX_MB, scratch files have unique names, SQLite runs in WAL mode).
+Prometheus metrics are written to PROMETHEUS_MULTIPROC_DIR by every worker,
+so /metrics reports the whole server whichever worker answers.
+"""
+
+import multiprocessing
+import os
+import shutil
+import tempfile
+
+cores = multiprocessing.cpu_count()
+shared_admission = os.getenv("ADMISSION_BACKEND", "memory") == "redis"
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv("WEB_CONCURRENCY", str(cores if shared_admission else 1)))
+if workers > 1 and not shared_admission:
+    raise RuntimeError(
+        f"WEB_CONCURRENCY={workers} needs ADMISSION_BACKEND=redis: with per-worker "
+        "admission, concurrent turns for one user on different workers lose messages"
+    )
+worker_class = "uvicorn.workers.UvicornWorker"
+
+# Streaming chat/TTS responses and WebSocket STT sessions can run for minutes
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "180"))
+graceful_timeout = 30
+keepalive = 5
+
+# Workers import the app after forking; see the module docstring
+preload_app = False
+
+accesslog = "-"
+errorlog = "-"
+loglevel = os.getenv("LOG_LEVEL", "info")
+
+# Workers inherit this environment, so these defaults apply per worker
+per_worker_cores = str(max(1, cores // workers))
+os.environ.setdefault("STT_WORKERS", per_worker_cores)
+os.environ.setdefault("FFMPEG_CONCURRENCY", per_worker_cores)
+if workers > 1:
+    os.environ.setdefault("PATIENT_CACHE_TTL", "5")
+    # Must be set before workers import prometheus_client; cleared on every
+    # start so counters from a previous run aren't reported again
+    metrics_dir = os.environ.setdefault(
+        "PROMETHEUS_MULTIPROC_DIR", os.path.join(tempfile.gettempdir(), "healbot-metrics")
+    )
+    shutil.rmtree(metrics_dir, ignore_errors=True)
+    os.makedirs(metrics_dir)
+
+multiprocess = None
+if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+    # Imported here, not in child_exit: that hook runs from the SIGCHLD
+    # handler, which re-enters a half-finished import when workers exit together
+    from prometheus_client import multiprocess
+
+
+def when_ready(server):
+    server.log.info(f"Dr. HealBot serving with {workers} workers on {cores} cores")
+
+
+def post_fork(server, worker):
+    server.log.info(f"Worker {worker.pid} started")
+
+
+def child_exit(server, worker):
+    if multiprocess:
+        multiprocess.mark_process_dead(worker.pid)
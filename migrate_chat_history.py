@@ -0,0 +1,39 @@
+"""
+Chat History Migration Script
+Moves every legacy chat_history document (one `messages` array per user) into
+the append-only layout (one document per message in the `messages`
+subcollection). Documents are also migrated lazily on first access, so this
+script is safe to run at any time and more than once.
+"""
+
+import asyncio
+
+from backend import FirestoreStorage
+
+
+async def migrate_all(storage: FirestoreStorage):
+    migrated = 0
+    skipped = 0
+    async for doc in storage.db.collection("chat_history").stream():
+        data = doc.to_dict() or {}
+        if "messages" not in data:
+            skipped += 1
+            continue
+        data = await storage.migrate_legacy_chat_history(doc.id, data)
+        migrated += 1
+        print(f"✅ Migrated {doc.id} ({data['message_count']} messages)")
+    return migrated, skipped
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("Dr. HealBot - Chat History Migration")
+    print("=" * 60)
+
+    storage = FirestoreStorage()
+    storage.init()
+    migrated, skipped = asyncio.run(migrate_all(storage))
+
+    print("\n" + "=" * 60)
+    print(f"✅ Migration complete: {migrated} migrated, {skipped} already up to date")
+    print("=" * 60)